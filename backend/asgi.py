@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# 默认部署方式是 WSGI（backend/wsgi.py）。ASGI 下只有 user/async_views.py、
+# team/async_views.py 中的接口是异步的，其余同步视图都经 sync_to_async 在同一个
+# 线程中串行执行，比 WSGI 的多线程 worker 更慢。只有这些异步接口占大部分流量时
+# 才用 ASGI 部署，并设置 DJANGO_ASYNC_VIEWS=1 启用异步视图（见 settings.ASYNC_VIEWS）
 
 application = get_asgi_application()
@@ -0,0 +1,86 @@
+# backend/asyncapi.py
+"""异步视图基类
+
+DRF 的 APIView 只能同步执行，一个请求从头到尾占住一个 worker。``AsyncAPIView``
+是 Django 原生的异步类视图，在 ASGI 下等待数据库和密码哈希时不占线程，
+同时保持与 APIView 相同的对外行为：
+
+- ``request.data``：JSON 或表单请求体；
+- 会话认证：已登录用户的非安全请求检查 CSRF（同 SessionAuthentication），
+  会话未登录时再识别 Bearer 令牌（同 user.auth.TokenAuthentication），
+  ``authenticate = False`` 时与 ``authentication_classes = []`` 一样视为匿名；
+- ``login_required``：对应全局默认的 IsAuthenticated，未登录返回 403；
+- 响应使用与 DRF JSONRenderer 相同的 JSON 编码。
+"""
+import json
+
+from django.contrib.auth.models import AnonymousUser
+from django.http import JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.exceptions import AuthenticationFailed, PermissionDenied
+from rest_framework.utils.encoders import JSONEncoder
+
+from user.auth import aauthenticate_token
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def json_response(data, status=200, headers=None):
+    """与 DRF JSONRenderer 输出相同字节的 JSON 响应"""
+    response = JsonResponse(
+        data, status=status, headers=headers, encoder=JSONEncoder, safe=False,
+        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')},
+    )
+    # 与 DRF 的 Response 一样保留响应体，供 backend/metrics.py 读取业务码
+    response.data = data
+    return response
+
+
+def parse_body(request):
+    if request.content_type == 'application/json':
+        return json.loads(request.body or b'{}')
+    return request.POST
+
+
+class AsyncAPIView(View):
+    authenticate = True
+    login_required = True
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # CSRF 由 dispatch 按 SessionAuthentication 的规则检查
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            request.data = parse_body(request)
+        except ValueError as e:
+            return json_response({'detail': f'JSON parse error - {e}'}, status=400)
+
+        request.auth = None
+        if self.authenticate:
+            request.user = await request.auser()
+            if request.user.is_authenticated and request.method not in SAFE_METHODS:
+                try:
+                    SessionAuthentication().enforce_csrf(request)
+                except PermissionDenied as e:
+                    return json_response({'detail': str(e.detail)}, status=403)
+            elif not request.user.is_authenticated:
+                try:
+                    authenticated = await aauthenticate_token(request)
+                except AuthenticationFailed as e:
+                    return json_response({'detail': str(e.detail)}, status=403)
+                if authenticated is not None:
+                    request.user, request.auth = authenticated
+        else:
+            request.user = AnonymousUser()
+
+        if self.login_required and not request.user.is_authenticated:
+            return json_response({'detail': 'Authentication credentials were not provided.'}, status=403)
+
+        handler = getattr(self, request.method.lower(), None)
+        if request.method.lower() not in self.http_method_names or handler is None:
+            return json_response({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+        return await handler(request, *args, **kwargs)
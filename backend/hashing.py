@@ -0,0 +1,188 @@
+# backend/hashing.py
+"""在独立的有界进程池中做密码哈希
+
+PBKDF2 一次要几十到上百毫秒的 CPU。放在请求线程里算，会占住 worker 和 GIL，
+注册、登录高峰时拖慢所有接口。这里把哈希和校验交给大小固定的进程池：
+
+- ``WORKERS`` 个子进程并行计算，请求线程只是等待结果，不再持有 GIL；
+- 正在计算和排队的任务合计不超过 ``WORKERS + QUEUE_DEPTH``，超出时立即抛出
+  ``HashingBusy``，由视图返回 50300，而不是让请求越堆越多；
+- ``stats()`` 记录排队等待时间和哈希耗时，用于观察认证负载。
+
+同步视图用 ``make_password``/``check_password``，异步视图用 ``amake_password``/
+``acheck_password``；需要按 Django 的规则升级旧哈希时用 ``check_user_password``。
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+class HashingBusy(Exception):
+    """哈希队列已满"""
+
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+
+_stats_lock = threading.Lock()
+_stats = {
+    'submitted': 0,
+    'rejected': 0,
+    'failed': 0,
+    'inflight': 0,
+    'queue_wait': {'count': 0, 'sum': 0.0, 'max': 0.0},
+    'hash_time': {'count': 0, 'sum': 0.0, 'max': 0.0},
+}
+
+
+def init_worker(settings_module):
+    # spawn 出来的子进程是全新的解释器，需要加载同一份配置（PASSWORD_HASHERS 等）
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def _run(func, args, submitted_at):
+    """在子进程中执行，返回结果、排队时间和计算时间（秒）"""
+    started_at = time.time()
+    start = time.perf_counter()
+    result = func(*args)
+    return result, started_at - submitted_at, time.perf_counter() - start
+
+
+def get_executor():
+    """进程池和并发名额，首次使用时创建"""
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            config = settings.PASSWORD_HASHING
+            # 不用 fork：请求进程里有其他线程持有的锁，fork 出的子进程可能死锁
+            _executor = ProcessPoolExecutor(
+                max_workers=config['WORKERS'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker,
+                initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'backend.settings'),),
+            )
+            _slots = threading.BoundedSemaphore(config['WORKERS'] + config['QUEUE_DEPTH'])
+        return _executor, _slots
+
+
+def reset(executor=None):
+    """关闭进程池，下次使用时按当前配置重建；传入 executor 时只在它仍是当前进程池时关闭"""
+    global _executor, _slots
+    with _lock:
+        if _executor is None or (executor is not None and executor is not _executor):
+            return
+        old, _executor, _slots = _executor, None, None
+    old.shutdown(wait=False, cancel_futures=True)
+
+
+@receiver(setting_changed)
+def _reset_on_setting_changed(setting, **kwargs):
+    if setting == 'PASSWORD_HASHING':
+        reset()
+
+
+def _observe(name, seconds):
+    summary = _stats[name]
+    summary['count'] += 1
+    summary['sum'] += seconds
+    summary['max'] = max(summary['max'], seconds)
+
+
+def _done(executor, slots, future):
+    slots.release()
+    with _stats_lock:
+        _stats['inflight'] -= 1
+        if future.cancelled() or future.exception() is not None:
+            _stats['failed'] += 1
+        else:
+            _, queue_wait, hash_time = future.result()
+            _observe('queue_wait', queue_wait)
+            _observe('hash_time', hash_time)
+    if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+        # 子进程异常退出后整个进程池不可用，丢弃后重建
+        reset(executor)
+
+
+def submit(func, *args):
+    """提交到进程池，返回结果为 (返回值, 排队时间, 计算时间) 的 Future；队列已满时抛出 HashingBusy"""
+    executor, slots = get_executor()
+    if not slots.acquire(blocking=False):
+        with _stats_lock:
+            _stats['rejected'] += 1
+        raise HashingBusy('系统繁忙，请稍后再试')
+    try:
+        future = executor.submit(_run, func, args, time.time())
+    except BaseException:
+        slots.release()
+        reset(executor)
+        raise
+    with _stats_lock:
+        _stats['submitted'] += 1
+        _stats['inflight'] += 1
+    future.add_done_callback(lambda f: _done(executor, slots, f))
+    return future
+
+
+def stats():
+    """submitted/rejected/failed-任务数，inflight-计算和排队中的任务数，
+    queue_wait/hash_time-排队等待和哈希耗时（秒）的次数、总和与最大值"""
+    with _stats_lock:
+        return {key: dict(value) if isinstance(value, dict) else value for key, value in _stats.items()}
+
+
+def make_password(password):
+    return submit(hashers.make_password, password).result()[0]
+
+
+def check_password(password, encoded):
+    """只校验，不升级哈希"""
+    return submit(hashers.check_password, password, encoded).result()[0]
+
+
+async def amake_password(password):
+    return (await asyncio.wrap_future(submit(hashers.make_password, password)))[0]
+
+
+async def acheck_password(password, encoded):
+    return (await asyncio.wrap_future(submit(hashers.check_password, password, encoded)))[0]
+
+
+def _must_update(encoded):
+    # 与 django.contrib.auth.hashers.check_password 判断是否需要重新哈希的规则相同
+    preferred = hashers.get_hasher('default')
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def check_user_password(user, password):
+    """同 User.check_password：校验通过且算法或迭代次数已过时，顺便用新哈希保存"""
+    if not check_password(password, user.password):
+        return False
+    if _must_update(user.password):
+        user.password = make_password(password)
+        user.save(update_fields=['password'])
+    return True
+
+
+async def acheck_user_password(user, password):
+    if not await acheck_password(password, user.password):
+        return False
+    if _must_update(user.password):
+        user.password = await amake_password(password)
+        await user.asave(update_fields=['password'])
+    return True
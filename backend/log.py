@@ -0,0 +1,204 @@
+# backend/log.py
+"""结构化日志：请求关联、按路由抽样、后台线程写出
+
+视图用标准 logging 记录，``%s`` 参数由日志系统在需要时才格式化：
+
+    logger = logging.getLogger(__name__)
+    logger.debug('标签搜索参数: %s', tag_list)
+
+- ``RequestLogMiddleware`` 为每个请求确定请求ID（沿用合法的 ``X-Request-ID``
+  请求头，否则新生成，并在响应头中返回）和路由，按 ``SAMPLING`` 中该路由的比例
+  决定这个请求的 DEBUG/INFO 日志是否保留；WARNING 及以上总是保留。决定在请求
+  开始时做一次，同一请求的日志要么都在要么都不在。
+- ``RequestContextFilter`` 把请求ID和路由加到每条日志上，ASGI 下 sync_to_async
+  线程中的日志也能关联到请求；``SamplingFilter`` 按上面的决定丢弃日志。
+- ``QueuedHandler`` 只把日志放进有界队列，由后台线程格式化并写出（默认标准输出），
+  请求线程不会因为写 stdout 相互阻塞。队列满时丢弃并计数（``stats()``），
+  不阻塞请求。参数都是不可变值（字符串、数字、None 及其元组）时消息在写出线程中
+  才格式化；含列表、字典、模型实例等可变对象时在记录时就格式化，否则写出前
+  请求线程修改了对象，日志内容会变。异常堆栈在记录时先转成文本，不持有调用栈。
+- ``JsonFormatter`` 每条日志输出一行 JSON，``extra`` 中的字段原样带上。
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+DEFAULTS = {
+    # 路由 -> 保留 DEBUG/INFO 日志的请求比例，未列出的路由用 DEFAULT
+    'SAMPLING': {},
+    'DEFAULT_SAMPLING': 1.0,
+}
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# 当前请求的 (请求ID, 路由, 是否保留低级别日志)
+_request = contextvars.ContextVar('log_request', default=None)
+
+# LogRecord 自带的属性，其余属性视为 extra 字段
+RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'REQUEST_LOGGING', {})}
+
+
+def current_request_id():
+    state = _request.get()
+    return state[0] if state else None
+
+
+class RequestLogMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def start(self, request):
+        request_id = request.headers.get(REQUEST_ID_HEADER, '')
+        if not REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+        request.request_id = request_id
+        return _request.set([request_id, None, True])
+
+    def finish(self, response, request, token):
+        _request.reset(token)
+        response[REQUEST_ID_HEADER] = request.request_id
+        return response
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = self.start(request)
+        return self.finish(self.get_response(request), request, token)
+
+    async def __acall__(self, request):
+        token = self.start(request)
+        return self.finish(await self.get_response(request), request, token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _request.get()
+        if state is not None:
+            config = get_config()
+            route = request.resolver_match.route
+            rate = config['SAMPLING'].get(route, config['DEFAULT_SAMPLING'])
+            state[1] = route
+            state[2] = rate >= 1 or random.random() < rate
+        return None
+
+
+class RequestContextFilter(logging.Filter):
+    def filter(self, record):
+        state = _request.get()
+        record.request_id, record.route = (state[0], state[1]) if state else (None, None)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        state = _request.get()
+        return state is None or state[2]
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+_stats_lock = threading.Lock()
+_stats = {'enqueued': 0, 'dropped': 0}
+
+
+# 这些类型的参数可以留到写出线程格式化
+IMMUTABLE_ARGS = (str, bytes, int, float, bool, type(None))
+
+
+def immutable(value):
+    if isinstance(value, tuple):
+        return all(immutable(item) for item in value)
+    return isinstance(value, IMMUTABLE_ARGS)
+
+
+class QueuedHandler(QueueHandler):
+    """把日志放进有界队列，由后台线程交给 handler（默认输出到标准输出）写出"""
+
+    def __init__(self, handler=None, max_size=10000):
+        super().__init__(queue.Queue(max_size))
+        if handler is None:
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(JsonFormatter())
+        self.handler = handler
+        self.listener = QueueListener(self.queue, handler, respect_handler_level=True)
+        self.listener.start()
+        # 退出时把队列中剩余的日志写完
+        atexit.register(self.stop)
+
+    def prepare(self, record):
+        # 不调用 QueueHandler.prepare：它会在请求线程中格式化消息。这里只复制记录，
+        # 参数都不可变时 msg 和 args 留给写出线程格式化，否则在这里按当前值格式化；
+        # 异常堆栈先转成文本，不持有栈帧
+        record = copy.copy(record)
+        if record.args and not immutable(record.args):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with _stats_lock:
+                _stats['dropped'] += 1
+            return
+        with _stats_lock:
+            _stats['enqueued'] += 1
+
+    def stop(self):
+        # QueueListener.stop 不能重复调用
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def close(self):
+        self.stop()
+        super().close()
+
+
+def stats():
+    """enqueued-放入队列的日志数，dropped-队列满时丢弃的日志数"""
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,258 @@
+# backend/metrics.py
+"""按路由统计请求指标，以 Prometheus 文本格式输出
+
+``MetricsMiddleware`` 为每个请求记录：
+
+- 延迟、SQL 查询数、SQL 耗时、响应大小的直方图，按 (路由, 方法) 分组；
+- 请求数，按 (路由, 方法, HTTP 状态码, 业务码) 分组。业务码取响应体中的
+  ``code``，这样 HTTP 200 里的 40000、40100 等失败也能区分出来。
+
+路由取 URL 模式（如 ``api/team/get``），不含参数，未匹配的请求归入
+``unmatched``，标签数有上限。SQL 通过每个数据库连接上的 execute wrapper 统计，
+归属由 ContextVar 确定，ASGI 下 sync_to_async 线程中执行的查询也计入发起的请求。
+
+每个请求只在结束时取一次锁更新计数，开销在微秒级，可以常开。指标保存在进程内，
+多 worker 部署时每个进程分别暴露，由 Prometheus 按实例抓取后聚合。
+
+``/internal/metrics`` 输出全部指标，以及密码哈希进程池、单飞重建、用户名布隆
+过滤器、各进程内缓存和日志队列的统计。配置了 ``TOKEN`` 时校验
+``Authorization: Bearer <TOKEN>``；未配置时只在 ``DEBUG`` 下允许 ``ALLOWED_IPS``
+中的地址访问，否则一律 404。部署在同机的反向代理之后，所有外部请求的
+``REMOTE_ADDR`` 都是 127.0.0.1，只看地址等于对外开放，生产环境必须配置 ``TOKEN``。
+"""
+import bisect
+import contextvars
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+DEFAULTS = {
+    'ENABLED': True,
+    'ALLOWED_IPS': ['127.0.0.1', '::1'],
+    'TOKEN': None,
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 当前请求的 [查询数, 查询耗时]，不在请求中时为 None
+_current = contextvars.ContextVar('metrics_request', default=None)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'METRICS', {})}
+
+
+def _observe_query(execute, sql, params, many, context):
+    counter = _current.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        counter[0] += 1
+        counter[1] += time.perf_counter() - start
+
+
+def install(connection):
+    if _observe_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_observe_query)
+
+
+@receiver(connection_created)
+def _install_on_connect(connection, **kwargs):
+    install(connection)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = {}
+            self.histograms = {}
+
+    def record(self, route, method, status, code, duration, queries, db_time, size):
+        key = (route, method)
+        with self._lock:
+            request_key = (route, method, status, code)
+            self.requests[request_key] = self.requests.get(request_key, 0) + 1
+            histograms = self.histograms.get(key)
+            if histograms is None:
+                histograms = self.histograms[key] = (
+                    Histogram(LATENCY_BUCKETS), Histogram(QUERY_BUCKETS),
+                    Histogram(LATENCY_BUCKETS), Histogram(SIZE_BUCKETS),
+                )
+            latency, query_count, query_time, response_size = histograms
+            latency.observe(duration)
+            query_count.observe(queries)
+            query_time.observe(db_time)
+            if size is not None:
+                response_size.observe(size)
+
+    def render(self):
+        with self._lock:
+            requests = dict(self.requests)
+            histograms = {key: [(h.buckets, list(h.counts), h.sum) for h in value]
+                          for key, value in self.histograms.items()}
+        lines = [
+            '# HELP http_requests_total 请求数（code 为响应体中的业务码）',
+            '# TYPE http_requests_total counter',
+        ]
+        for (route, method, status, code), count in sorted(requests.items()):
+            lines.append(f'http_requests_total{_labels(route=route, method=method, status=status, code=code)} {count}')
+        names = [
+            ('http_request_duration_seconds', '请求延迟'),
+            ('http_request_db_queries', '每个请求的 SQL 查询数'),
+            ('http_request_db_duration_seconds', '每个请求的 SQL 耗时'),
+            ('http_response_size_bytes', '响应体大小'),
+        ]
+        for index, (name, help_text) in enumerate(names):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+            for (route, method), value in sorted(histograms.items()):
+                buckets, counts, total = value[index]
+                cumulative = 0
+                for bound, count in zip([*buckets, '+Inf'], counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(route=route, method=method, le=bound)} {cumulative}')
+                lines.append(f'{name}_sum{_labels(route=route, method=method)} {total}')
+                lines.append(f'{name}_count{_labels(route=route, method=method)} {cumulative}')
+        return lines
+
+
+registry = Registry()
+
+
+def _labels(**labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def _response_code(response):
+    # DRF 的 Response 和 asyncapi.json_response 都在 data 上保留了响应体
+    data = getattr(response, 'data', None)
+    if isinstance(data, dict) and 'code' in data:
+        return str(data['code'])
+    return ''
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not get_config()['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # 启动前已经建立的连接（之后的连接由 connection_created 安装）
+        for connection in connections.all(initialized_only=True):
+            install(connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        counter = [0, 0.0]
+        token = _current.set(counter)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, time.perf_counter() - start, counter)
+        return response
+
+    async def __acall__(self, request):
+        counter = [0, 0.0]
+        token = _current.set(counter)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, time.perf_counter() - start, counter)
+        return response
+
+    def record(self, request, response, duration, counter):
+        match = request.resolver_match
+        route = match.route if match is not None else 'unmatched'
+        size = None if response.streaming else len(response.content)
+        registry.record(route, request.method, response.status_code, _response_code(response),
+                        duration, counter[0], counter[1], size)
+
+
+def component_stats():
+    """各组件自带的统计，抓取时才读取"""
+    from backend import hashing, log, singleflight
+    from backend.sessions import local_sessions
+    from user.bloom import username_index
+    from user.fragments import fragment_cache
+    from user.user_cache import user_cache
+
+    return {
+        'password_hashing': hashing.stats(),
+        'single_flight': singleflight.stats(),
+        'username_bloom': username_index.stats(),
+        'user_fragment_cache': fragment_cache.stats(),
+        'user_cache': user_cache.stats(),
+        'session_local_cache': local_sessions.stats(),
+        'logging': log.stats(),
+    }
+
+
+def _flatten(prefix, value):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _flatten(f'{prefix}_{key}', item)
+    elif isinstance(value, (int, float)):
+        yield prefix, value
+
+
+def render():
+    lines = registry.render()
+    for component, values in component_stats().items():
+        for name, value in _flatten(component, values):
+            lines += [f'# TYPE {name} gauge', f'{name} {float(value)}']
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    config = get_config()
+    if config['TOKEN']:
+        allowed = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {config["TOKEN"]}')
+    else:
+        allowed = settings.DEBUG and request.META.get('REMOTE_ADDR') in config['ALLOWED_IPS']
+    # 不对外暴露接口是否存在
+    if not allowed:
+        raise Http404
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,152 @@
+# backend/pagination.py
+"""游标（keyset）分页
+
+与 ``Paginator`` 的 LIMIT/OFFSET 不同，游标分页记住上一页最后一行的排序键，
+下一页直接从该位置继续扫描（``WHERE (createTime, id) < (?, ?)``），配合与排序
+一致的联合索引，每页的代价与页码无关，也不需要 ``COUNT(*)``。
+
+游标使用 ``django.core.signing`` 签名，对客户端是不透明的字符串。
+"""
+import datetime
+
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.db.models import F, Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _field(model, name):
+    """排序键对应的模型字段，注解字段返回 None"""
+    try:
+        return model._meta.get_field(name.lstrip('-'))
+    except FieldDoesNotExist:
+        return None
+
+
+def _dump(model, ordering, obj):
+    values = []
+    for name in ordering:
+        if isinstance(obj, dict):
+            # .values() 查询集返回的行
+            value = obj[name.lstrip('-')]
+        else:
+            field = _field(model, name)
+            value = getattr(obj, field.attname if field else name.lstrip('-'))
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            value = value.isoformat()
+        values.append(value)
+    return values
+
+
+def _load(model, ordering, values):
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise InvalidCursor('游标无效')
+    loaded = []
+    for name, value in zip(ordering, values):
+        field = _field(model, name)
+        if value is not None and isinstance(field, models.DateTimeField):
+            value = datetime.datetime.fromisoformat(value)
+        loaded.append(value)
+    return loaded
+
+
+def encode_cursor(model, ordering, obj, salt):
+    """根据一行记录生成指向它之后位置的游标"""
+    return signing.dumps(_dump(model, ordering, obj), salt=salt, compress=True)
+
+
+def decode_cursor(model, ordering, cursor, salt):
+    try:
+        values = signing.loads(cursor, salt=salt)
+    except signing.BadSignature:
+        raise InvalidCursor('游标无效')
+    return _load(model, ordering, values)
+
+
+def order_by(model, ordering):
+    """ordering 对应的排序表达式
+
+    可为空的字段统一按 NULL 最大处理（升序在后、降序在前），与 after() 一致：
+    如队伍的 expireTime 为 NULL 表示永不过期，"即将过期"排序时应排在最后。
+    """
+    expressions = []
+    for name in ordering:
+        field = _field(model, name)
+        if field is not None and field.null:
+            if name.startswith('-'):
+                expressions.append(F(name[1:]).desc(nulls_first=True))
+            else:
+                expressions.append(F(name).asc(nulls_last=True))
+        else:
+            expressions.append(name)
+    return expressions
+
+
+def after(model, ordering, values):
+    """按 ordering 排序时位于 values 之后的行
+
+    (a, b) 之后 = a 更靠后，或 a 相同且 b 更靠后。NULL 视为最大值。
+    """
+    query = None
+    for name, value in zip(reversed(ordering), reversed(values)):
+        desc = name.startswith('-')
+        name = name.lstrip('-')
+        field = _field(model, name)
+        nullable = field is not None and field.null
+        if value is None:
+            # 降序时 NULL 之后是同为 NULL 的后续行和所有非 NULL 行；升序时 NULL 排在最后
+            same = Q(**{f'{name}__isnull': True})
+            beyond = Q(**{f'{name}__isnull': False}) if desc else Q(pk__in=[])
+        else:
+            same = Q(**{name: value})
+            beyond = Q(**{f'{name}__{"lt" if desc else "gt"}': value})
+            if not desc and nullable:
+                beyond |= Q(**{f'{name}__isnull': True})
+        query = beyond if query is None else beyond | (same & query)
+
+    # 再给第一个排序键加一个可走索引的范围条件，数据库可以直接定位到起点
+    # 而不是从头扫描并逐行计算上面的 OR 条件
+    name, value = ordering[0], values[0]
+    desc = name.startswith('-')
+    name = name.lstrip('-')
+    if value is not None:
+        bound = Q(**{f'{name}__{"lte" if desc else "gte"}': value})
+        field = _field(model, name)
+        if not desc and field is not None and field.null:
+            bound |= Q(**{f'{name}__isnull': True})
+        query = bound & query
+    return query
+
+
+def page_size_param(value, default, maximum):
+    """请求参数中的每页条数，限制在 1..maximum 之间，未传时取 default
+
+    不是整数时抛出 ValueError。
+    """
+    if value is None or value == '':
+        return default
+    return max(1, min(int(value), maximum))
+
+
+def paginate(queryset, ordering, page_size, cursor=None, salt='cursor'):
+    """按游标取一页，返回 (记录列表, 下一页游标)
+
+    ordering 中最后一个字段必须唯一（通常是 id），否则同值的行可能被跳过；
+    也可以是查询集上的注解字段。queryset 可以是 .values() 查询集，此时 ordering
+    中的字段都要包含在返回的行里。没有下一页时游标为 None。
+    """
+    if page_size < 1:
+        raise ValueError('page_size 必须大于 0')
+    model = queryset.model
+    if cursor:
+        queryset = queryset.filter(after(model, ordering, decode_cursor(model, ordering, cursor, salt)))
+    records = list(queryset.order_by(*order_by(model, ordering))[:page_size + 1])
+    next_cursor = None
+    if len(records) > page_size:
+        records = records[:page_size]
+        next_cursor = encode_cursor(model, ordering, records[-1], salt)
+    return records, next_cursor
@@ -0,0 +1,285 @@
+# backend/profiling.py
+"""按需或抽样剖析请求，输出可直接画火焰图的折叠栈
+
+``ProfilingMiddleware`` 用一个后台线程定时（``INTERVAL``）读取
+``sys._current_frames()``，对正在被剖析的请求线程采样调用栈。以下三种情况会剖析：
+
+- 请求头 ``X-Profile`` 等于配置的 ``TOKEN``，响应头 ``X-Profile-Id`` 给出转储名；
+- 按 ``SAMPLE_RATE`` 随机抽样；
+- 请求耗时超过所在路由的阈值（``ROUTE_THRESHOLDS``，其余路由用 ``THRESHOLD``）。
+  请求开始时并不知道会不会慢，路由解析之后（``process_view``）有阈值的请求才
+  登记到采样线程，从请求达到阈值时开始采这个线程，记录的是超出阈值之后的时间
+  花在哪里；没有阈值的路由不登记，也不再记录 SQL，只多一次路由查表。
+
+每次剖析在 ``DIR`` 中写两个文件，最多保留 ``MAX_DUMPS`` 份，超出时删除最旧的：
+
+- ``<名称>.collapsed``：折叠栈，每行 ``帧;帧;...;帧 次数``，
+  可用 ``flamegraph.pl`` 或 speedscope 打开；
+- ``<名称>.json``：路由、方法、路径、耗时、触发方式、采样数和执行的 SQL（语句与耗时）。
+
+抽样和阈值触发的转储之间至少间隔 ``MIN_DUMP_INTERVAL`` 秒，过载时不会因写文件雪上加霜。
+采样按线程进行。ASGI 下一个请求在事件循环和线程池之间切换，事件循环线程又由
+多个请求共用，样本无法归属到请求，因此只剖析 WSGI 下的请求，ASGI 下直接放行。
+"""
+import contextvars
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils.crypto import constant_time_compare
+
+DEFAULTS = {
+    'ENABLED': True,
+    'TOKEN': None,
+    'SAMPLE_RATE': 0.0,
+    'THRESHOLD': None,
+    'ROUTE_THRESHOLDS': {},
+    'INTERVAL': 0.005,
+    'DIR': 'profiles',
+    'MAX_DUMPS': 50,
+    'MIN_DUMP_INTERVAL': 10.0,
+    # 每次剖析最多记录的 SQL 条数
+    'MAX_QUERIES': 500,
+}
+
+HEADER = 'X-Profile'
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'PROFILING', {})}
+
+
+class Profile:
+    """一个请求的剖析状态，sample_from 为 None 时不采样"""
+
+    __slots__ = ('thread_id', 'start', 'sample_from', 'trigger', 'stacks', 'samples', 'queries', 'max_queries')
+
+    def __init__(self, trigger, max_queries):
+        self.thread_id = threading.get_ident()
+        self.start = time.perf_counter()
+        self.trigger = trigger
+        self.sample_from = self.start if trigger else None
+        self.stacks = {}
+        self.samples = 0
+        self.queries = []
+        self.max_queries = max_queries
+
+
+_frame_names = {}
+
+
+def frame_name(frame):
+    """函数名和相对于 sys.path 的文件位置，按代码对象缓存"""
+    code = frame.f_code
+    name = _frame_names.get(code)
+    if name is None:
+        filename = code.co_filename
+        for path in sorted(sys.path, key=len, reverse=True):
+            if path and filename.startswith(path):
+                filename = filename[len(path):].lstrip(os.sep)
+                break
+        name = _frame_names[code] = f'{code.co_name} ({filename}:{code.co_firstlineno})'
+    return name
+
+
+def collapse(frame):
+    """从最外层到当前帧，以分号连接"""
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Sampler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def register(self, profile):
+        with self._lock:
+            self._active[profile.thread_id] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def unregister(self, profile):
+        with self._lock:
+            self._active.pop(profile.thread_id, None)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            interval = get_config()['INTERVAL']
+            while True:
+                time.sleep(interval)
+                # 在锁内采样：请求线程注销之后才读取结果，不会与这里同时改动
+                with self._lock:
+                    if not self._active:
+                        self._wakeup.clear()
+                        break
+                    now = time.perf_counter()
+                    due = [p for p in self._active.values() if p.sample_from is not None and now >= p.sample_from]
+                    if not due:
+                        continue
+                    frames = sys._current_frames()
+                    for profile in due:
+                        frame = frames.get(profile.thread_id)
+                        if frame is not None:
+                            stack = collapse(frame)
+                            profile.stacks[stack] = profile.stacks.get(stack, 0) + 1
+                            profile.samples += 1
+                    del frames, frame
+
+
+sampler = Sampler()
+
+# 当前线程正在剖析的请求
+_current = contextvars.ContextVar('profiling_request', default=None)
+
+
+def _capture_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if len(profile.queries) < profile.max_queries:
+            profile.queries.append({'sql': sql, 'time': round(time.perf_counter() - start, 6)})
+
+
+def install(connection):
+    if _capture_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_capture_query)
+
+
+@receiver(connection_created)
+def _install_on_connect(connection, **kwargs):
+    install(connection)
+
+
+_dump_lock = threading.Lock()
+_last_dump = 0.0
+
+
+def _slug(route):
+    return re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+
+
+def write_dump(profile, request, duration, config):
+    """写入一份转储并淘汰最旧的，返回转储名；抽样和阈值触发时距上次太近则跳过返回 None"""
+    global _last_dump
+    with _dump_lock:
+        now = time.monotonic()
+        if profile.trigger != 'header' and now - _last_dump < config['MIN_DUMP_INTERVAL']:
+            return None
+        _last_dump = now
+        match = request.resolver_match
+        route = match.route if match is not None else 'unmatched'
+        name = f'{time.time_ns()}-{_slug(route)}'
+        directory = config['DIR']
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f'{name}.collapsed'), 'w', encoding='utf-8') as f:
+            for stack, count in sorted(profile.stacks.items()):
+                f.write(f'{stack} {count}\n')
+        with open(os.path.join(directory, f'{name}.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'route': route,
+                'method': request.method,
+                'path': request.get_full_path(),
+                'duration': round(duration, 6),
+                'trigger': profile.trigger,
+                'interval': config['INTERVAL'],
+                'samples': profile.samples,
+                'queries': profile.queries,
+            }, f, ensure_ascii=False, indent=2)
+        dumps = sorted(entry for entry in os.listdir(directory) if entry.endswith('.json'))
+        for old in dumps[:max(0, len(dumps) - config['MAX_DUMPS'])]:
+            for suffix in ('.json', '.collapsed'):
+                try:
+                    os.remove(os.path.join(directory, old[:-len('.json')] + suffix))
+                except FileNotFoundError:
+                    pass
+        return name
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not get_config()['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):
+            install(connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.get_response(request)
+        config = get_config()
+        trigger = None
+        token = request.headers.get(HEADER)
+        if token and config['TOKEN'] and constant_time_compare(token, config['TOKEN']):
+            trigger = 'header'
+        elif config['SAMPLE_RATE'] and random.random() < config['SAMPLE_RATE']:
+            trigger = 'sample'
+        elif config['THRESHOLD'] is None and not config['ROUTE_THRESHOLDS']:
+            return self.get_response(request)
+
+        # 只可能按阈值剖析时先不登记到采样线程，等 process_view 确定路由的阈值
+        profile = Profile(trigger, config['MAX_QUERIES'])
+        request._profile = profile
+        if trigger:
+            sampler.register(profile)
+        token = _current.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+            if profile.sample_from is not None:
+                sampler.unregister(profile)
+        duration = time.perf_counter() - profile.start
+
+        if profile.trigger is None:
+            # 未解析到路由或路由没有阈值时 sample_from 为 None
+            if profile.sample_from is None or duration < profile.sample_from - profile.start:
+                return response
+            profile.trigger = 'threshold'
+        name = write_dump(profile, request, duration, config)
+        if name and profile.trigger == 'header':
+            response['X-Profile-Id'] = name
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # 路由解析之后才知道阈值，从请求开始计时
+        profile = getattr(request, '_profile', None)
+        if profile is None or profile.trigger is not None:
+            return None
+        config = get_config()
+        threshold = config['ROUTE_THRESHOLDS'].get(request.resolver_match.route, config['THRESHOLD'])
+        if threshold is None:
+            # 这个请求不会剖析：停止记录 SQL，__call__ 结束时恢复
+            _current.set(None)
+            return None
+        profile.sample_from = profile.start + threshold
+        sampler.register(profile)
+        return None
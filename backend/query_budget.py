@@ -0,0 +1,182 @@
+# backend/query_budget.py
+"""视图的查询预算和 N+1 检测（开发和测试环境）
+
+视图类用类属性声明一次请求最多执行的 SQL 条数，包括会话、认证等中间件中的查询，
+不含保存点等事务控制语句。预算按缓存全部未命中计（新进程、缓存被淘汰时的情况），
+命中会话、用户等缓存时实际查询更少：
+
+    class TeamListView(APIView):
+        query_budget = 2
+
+``QueryBudgetMiddleware`` 统计每个请求的查询，请求结束后检查两件事：
+
+- 查询数超过 ``query_budget``；
+- 同一形状的 SQL（参数已是占位符，``IN (%s, %s, ...)`` 视为同一形状）重复执行
+  ``N_PLUS_ONE`` 次及以上，通常是循环里逐行查询。报告中给出第二次执行时
+  项目代码中的调用位置（文件:行号）。确实需要重复执行的视图可以设置
+  ``query_repeat_limit`` 放宽。
+
+``ACTION`` 为 ``raise`` 时抛出 ``QueryBudgetExceeded``（视图自身的 try/except
+捕获不到，测试客户端会直接抛出），为 ``log`` 时只记日志。记录调用栈有开销，
+``ENABLED`` 默认跟随 DEBUG，生产环境不启用。
+"""
+import contextvars
+import logging
+import os
+import re
+import sys
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'ACTION': 'raise',
+    'N_PLUS_ONE': 3,
+}
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+# 事务控制语句不计入：测试中 atomic 以保存点实现，生产环境则不经过 cursor.execute
+SAVEPOINT = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+# 查询调用位置跳过这些目录中的帧
+_SKIP = tuple(os.path.dirname(module.__file__) + os.sep for module in (
+    sys.modules['django'], sys.modules['asgiref'],
+)) + (__file__,)
+
+_current = contextvars.ContextVar('query_budget_request', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'QUERY_BUDGET', {})}
+
+
+def shape(sql):
+    return IN_LIST.sub('IN (...)', sql)
+
+
+def call_site():
+    """最内层的项目代码帧"""
+    base = str(settings.BASE_DIR) + os.sep
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(base) and not filename.startswith(_SKIP) and 'site-packages' not in filename:
+            return f'{os.path.relpath(filename, base)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return 'unknown'
+
+
+class Tracker:
+    """一个请求中各形状 SQL 的执行次数和第二次执行的位置"""
+
+    def __init__(self):
+        self.count = 0
+        self.shapes = {}
+        self.sites = {}
+        self.budget = None
+        self.repeat_limit = None
+        self.view = None
+
+    def add(self, sql):
+        self.count += 1
+        key = shape(sql)
+        seen = self.shapes.get(key, 0) + 1
+        self.shapes[key] = seen
+        if seen == 2:
+            self.sites[key] = call_site()
+
+    def problems(self, default_repeat_limit):
+        found = []
+        if self.budget is not None and self.count > self.budget:
+            found.append(f'{self.view} 执行了 {self.count} 条查询，预算 {self.budget} 条')
+        limit = self.repeat_limit or default_repeat_limit
+        for key, seen in self.shapes.items():
+            if seen >= limit:
+                found.append(f'疑似 N+1：同一 SQL 执行了 {seen} 次，位置 {self.sites[key]}：{key}')
+        return found
+
+
+def _track_query(execute, sql, params, many, context):
+    tracker = _current.get()
+    if tracker is not None and not sql.startswith(SAVEPOINT):
+        tracker.add(sql)
+    return execute(sql, params, many, context)
+
+
+def install(connection):
+    if _track_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_track_query)
+
+
+@receiver(connection_created)
+def _install_on_connect(connection, **kwargs):
+    if get_config()['ENABLED']:
+        install(connection)
+
+
+class QueryBudgetMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not get_config()['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):
+            install(connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        tracker = Tracker()
+        token = _current.set(tracker)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.check(tracker)
+        return response
+
+    async def __acall__(self, request):
+        tracker = Tracker()
+        token = _current.set(tracker)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.check(tracker)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        tracker = _current.get()
+        view = getattr(view_func, 'view_class', None)
+        if tracker is not None and view is not None:
+            tracker.view = f'{view.__module__}.{view.__qualname__}'
+            tracker.budget = getattr(view, 'query_budget', None)
+            tracker.repeat_limit = getattr(view, 'query_repeat_limit', None)
+        return None
+
+    def check(self, tracker):
+        config = get_config()
+        problems = tracker.problems(config['N_PLUS_ONE'])
+        if not problems:
+            return
+        if config['ACTION'] == 'raise':
+            raise QueryBudgetExceeded('\n'.join(problems))
+        for problem in problems:
+            logger.warning(problem)
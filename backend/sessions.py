@@ -0,0 +1,86 @@
+# backend/sessions.py
+"""带进程内缓存层的会话存储（SESSION_ENGINE = 'backend.sessions'）
+
+在 Django 的 cached_db 之前再加一层进程内 LRU：
+
+    进程内（SESSION_LOCAL_CACHE['TTL'] 秒） -> 共享缓存（SESSION_CACHE_ALIAS） -> django_session 表
+
+读会话先查本进程，命中时既不访问缓存服务也不查库；写入和删除同时更新各层。
+其他进程删除的会话（退出登录），本进程最多还会认 ``TTL`` 秒，所以 TTL 要取得很短。
+
+中间一层必须是各进程共享的缓存（Redis 等）。SESSION_CACHE_ALIAS 是进程内缓存
+（开发环境的 LocMemCache）时去掉这一层，进程内 LRU 直接落到数据库：进程内缓存
+中的会话不会因为其他进程退出登录而删除，会一直有效到 SESSION_COOKIE_AGE。
+"""
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+
+from user.fragments import LRUCache
+
+# 会话 key -> (过期时间, 会话数据)
+local_sessions = LRUCache(settings.SESSION_LOCAL_CACHE['MAX_ENTRIES'])
+
+
+def _get_local(session_key):
+    entry = local_sessions.get_many([session_key]).get(session_key)
+    if entry is None or entry[0] <= time.monotonic():
+        return None
+    # 调用方会修改会话数据，返回副本
+    return dict(entry[1])
+
+
+def _set_local(session_key, data):
+    local_sessions.set_many({session_key: (time.monotonic() + settings.SESSION_LOCAL_CACHE['TTL'], dict(data))})
+
+
+# 只在本进程内可见的缓存后端
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def shared_cache_configured():
+    return settings.CACHES[settings.SESSION_CACHE_ALIAS]['BACKEND'] not in PROCESS_LOCAL_CACHES
+
+
+class SessionStore(CachedDBStore if shared_cache_configured() else DBStore):
+    def load(self):
+        if self.session_key is not None:
+            data = _get_local(self.session_key)
+            if data is not None:
+                return data
+        data = super().load()
+        # 不存在的会话 super().load() 会清掉 session_key，空会话不缓存
+        if data and self.session_key is not None:
+            _set_local(self.session_key, data)
+        return data
+
+    async def aload(self):
+        if self.session_key is not None:
+            data = _get_local(self.session_key)
+            if data is not None:
+                return data
+        data = await super().aload()
+        if data and self.session_key is not None:
+            _set_local(self.session_key, data)
+        return data
+
+    def save(self, must_create=False):
+        super().save(must_create)
+        _set_local(self.session_key, self._session)
+
+    async def asave(self, must_create=False):
+        await super().asave(must_create)
+        _set_local(self.session_key, self._session)
+
+    def delete(self, session_key=None):
+        local_sessions.delete(session_key or self.session_key)
+        super().delete(session_key)
+
+    async def adelete(self, session_key=None):
+        local_sessions.delete(session_key or self.session_key)
+        await super().adelete(session_key)
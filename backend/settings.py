@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -45,12 +48,21 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # 请求ID和日志抽样，最外层，其余中间件的日志也能关联到请求，见 backend/log.py
+    'backend.log.RequestLogMiddleware',
+    # 放在最外层，延迟包含其余中间件的耗时，见 backend/metrics.py
+    'backend.metrics.MetricsMiddleware',
+    # 按需、抽样或超过阈值时剖析请求，见 backend/profiling.py
+    'backend.profiling.ProfilingMiddleware',
+    # 开发和测试环境检查视图的查询预算和 N+1，见 backend/query_budget.py
+    'backend.query_budget.QueryBudgetMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # 替换 django.contrib.auth.middleware.AuthenticationMiddleware，先查进程内用户缓存
+    'user.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -132,6 +144,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
+        # 登录时签发的 Bearer 令牌，见 user/auth.py
+        'user.auth.TokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -167,4 +181,193 @@ CORS_ALLOW_HEADERS = [
     'x-requested-with',
 ]
 
-AUTH_USER_MODEL = 'user.User'
\ No newline at end of file
+AUTH_USER_MODEL = 'user.User'
+
+# 用户匹配（/api/user/match）
+USER_MATCH = {
+    # 综合相似度 = Σ 权重 × 相似度，可选 jaccard、cosine
+    'METRIC_WEIGHTS': {'jaccard': 1.0, 'cosine': 0.0},
+    # 标签权重：uniform-等权，idf-稀有标签权重更高
+    'TAG_WEIGHTING': 'uniform',
+    # 标签变化后匹配引擎的最小重建间隔（秒）
+    'REFRESH_INTERVAL': 10,
+    # 匹配引擎最长使用时间（秒）
+    'MAX_AGE': 300,
+    # exact-精确匹配，approx-MinHash/LSH 近似匹配（请求参数 mode 可覆盖）
+    'MODE': 'exact',
+    'LSH_NUM_PERM': 64,
+    'LSH_BANDS': 32,
+    # 近似模式默认探测的分段数，越大召回越高（请求参数 bands 可覆盖）
+    'LSH_PROBE_BANDS': None,
+    # 近似模式的候选集上限
+    'LSH_MAX_CANDIDATES': 5000,
+    # precompute_matches 为每个用户保存的匹配数
+    'PRECOMPUTE_TOP_K': 50,
+}
+
+# 缓存：队伍列表代数、单飞租约、标签数据版本号、会话都存放在这里，必须在所有
+# worker 之间共享，否则一个进程中的写入作废不了其他进程的缓存。多进程部署
+# 设置 DJANGO_REDIS_URL（如 redis://127.0.0.1:6379/0）；进程内缓存只适合单进程的开发环境
+REDIS_URL = os.environ.get('DJANGO_REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+elif DEBUG:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+else:
+    raise ImproperlyConfigured('生产环境（DEBUG=False）需要共享缓存，请设置 DJANGO_REDIS_URL')
+
+# 推荐用户游标分页返回的总数缓存时间（秒）
+USER_RECOMMEND_TOTAL_TTL = 60
+# 推荐用户游标分页每一页的缓存时间（秒）
+USER_RECOMMEND_CACHE_TTL = 30
+# 用户序列化片段缓存（进程内 LRU），见 user/fragments.py
+USER_FRAGMENT_CACHE = {
+    'MAX_ENTRIES': 10000,
+}
+
+# 队伍列表共享响应的最长缓存时间（秒），见 team/list_cache.py
+TEAM_LIST_CACHE_TTL = 60
+
+# 热点缓存单飞重建，见 backend/singleflight.py
+SINGLE_FLIGHT = {
+    # 过期后继续返回旧值的时间（秒），期间由一个请求负责重建
+    'STALE_TIMEOUT': 30,
+    # 概率提前刷新的系数，越大越早刷新，0 表示不提前
+    'BETA': 1.0,
+    # 跨进程重建租约的有效期（秒），应大于一次重建的耗时
+    'LEASE_TIMEOUT': 10,
+    # 没有旧值时等待其他进程重建的最长时间（秒），超时后自己重建
+    'WAIT_TIMEOUT': 5,
+    'POLL_INTERVAL': 0.05,
+}
+
+# 使用异步视图（user/async_views.py、team/async_views.py），只在 ASGI 部署时设置，见 asgi.py
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS') == '1'
+
+# 登录、注册时密码哈希使用的进程池，见 backend/hashing.py
+PASSWORD_HASHING = {
+    # 子进程数，不超过 CPU 核数
+    'WORKERS': 4,
+    # 进程都在忙时最多排队的任务数，再多直接返回 50300
+    'QUEUE_DEPTH': 64,
+}
+
+# 登录签发的签名令牌，见 user/auth.py
+USER_TOKEN = {
+    'ENABLED': True,
+    # 令牌有效期（秒）
+    'TTL': 7 * 24 * 3600,
+}
+
+# 认证用的进程内用户缓存，见 user/user_cache.py
+USER_CACHE = {
+    # 有效期（秒），也是其他进程上用户资料修改、令牌撤销生效的最长延迟
+    'TTL': 10,
+    'MAX_ENTRIES': 10000,
+}
+
+# 会话存储：进程内 -> 共享缓存 -> 数据库（没有共享缓存时为 进程内 -> 数据库），见 backend/sessions.py
+SESSION_ENGINE = 'backend.sessions'
+SESSION_LOCAL_CACHE = {
+    # 进程内缓存会话的时间（秒），也是其他进程退出登录后本进程仍认该会话的最长时间
+    'TTL': 5,
+    'MAX_ENTRIES': 10000,
+}
+
+# /api/user/account/exist 的用户名布隆过滤器，见 user/bloom.py
+USERNAME_BLOOM = {
+    'ENABLED': True,
+    # 目标误判率（需要查库确认的不存在用户名的比例）
+    'FALSE_POSITIVE_RATE': 0.01,
+    # 最小容量，实际取 max(MIN_CAPACITY, 2 * 用户数)
+    'MIN_CAPACITY': 100000,
+    # 补入其他进程新注册用户的间隔（秒）
+    'REFRESH_INTERVAL': 1.0,
+    # 补入时从已读到的最大ID往回重扫的ID数，覆盖晚于更大ID提交的注册和导入
+    'REFRESH_LOOKBACK': 1000,
+    # 全表重建的间隔（秒），兜底补上往回重扫也没覆盖到的用户
+    'REBUILD_INTERVAL': 3600.0,
+    # 快照文件，由 manage.py username_bloom --save 生成；None 表示启动时扫描 user 表
+    'SNAPSHOT': None,
+}
+
+# 请求指标和 /internal/metrics，见 backend/metrics.py
+METRICS = {
+    'ENABLED': True,
+    # 未设置 TOKEN 时允许抓取指标的地址，只在 DEBUG 下生效：
+    # 反向代理与应用同机时所有请求都来自 127.0.0.1，按地址放行等于对外开放
+    'ALLOWED_IPS': ['127.0.0.1', '::1'],
+    # 校验 Authorization: Bearer <TOKEN>，不再限制地址；非 DEBUG 环境不设置则指标接口不可用
+    'TOKEN': os.environ.get('DJANGO_METRICS_TOKEN'),
+}
+
+# 请求剖析，见 backend/profiling.py
+PROFILING = {
+    'ENABLED': True,
+    # 请求头 X-Profile 等于该值时剖析这个请求；None 表示不接受按需剖析
+    'TOKEN': os.environ.get('DJANGO_PROFILING_TOKEN'),
+    # 随机剖析的请求比例
+    'SAMPLE_RATE': 0.0,
+    # 耗时超过阈值（秒）的请求自动剖析；ROUTE_THRESHOLDS 按路由覆盖，THRESHOLD 为 None 时其余路由不剖析
+    'THRESHOLD': None,
+    'ROUTE_THRESHOLDS': {
+        'api/user/search/tags': 0.5,
+        'api/team/list': 0.5,
+    },
+    # 采样间隔（秒）
+    'INTERVAL': 0.005,
+    'DIR': BASE_DIR / 'profiles',
+    # 最多保留的转储份数
+    'MAX_DUMPS': 50,
+    # 抽样和阈值触发的两次转储之间的最短间隔（秒）
+    'MIN_DUMP_INTERVAL': 10.0,
+    'MAX_QUERIES': 500,
+}
+
+# 视图查询预算（视图类的 query_budget 属性）和 N+1 检测，见 backend/query_budget.py
+QUERY_BUDGET = {
+    'ENABLED': DEBUG,
+    # raise-抛出 QueryBudgetExceeded，log-只记日志
+    'ACTION': 'log',
+    # 同一形状的 SQL 在一个请求中执行这么多次视为 N+1
+    'N_PLUS_ONE': 3,
+}
+
+# 结构化日志：后台线程写出的 JSON 行，带请求ID和路由，见 backend/log.py
+LOG_LEVEL = os.environ.get('DJANGO_LOG_LEVEL', 'INFO')
+REQUEST_LOGGING = {
+    # 路由 -> 保留 DEBUG/INFO 日志的请求比例（WARNING 及以上总是保留）
+    'SAMPLING': {
+        'api/user/search/tags': 0.1,
+        'api/team/list': 0.1,
+    },
+    'DEFAULT_SAMPLING': 1.0,
+}
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_context': {'()': 'backend.log.RequestContextFilter'},
+        'sampling': {'()': 'backend.log.SamplingFilter'},
+    },
+    'handlers': {
+        'queue': {
+            '()': 'backend.log.QueuedHandler',
+            'max_size': 10000,
+            'filters': ['request_context', 'sampling'],
+        },
+    },
+    'loggers': {
+        name: {'handlers': ['queue'], 'level': LOG_LEVEL, 'propagate': False}
+        for name in ('backend', 'user', 'team')
+    },
+}
@@ -0,0 +1,179 @@
+# backend/singleflight.py
+"""防缓存击穿的单飞（single-flight）读取
+
+热点缓存项在高峰期过期时，所有 worker 会同时未命中、同时查库重建。
+``get_or_compute`` 保证同一个键同一时刻只有一个请求在重建：
+
+- 进程内：每个键一把锁，同一进程的其他线程等待它算完后直接读缓存；
+- 进程间：在缓存中 ``add`` 一个租约（lease），拿不到租约的进程轮询等待
+  持有者写回，持有者崩溃时等到 WAIT_TIMEOUT 后自己计算。这依赖缓存在进程间
+  共享（settings.CACHES，生产环境为 Redis）；开发环境的进程内缓存中，租约和
+  缓存项都只在本进程可见，单飞也只在进程内生效；
+- 过期后再保留 STALE_TIMEOUT 秒旧值（stale-while-revalidate）：抢到刷新权的
+  请求重新计算，其余请求直接返回旧值，不排队；
+- 概率提前刷新（XFetch）：越接近过期、重建越慢，越可能有某个请求提前刷新，
+  大多数情况下缓存项在真正过期前就已经更新。
+
+异步视图用 ``aget_or_compute``：新鲜命中直接 ``await cache.aget``，不占用线程；
+其余情况在线程池中执行同步版本（``thread_sensitive=False``），不经过所有请求
+共用的那一个同步线程，各请求的重建互不排队。
+"""
+import math
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+DEFAULTS = {
+    'STALE_TIMEOUT': 30,
+    'BETA': 1.0,
+    'LEASE_TIMEOUT': 10,
+    'WAIT_TIMEOUT': 5,
+    'POLL_INTERVAL': 0.05,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'SINGLE_FLIGHT', {})}
+
+
+class _KeyLocks:
+    """按键分配的进程内锁，没有线程使用时自动回收"""
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks = {}
+
+    @contextmanager
+    def hold(self, key, blocking=True):
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        acquired = entry[0].acquire(blocking)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                entry[0].release()
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+
+_key_locks = _KeyLocks()
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'stale': 0, 'misses': 0, 'computes': 0, 'waits': 0}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def stats():
+    """hits-新鲜命中，stale-返回旧值，misses-无值可用，computes-实际重建次数，waits-等待其他进程"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _should_refresh(entry, beta):
+    # XFetch：now - delta * beta * ln(rand) >= expiresAt 时提前刷新，rand 取 (0, 1]
+    return time.time() - entry['delta'] * beta * math.log(1.0 - random.random()) >= entry['expiresAt']
+
+
+def _acquire_lease(key, config):
+    token = uuid.uuid4().hex
+    if cache.add(f'{key}:lease', token, timeout=config['LEASE_TIMEOUT']):
+        return token
+    return None
+
+
+def _release_lease(key, token):
+    if cache.get(f'{key}:lease') == token:
+        cache.delete(f'{key}:lease')
+
+
+def _compute(key, compute, timeout, config):
+    _count('computes')
+    start = time.time()
+    value = compute()
+    now = time.time()
+    seconds = timeout(value) if callable(timeout) else timeout
+    cache.set(key, {
+        'value': value,
+        'expiresAt': now + seconds,
+        'delta': now - start,
+    }, timeout=seconds + config['STALE_TIMEOUT'])
+    return value
+
+
+def get_or_compute(key, compute, timeout):
+    """读取缓存，缺失或过期时单飞重建
+
+    compute() 生成值；timeout 为新鲜期秒数，也可以是 value -> 秒数 的函数。
+    值在新鲜期之后还会保留 STALE_TIMEOUT 秒作为旧值。
+    """
+    config = get_config()
+    entry = cache.get(key)
+    if entry is not None and not _should_refresh(entry, config['BETA']):
+        _count('hits')
+        return entry['value']
+
+    if entry is not None:
+        # 过期或提前刷新：抢到刷新权的请求重新计算，其余请求返回旧值
+        with _key_locks.hold(key, blocking=False) as acquired:
+            token = _acquire_lease(key, config) if acquired else None
+            if token:
+                try:
+                    return _compute(key, compute, timeout, config)
+                finally:
+                    _release_lease(key, token)
+        _count('stale')
+        return entry['value']
+
+    # 没有旧值可用：同进程的线程排队，其他进程等租约持有者写回
+    _count('misses')
+    with _key_locks.hold(key):
+        entry = cache.get(key)
+        if entry is not None:
+            return entry['value']
+        deadline = time.monotonic() + config['WAIT_TIMEOUT']
+        token = _acquire_lease(key, config)
+        while token is None and time.monotonic() < deadline:
+            _count('waits')
+            time.sleep(config['POLL_INTERVAL'])
+            entry = cache.get(key)
+            if entry is not None:
+                return entry['value']
+            token = _acquire_lease(key, config)
+        try:
+            return _compute(key, compute, timeout, config)
+        finally:
+            if token:
+                _release_lease(key, token)
+
+
+def _get_or_compute_in_thread(key, compute, timeout):
+    # 线程池中的线程不在请求周期内，按请求开始和结束的方式处理数据库连接
+    close_old_connections()
+    try:
+        return get_or_compute(key, compute, timeout)
+    finally:
+        close_old_connections()
+
+
+async def aget_or_compute(key, compute, timeout):
+    """get_or_compute 的异步版本，compute 和 timeout 仍是同步函数"""
+    entry = await cache.aget(key)
+    if entry is not None and not _should_refresh(entry, get_config()['BETA']):
+        _count('hits')
+        return entry['value']
+    return await sync_to_async(_get_or_compute_in_thread, thread_sensitive=False)(key, compute, timeout)
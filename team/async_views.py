@@ -0,0 +1,135 @@
+# team/async_views.py
+"""队伍接口的异步版本（ASGI 部署时启用，见 settings.ASYNC_VIEWS）
+
+与 views.py 中同名视图的请求、响应格式一致。
+"""
+import logging
+
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from backend.asyncapi import AsyncAPIView, json_response
+from backend.pagination import page_size_param
+from .list_cache import aget_or_build, etag
+from .models import Team, UserTeam
+from .serializers import TeamSerializer
+from .views import TEAM_LIST_MAX_PAGE_SIZE, TEAM_LIST_SORTS, TeamListView as SyncTeamListView
+
+logger = logging.getLogger(__name__)
+
+
+async def joined_team_ids(user):
+    """用户已加入（未退出）的队伍ID集合"""
+    if not user.is_authenticated:
+        return set()
+    return {team_id async for team_id in UserTeam.objects.filter(
+        userId=user,
+        isDelete=False
+    ).values_list('teamId', flat=True)}
+
+
+class TeamListView(AsyncAPIView):
+    query_budget = 4
+    async def get(self, request):
+        try:
+            # 获取请求参数
+            search_text = request.GET.get('searchText', '')
+            status = int(request.GET.get('status', 0))  # 0-公开，2-加密
+
+            # 排序方式：new-最新创建（默认），expire-即将过期，slots-空位最多，relevance-相关度
+            sort_by = request.GET.get('sortBy', 'new')
+            if sort_by not in TEAM_LIST_SORTS:
+                return json_response({
+                    'code': 40000,
+                    'date': [],
+                    'message': '排序方式错误'
+                })
+            if sort_by == 'relevance' and not search_text:
+                return json_response({
+                    'code': 40000,
+                    'date': [],
+                    'message': '按相关度排序需要输入搜索关键词'
+                })
+
+            # 传了pageSize或cursor时使用游标分页，否则返回全部（兼容旧版前端）
+            paged = 'pageSize' in request.GET or 'cursor' in request.GET
+            page_size = page_size_param(request.GET.get('pageSize'), 20, TEAM_LIST_MAX_PAGE_SIZE) if paged else None
+            cursor = request.GET.get('cursor')
+
+            # 共享部分命中缓存时不经过线程；重建（单飞、查库、序列化）复用同步实现
+            gen, entry = await aget_or_build(
+                [status, search_text, sort_by, paged, page_size, cursor],
+                lambda: SyncTeamListView().build(status, search_text, sort_by, paged, page_size, cursor),
+            )
+            tag = etag(gen, entry, request.user)
+            if tag in parse_etags(request.headers.get('If-None-Match', '')):
+                response = HttpResponseNotModified()
+                response['ETag'] = tag
+                return response
+
+            # 当前用户已加入的队伍，一次查询，叠加到共享的记录上
+            joined_ids = await joined_team_ids(request.user)
+            team_list = [
+                {**team_data, 'hasJoin': team_data['id'] in joined_ids}
+                for team_data in (entry['date']['records'] if paged else entry['date'])
+            ]
+
+            return json_response({
+                'code': 0,
+                'date': {'records': team_list, 'nextCursor': entry['date']['nextCursor']} if paged else team_list,
+                'message': '获取成功'
+            }, headers={'ETag': tag})
+
+        except Exception as e:
+            logger.exception('队伍列表查询失败')
+            return json_response({
+                'code': 40000,
+                'date': [],
+                'message': str(e)
+            })
+
+
+class TeamGetView(AsyncAPIView):
+    query_budget = 3
+    async def get(self, request):
+        try:
+            # 获取队伍ID
+            team_id = request.GET.get('id')
+            if not team_id:
+                return json_response({
+                    'code': 40000,
+                    'date': None,
+                    'message': '队伍不存在'
+                })
+
+            # 查询队伍，创建人一并取出（序列化时不能再触发同步查询）
+            try:
+                team = await Team.objects.select_related('userId').aget(id=team_id, isDelete=False)
+            except Team.DoesNotExist:
+                return json_response({
+                    'code': 40000,
+                    'date': None,
+                    'message': '队伍不存在'
+                })
+
+            # 检查权限（只有创建者可以查看完整信息）
+            if team.userId_id != request.user.id:
+                return json_response({
+                    'code': 40000,
+                    'date': None,
+                    'message': '无权限'
+                })
+
+            return json_response({
+                'code': 0,
+                'date': TeamSerializer(team).data,
+                'message': '获取成功'
+            })
+
+        except Exception as e:
+            logger.exception('查询队伍失败')
+            return json_response({
+                'code': 40000,
+                'date': None,
+                'message': str(e)
+            })
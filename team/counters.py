@@ -0,0 +1,60 @@
+# team/counters.py
+"""冗余计数器的校对
+
+Team.memberCount 和 User.joinTeamNum 在加入/退出/解散时原子增减，正常情况下不会偏离实际记录数；
+手工改库、批量导入或历史数据问题可能导致计数漂移，这里按实际的 UserTeam 记录
+批量重算并修正。
+"""
+from django.db import transaction
+from django.db.models import Count
+
+from user.models import User
+from .models import Team, UserTeam
+
+
+def repair_member_counts(batch_size=1000, dry_run=False):
+    """按ID分批重算队伍人数，返回被修正的队伍数
+
+    每批先锁住队伍行再统计：并发的加入/退出会在提交前等待这把锁，
+    之后在修正后的值上继续 F() 增减，不会被覆盖。
+    """
+    repaired = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            teams = list(Team.objects.select_for_update()
+                         .filter(id__gt=last_id).order_by('id')
+                         .values_list('id', 'memberCount')[:batch_size])
+            if not teams:
+                return repaired
+            last_id = teams[-1][0]
+            actual = dict(UserTeam.objects
+                          .filter(teamId__in=[team_id for team_id, _ in teams], isDelete=False)
+                          .values('teamId').annotate(n=Count('id')).values_list('teamId', 'n'))
+            drifted = [Team(id=team_id, memberCount=actual.get(team_id, 0))
+                       for team_id, count in teams if count != actual.get(team_id, 0)]
+            if drifted and not dry_run:
+                Team.objects.bulk_update(drifted, ['memberCount'])
+        repaired += len(drifted)
+
+
+def repair_join_team_nums(batch_size=1000, dry_run=False):
+    """按ID分批重算用户已加入的队伍数，返回被修正的用户数"""
+    repaired = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            users = list(User.objects.select_for_update()
+                         .filter(id__gt=last_id).order_by('id')
+                         .values_list('id', 'joinTeamNum')[:batch_size])
+            if not users:
+                return repaired
+            last_id = users[-1][0]
+            actual = dict(UserTeam.objects
+                          .filter(userId__in=[user_id for user_id, _ in users], isDelete=False)
+                          .values('userId').annotate(n=Count('id')).values_list('userId', 'n'))
+            drifted = [User(id=user_id, joinTeamNum=actual.get(user_id, 0))
+                       for user_id, count in users if count != actual.get(user_id, 0)]
+            if drifted and not dry_run:
+                User.objects.bulk_update(drifted, ['joinTeamNum'])
+        repaired += len(drifted)
@@ -0,0 +1,97 @@
+# team/list_cache.py
+"""队伍列表响应缓存
+
+``/api/team/list`` 被前端频繁轮询，绝大多数请求返回的内容相同。响应中所有用户
+共享的部分（队伍记录、下一页游标）按查询参数缓存，每个用户的 ``hasJoin``
+在取出后再叠加。
+
+缓存键包含一个代数（generation），创建、编辑、加入、退出、解散队伍时递增，
+旧代数的缓存不会再被读取，等过期淘汰即可。代数和缓存页都在共享缓存中
+（settings.CACHES，生产环境必须是 Redis 等跨进程共享的后端），任一 worker 中的
+写入对所有 worker 立即生效。代数在写入时立即递增一次、事务提交
+后再递增一次：提交前读到旧数据并写入新代数缓存的请求，会被第二次递增作废。
+
+队伍到达 expireTime 后会从列表中消失而没有任何写入，所以缓存的有效期不超过
+本页中最早的过期时间。其他绕过视图的修改（如创建人改名、批量导入）最多在
+TEAM_LIST_CACHE_TTL 秒后生效。读取和重建经过 backend/singleflight，过期后
+短时间内返回旧值，由一个请求负责重建；异步视图用 ``aget_or_build``。
+"""
+import hashlib
+import json
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from backend.singleflight import aget_or_compute, get_or_compute
+
+GENERATION_KEY = 'team:list:generation'
+
+
+def generation():
+    """当前队伍列表缓存代数"""
+    return cache.get(GENERATION_KEY, 0)
+
+
+def bump_generation():
+    cache.add(GENERATION_KEY, 0, timeout=None)
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        # 键在 add 和 incr 之间被淘汰
+        cache.set(GENERATION_KEY, 1, timeout=None)
+
+
+def invalidate_team_lists():
+    """队伍或成员关系变化后作废所有队伍列表缓存"""
+    bump_generation()
+    transaction.on_commit(bump_generation)
+
+
+def _digest(value):
+    data = json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.md5(data.encode('utf-8')).hexdigest()
+
+
+def _timeout(entry):
+    seconds = settings.TEAM_LIST_CACHE_TTL
+    if entry['validUntil'] is not None:
+        remaining = (entry['validUntil'] - timezone.now()).total_seconds()
+        seconds = max(1, min(seconds, math.ceil(remaining)))
+    return seconds
+
+
+def _entry(build):
+    def compute():
+        date, valid_until = build()
+        return {'date': date, 'digest': _digest(date), 'validUntil': valid_until}
+    return compute
+
+
+def get_or_build(params, build):
+    """取出 params 对应的共享响应，未命中或已过期时调用 build() 重新生成
+
+    build() 返回 (共享的响应数据, 有效期截止时间或 None)。
+    返回 (代数, 缓存项)，缓存项包含 date、digest、validUntil。
+    """
+    gen = generation()
+    # 高峰期过期时只有一个请求查库重建，其余返回旧值或等待
+    return gen, get_or_compute(f'team:list:{gen}:{_digest(params)}', _entry(build), _timeout)
+
+
+async def aget_or_build(params, build):
+    """get_or_build 的异步版本，build 仍是同步函数，在线程池中执行"""
+    gen = await cache.aget(GENERATION_KEY, 0)
+    return gen, await aget_or_compute(f'team:list:{gen}:{_digest(params)}', _entry(build), _timeout)
+
+
+def etag(gen, entry, user):
+    """响应的 ETag：共享部分的摘要 + 代数 + 用户
+
+    hasJoin 只随当前用户的加入/退出变化，而这些操作都会递增代数。
+    """
+    value = f'{gen}:{entry["digest"]}:{user.id or 0}'
+    return '"%s"' % hashlib.md5(value.encode('utf-8')).hexdigest()
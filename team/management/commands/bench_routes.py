@@ -0,0 +1,363 @@
+import datetime
+import json
+import math
+import random
+import statistics
+import subprocess
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import F
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from team.counters import repair_member_counts
+from team.list_cache import invalidate_team_lists
+from team.models import Team
+from team.search import rebuild_index
+from user.models import User
+from user.synthetic import tag_names
+
+BENCH_PREFIX = 'bench_routes_'
+
+# 登录和注册每次都要做一次 PBKDF2，单独限制请求数
+SLOW_ROUTES = {'user/login', 'user/register'}
+
+# 与基线对比的指标，True 表示越大越好
+METRICS = {'p50': False, 'p95': False, 'p99': False, 'throughput': True, 'queries': False}
+
+
+def percentile(values, p):
+    """最近秩法，values 已排序"""
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, max(0, math.ceil(p / 100 * len(values)) - 1))]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                               text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Recorder:
+    """一个线程的测量结果：每次计时请求的延迟、查询数和业务码"""
+
+    def __init__(self):
+        self.latency = []
+        self.queries = []
+        self.errors = 0
+
+    def timed(self, client, method, path, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            if method == 'get':
+                response = client.get(path, data)
+            else:
+                response = client.post(path, json.dumps(data), content_type='application/json')
+            elapsed = time.perf_counter() - start
+        self.latency.append(elapsed * 1000)
+        self.queries.append(len(queries))
+        if response.status_code >= 400 or (response.get('Content-Type', '').startswith('application/json')
+                                           and response.json().get('code', 0) != 0):
+            self.errors += 1
+        return response
+
+
+class Context:
+    """各场景共用的只读数据和线程自己的用户"""
+
+    def __init__(self, rng, user, password, synthetic_users, tags, public_teams):
+        self.rng = rng
+        self.user = user
+        self.password = password
+        self.synthetic_users = synthetic_users
+        self.tags = tags
+        self.public_teams = public_teams
+        self.team_id = None
+
+    def own_team(self, client):
+        """不计时地创建一个本线程用户的队伍，返回ID"""
+        response = client.post('/api/team/add', json.dumps(team_payload(self.rng)), content_type='application/json')
+        return (response.json()['date'] or {}).get('id')
+
+    def kept_team(self, client):
+        """本线程用户的一个常驻队伍，供只有创建者能访问的接口使用"""
+        if self.team_id is None:
+            self.team_id = self.own_team(client)
+        return self.team_id
+
+
+def team_payload(rng):
+    expire = timezone.now() + datetime.timedelta(days=rng.randint(1, 30))
+    return {'name': f'{BENCH_PREFIX}{uuid.uuid4().hex[:8]}', 'description': '压测队伍',
+            'expireTime': expire.isoformat(), 'maxNum': rng.randint(3, 10), 'password': '', 'status': 0}
+
+
+# 每个场景计时一次对应路由的请求；需要先决条件或事后复原的步骤不计时
+def user_login(rec, client, ctx):
+    rec.timed(client, 'post', '/api/user/login',
+              {'userAccount': ctx.rng.choice(ctx.synthetic_users), 'userPassword': ctx.password})
+
+
+def user_logout(rec, client, ctx):
+    client.force_login(ctx.user)
+    rec.timed(client, 'post', '/api/user/logout')
+    client.force_login(ctx.user)
+
+
+def user_register(rec, client, ctx):
+    account = f'{BENCH_PREFIX}{uuid.uuid4().hex[:12]}'
+    rec.timed(client, 'post', '/api/user/register',
+              {'userAccount': account, 'userPassword': '12345678', 'checkPassword': '12345678',
+               'username': account, 'phone': '13800000000', 'planetCode': ''})
+
+
+def user_account_exist(rec, client, ctx):
+    # 注册页输入时大多数用户名都不存在
+    account = ctx.rng.choice(ctx.synthetic_users) if ctx.rng.random() < 0.2 else f'free{uuid.uuid4().hex[:10]}'
+    rec.timed(client, 'post', '/api/user/account/exist', {'userAccount': account})
+
+
+def user_current(rec, client, ctx):
+    rec.timed(client, 'get', '/api/user/current')
+
+
+def user_recommend(rec, client, ctx):
+    rec.timed(client, 'get', '/api/user/recommend', {'pageSize': 20, 'pageNum': ctx.rng.randint(1, 5)})
+
+
+def user_match(rec, client, ctx):
+    rec.timed(client, 'get', '/api/user/match', {'num': 10})
+
+
+def user_update(rec, client, ctx):
+    rec.timed(client, 'post', '/api/user/update', {'id': ctx.user.id, 'profile': f'更新于 {time.time()}'})
+
+
+def user_search_tags(rec, client, ctx):
+    tags = ctx.rng.sample(ctx.tags[:20], ctx.rng.randint(1, 2))
+    rec.timed(client, 'get', '/api/user/search/tags',
+              {'tagNameList': tags, 'mode': ctx.rng.choice(['and', 'or']), 'pageSize': 20, 'pageNum': 1})
+
+
+def team_add(rec, client, ctx):
+    response = rec.timed(client, 'post', '/api/team/add', team_payload(ctx.rng))
+    team = response.json()['date']
+    if team:
+        # 解散以释放加入名额
+        client.post('/api/team/delete', json.dumps({'id': team['id']}), content_type='application/json')
+
+
+def team_list(rec, client, ctx):
+    params = {'sortBy': ctx.rng.choice(['new', 'expire', 'slots']), 'pageSize': 20}
+    if ctx.rng.random() < 0.2:
+        params['searchText'] = ctx.rng.choice(['算法', '考研', 'Python', '篮球'])
+    rec.timed(client, 'get', '/api/team/list', params)
+
+
+def team_join(rec, client, ctx):
+    team_id = ctx.rng.choice(ctx.public_teams)
+    rec.timed(client, 'post', '/api/team/join', {'teamId': team_id, 'password': ''})
+    client.post('/api/team/quit', json.dumps({'teamId': team_id}), content_type='application/json')
+
+
+def team_list_my_join(rec, client, ctx):
+    rec.timed(client, 'get', '/api/team/list/my/join')
+
+
+def team_list_my_create(rec, client, ctx):
+    rec.timed(client, 'get', '/api/team/list/my/create')
+
+
+def team_quit(rec, client, ctx):
+    team_id = ctx.rng.choice(ctx.public_teams)
+    client.post('/api/team/join', json.dumps({'teamId': team_id, 'password': ''}), content_type='application/json')
+    rec.timed(client, 'post', '/api/team/quit', {'teamId': team_id})
+
+
+def team_delete(rec, client, ctx):
+    rec.timed(client, 'post', '/api/team/delete', {'id': ctx.own_team(client)})
+
+
+def team_get(rec, client, ctx):
+    # 只有创建者可以查看
+    rec.timed(client, 'get', '/api/team/get', {'id': ctx.kept_team(client)})
+
+
+def team_update(rec, client, ctx):
+    rec.timed(client, 'post', '/api/team/update', {**team_payload(ctx.rng), 'id': ctx.kept_team(client)})
+
+
+# 覆盖 user/urls.py 和 team/urls.py 中的全部路由
+SCENARIOS = {
+    'user/login': user_login,
+    'user/logout': user_logout,
+    'user/register': user_register,
+    'user/account/exist': user_account_exist,
+    'user/current': user_current,
+    'user/recommend': user_recommend,
+    'user/match': user_match,
+    'user/update': user_update,
+    'user/search/tags': user_search_tags,
+    'team/add': team_add,
+    'team/list': team_list,
+    'team/join': team_join,
+    'team/list/my/join': team_list_my_join,
+    'team/list/my/create': team_list_my_create,
+    'team/quit': team_quit,
+    'team/delete': team_delete,
+    'team/get': team_get,
+    'team/update': team_update,
+}
+
+
+class Command(BaseCommand):
+    help = ('以固定并发用测试客户端压测全部接口（先用 generate_data 生成数据），'
+            '记录 p50/p95/p99 延迟、吞吐量和每个请求的查询数，可保存为 JSON 基线并与之前的基线对比')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--routes', nargs='+', choices=sorted(SCENARIOS), help='只压测这些路由')
+        parser.add_argument('--concurrency', type=int, default=4, help='并发线程数')
+        parser.add_argument('--requests', type=int, default=200, help='每个路由的请求数')
+        parser.add_argument('--slow-requests', type=int, default=16, help='登录、注册的请求数')
+        parser.add_argument('--warmup', type=int, default=2, help='每个线程正式计时前的预热请求数')
+        parser.add_argument('--password', default='12345678', help='合成用户的密码（见 generate_data）')
+        parser.add_argument('--prefix', default='synth', help='合成用户名前缀')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='把结果保存为 JSON 基线')
+        parser.add_argument('--compare', help='与之前保存的 JSON 基线对比')
+
+    def handle(self, *args, **options):
+        self.options = options
+        synthetic_users = list(User.objects.filter(username__startswith=options['prefix'])
+                               .values_list('username', flat=True)[:10000])
+        public_teams = list(Team.objects.filter(status=0, isDelete=False, expireTime__gt=timezone.now(),
+                                                memberCount__lte=F('maxNum') - options['concurrency'])
+                            .exclude(name__startswith=BENCH_PREFIX).values_list('id', flat=True)[:1000])
+        if not synthetic_users or not public_teams:
+            raise CommandError('没有合成数据，先运行 manage.py generate_data')
+        self.shared = {
+            'synthetic_users': synthetic_users,
+            'tags': tag_names(100),
+            'public_teams': public_teams,
+        }
+        # 每个线程一个专用用户，写操作不会影响合成数据，也不会超过加入队伍的上限
+        self.users = [User.objects.create_user(username=f'{BENCH_PREFIX}{uuid.uuid4().hex[:12]}',
+                                               password=options['password'], first_name='压测',
+                                               tags=self.shared['tags'][:3])
+                      for _ in range(options['concurrency'])]
+
+        results = {}
+        try:
+            self.stdout.write(f'{"route":<22} {"reqs":>5} {"err":>4} {"p50 ms":>8} {"p95 ms":>8} '
+                              f'{"p99 ms":>8} {"req/s":>8} {"queries":>8}')
+            for route in options['routes'] or SCENARIOS:
+                results[route] = self.run(route)
+                r = results[route]
+                self.stdout.write(f'{route:<22} {r["requests"]:>5} {r["errors"]:>4} {r["p50"]:>8.2f} '
+                                  f'{r["p95"]:>8.2f} {r["p99"]:>8.2f} {r["throughput"]:>8.1f} {r["queries"]:>8.1f}')
+        finally:
+            self.cleanup()
+
+        baseline = {
+            'commit': git_commit(),
+            'date': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'concurrency': options['concurrency'],
+            'users': User.objects.count(),
+            'teams': Team.objects.count(),
+            'routes': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(baseline, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'基线已保存到 {options["output"]}'))
+        if options['compare']:
+            self.compare(baseline, options['compare'])
+
+    def run(self, route):
+        """concurrency 个线程同时开始，各自执行 requests / concurrency 个请求"""
+        options = self.options
+        total = options['slow_requests'] if route in SLOW_ROUTES else options['requests']
+        per_thread = max(1, total // options['concurrency'])
+        scenario = SCENARIOS[route]
+        recorders = [Recorder() for _ in self.users]
+        barrier = threading.Barrier(len(self.users) + 1)
+        failures = []
+
+        def worker(index):
+            try:
+                client = Client()
+                client.force_login(self.users[index])
+                ctx = Context(random.Random(options['seed'] + index), self.users[index], options['password'],
+                              **self.shared)
+                for _ in range(options['warmup']):
+                    scenario(Recorder(), client, ctx)
+                barrier.wait()
+                for _ in range(per_thread):
+                    scenario(recorders[index], client, ctx)
+            except Exception as e:
+                failures.append(e)
+                barrier.abort()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(self.users))]
+        for thread in threads:
+            thread.start()
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            pass
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        if failures:
+            raise CommandError(f'{route} 压测失败：{failures[0]!r}')
+
+        latency = sorted(value for rec in recorders for value in rec.latency)
+        queries = [value for rec in recorders for value in rec.queries]
+        return {
+            'requests': len(latency),
+            'errors': sum(rec.errors for rec in recorders),
+            'p50': percentile(latency, 50),
+            'p95': percentile(latency, 95),
+            'p99': percentile(latency, 99),
+            'mean': statistics.fmean(latency),
+            'throughput': len(latency) / elapsed,
+            'queries': statistics.fmean(queries),
+            'queries_max': max(queries),
+        }
+
+    def cleanup(self):
+        """删除压测用户（连同其创建的队伍和成员关系）和注册的用户，再校对计数、重建检索索引"""
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        Team.objects.filter(name__startswith=BENCH_PREFIX).delete()
+        repair_member_counts()
+        rebuild_index()
+        invalidate_team_lists()
+
+    def compare(self, current, path):
+        with open(path, encoding='utf-8') as f:
+            previous = json.load(f)
+        self.stdout.write(f'\n与基线 {previous.get("commit")}（{previous.get("date")}）对比，'
+                          f'正值表示变好：')
+        self.stdout.write(f'{"route":<22}' + ''.join(f'{name:>12}' for name in METRICS))
+        for route, result in current['routes'].items():
+            before = previous['routes'].get(route)
+            if before is None:
+                continue
+            cells = []
+            for name, higher_is_better in METRICS.items():
+                old, new = before[name], result[name]
+                change = (new - old) / old * 100 if old else 0.0
+                cells.append(f'{change if higher_is_better else -change:>+11.1f}%')
+            self.stdout.write(f'{route:<22}' + ''.join(cells))
@@ -0,0 +1,90 @@
+import datetime
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from team.list_cache import invalidate_team_lists
+from team.models import Team
+from team.views import TEAM_LIST_SORTS
+from user.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('逐步扩大队伍表，测量 /api/team/list 各排序下首页与深分页的延迟，'
+            '以及首页命中缓存和 304 的延迟（数据在事务中回滚）')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help='依次扩充到的队伍总数')
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--depth', type=int, default=50, help='深分页测量的页码')
+        parser.add_argument('--repeat', type=int, default=20, help='每项测量的重复次数')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        owner = User.objects.create(username='bench_team_list_owner')
+        client = APIClient()
+        client.force_authenticate(owner)
+        rng = random.Random(42)
+        now = timezone.now()
+
+        deep_title = f'page {options["depth"]} (ms)'
+        self.stdout.write(f'{"teams":>8} {"sort":>7} {"page 1 (ms)":>12} {deep_title:>12} '
+                          f'{"cached (ms)":>12} {"304 (ms)":>9}')
+        for size in options['sizes']:
+            missing = size - Team.objects.count()
+            teams = []
+            for i in range(max(missing, 0)):
+                max_num = rng.randint(3, 10)
+                teams.append(Team(
+                    name=f'bench{i}', description='bench', maxNum=max_num,
+                    memberCount=rng.randint(1, max_num), userId=owner,
+                    expireTime=now + datetime.timedelta(minutes=rng.randint(1, 60 * 24 * 30)),
+                ))
+            Team.objects.bulk_create(teams, batch_size=5000)
+            invalidate_team_lists()
+
+            # relevance 需要搜索关键词，不在这里测量
+            for sort_by in [sort_by for sort_by in TEAM_LIST_SORTS if sort_by != 'relevance']:
+                params = {'sortBy': sort_by, 'pageSize': options['page_size']}
+                first = self.measure(client, params, options['repeat'])
+                # 沿游标走到目标页，记录该页游标后单独测量
+                cursor = ''
+                for _ in range(options['depth'] - 1):
+                    cursor = client.get('/api/team/list', {**params, 'cursor': cursor}).data['date']['nextCursor']
+                    if cursor is None:
+                        break
+                deep = self.measure(client, {**params, 'cursor': cursor}, options['repeat']) if cursor else float('nan')
+                cached = self.measure(client, params, options['repeat'], cold=False)
+                etag = client.get('/api/team/list', params)['ETag']
+                not_modified = self.measure(client, params, options['repeat'], cold=False,
+                                            HTTP_IF_NONE_MATCH=etag)
+                self.stdout.write(f'{size:>8} {sort_by:>7} {first:>12.2f} {deep:>12.2f} '
+                                  f'{cached:>12.2f} {not_modified:>9.2f}')
+
+    def measure(self, client, params, repeat, cold=True, **headers):
+        """cold 为 True 时每次请求前作废列表缓存，测量查询数据库的延迟"""
+        latency = []
+        for _ in range(repeat):
+            if cold:
+                invalidate_team_lists()
+            start = time.perf_counter()
+            client.get('/api/team/list', params, **headers)
+            latency.append((time.perf_counter() - start) * 1000)
+        return statistics.median(latency)
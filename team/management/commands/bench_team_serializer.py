@@ -0,0 +1,70 @@
+import datetime
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from team.models import Team
+from team.serializers import TEAM_ROWS, TeamSerializer
+from user.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = '对比 TeamSerializer 与 .values() 快速路径序列化队伍列表的耗时（数据在事务中回滚）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--teams', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=500, help='队伍创建人数量')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        rng = random.Random(42)
+        now = timezone.now()
+        users = User.objects.bulk_create([
+            User(username=f'bench_serializer{i}', tags=rng.sample(['Java', 'Python', 'C++', '大一', '男', '女'], 3))
+            for i in range(options['users'])
+        ])
+        Team.objects.bulk_create([
+            Team(name=f'bench{i}', description='bench', maxNum=5, memberCount=rng.randint(1, 5),
+                 userId=rng.choice(users),
+                 expireTime=None if i % 5 == 0 else now + datetime.timedelta(days=rng.randint(1, 30)))
+            for i in range(options['teams'])
+        ], batch_size=5000)
+
+        render = JSONRenderer().render
+        queryset = Team.objects.select_related('userId').order_by('-createTime', '-id')
+
+        def serializer_path():
+            return render([TeamSerializer(team).data for team in queryset.all()])
+
+        def fast_path():
+            return render(TEAM_ROWS.serialize(queryset.values(*TEAM_ROWS.keys())))
+
+        if serializer_path() != fast_path():
+            raise CommandError('快速路径输出与 TeamSerializer 不一致')
+
+        self.stdout.write(f'{Team.objects.count()} 个队伍，输出一致')
+        for name, func in [('TeamSerializer', serializer_path), ('fast path', fast_path)]:
+            latency = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                func()
+                latency.append((time.perf_counter() - start) * 1000)
+            self.stdout.write(f'{name:<16} median={statistics.median(latency):9.1f}ms '
+                              f'min={min(latency):9.1f}ms')
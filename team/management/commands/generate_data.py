@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from team.models import Team, UserTeam
+from team.synthetic import generate_teams
+from user.models import User
+from user.synthetic import generate_users
+
+
+class Command(BaseCommand):
+    help = ('生成压测用的合成数据：用户（标签按 Zipf 分布，密码统一为 --password）、'
+            '队伍和成员关系，全部批量写入')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000, help='新增的用户数')
+        parser.add_argument('--teams', type=int, default=2000, help='新增的队伍数')
+        parser.add_argument('--tags', type=int, default=2000, help='标签种类数')
+        parser.add_argument('--tags-per-user', type=int, default=3, help='每个用户的平均标签数')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000, help='每个事务写入的行数')
+        parser.add_argument('--prefix', default='synth', help='用户名前缀')
+        parser.add_argument('--password', default='12345678', help='所有合成用户的密码')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        for done in generate_users(options['users'], options['tags'], options['tags_per_user'], options['seed'],
+                                   options['prefix'], options['password'], options['batch_size']):
+            self.stdout.write(f'用户 {done}/{options["users"]}，{time.perf_counter() - start:.1f}s')
+
+        start = time.perf_counter()
+        for done in generate_teams(options['teams'], options['seed'], options['batch_size']):
+            self.stdout.write(f'队伍 {done}/{options["teams"]}，{time.perf_counter() - start:.1f}s')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'完成：用户 {User.objects.count()}，队伍 {Team.objects.count()}，'
+            f'成员关系 {UserTeam.objects.count()}'
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from team.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = '全量重建队伍名称/描述的全文检索索引'
+
+    def handle(self, *args, **options):
+        total = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'检索索引重建完成，共 {total} 个队伍'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from team.counters import repair_join_team_nums, repair_member_counts
+
+
+class Command(BaseCommand):
+    help = '按实际成员记录重算并修正队伍的 memberCount 和用户的 joinTeamNum'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批处理的队伍数')
+        parser.add_argument('--dry-run', action='store_true', help='只统计偏差，不写入')
+
+    def handle(self, *args, **options):
+        kwargs = {'batch_size': options['batch_size'], 'dry_run': options['dry_run']}
+        teams = repair_member_counts(**kwargs)
+        users = repair_join_team_nums(**kwargs)
+        action = '发现' if options['dry_run'] else '修正'
+        self.stdout.write(self.style.SUCCESS(f'{action} {teams} 个队伍的人数，{users} 个用户的已加入队伍数'))
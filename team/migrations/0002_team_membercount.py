@@ -0,0 +1,29 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:36
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_member_count(apps, schema_editor):
+    Team = apps.get_model('team', 'Team')
+    UserTeam = apps.get_model('team', 'UserTeam')
+    counts = UserTeam.objects.filter(teamId=OuterRef('pk'), isDelete=False) \
+        .values('teamId').annotate(n=Count('id')).values('n')
+    Team.objects.update(memberCount=Coalesce(Subquery(counts, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('team', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='team',
+            name='memberCount',
+            field=models.IntegerField(default=0, verbose_name='当前人数'),
+        ),
+        migrations.RunPython(fill_member_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:38
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def fill_join_team_num(apps, schema_editor):
+    User = apps.get_model('user', 'User')
+    UserTeam = apps.get_model('team', 'UserTeam')
+    counts = UserTeam.objects.filter(isDelete=False).values('userId').annotate(n=Count('id'))
+    for row in counts.iterator():
+        User.objects.filter(id=row['userId']).update(joinTeamNum=row['n'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('team', '0002_team_membercount'),
+        ('user', '0007_user_jointeamnum'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_join_team_num, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:40
+
+import django.db.models.expressions
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('team', '0003_fill_user_jointeamnum'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='team',
+            index=models.Index(fields=['status', 'isDelete', 'createTime', 'id'], name='team_status_ctime_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='team',
+            index=models.Index(fields=['status', 'isDelete', 'expireTime', 'createTime'], name='team_status_expire_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='team',
+            index=models.Index(models.F('status'), models.F('isDelete'), models.OrderBy(django.db.models.expressions.CombinedExpression(models.F('maxNum'), '-', models.F('memberCount')), descending=True), models.F('id'), name='team_status_slots_idx'),
+        ),
+    ]
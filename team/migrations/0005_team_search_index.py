@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        schema_editor.execute(
+            'ALTER TABLE team ADD FULLTEXT INDEX team_name_desc_ft (name, description) WITH PARSER ngram'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE team_fts USING fts5(name, description, tokenize='trigram')"
+        )
+        schema_editor.execute(
+            'INSERT INTO team_fts (rowid, name, description) SELECT id, name, description FROM team'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE team DROP INDEX team_name_desc_ft')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE team_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('team', '0004_team_list_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -10,6 +10,8 @@ class Team(models.Model):
     status = models.IntegerField(default=0, verbose_name='队伍状态', 
                                choices=((0, '公开'), (1, '私有'), (2, '加密')))
     password = models.CharField(max_length=512, blank=True, verbose_name='密码')
+    # 未退出的成员数，随加入/退出/解散在同一事务内用 F() 原子增减
+    memberCount = models.IntegerField(default=0, verbose_name='当前人数')
     createTime = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updateTime = models.DateTimeField(auto_now=True, verbose_name='更新时间')
     isDelete = models.BooleanField(default=False, verbose_name='是否删除')
@@ -19,6 +21,14 @@ class Team(models.Model):
         verbose_name = '队伍'
         verbose_name_plural = verbose_name
         ordering = ['-createTime']
+        indexes = [
+            # 队伍列表三种排序：最新创建、即将过期、空位最多
+            models.Index(fields=['status', 'isDelete', 'createTime', 'id'], name='team_status_ctime_idx'),
+            models.Index(fields=['status', 'isDelete', 'expireTime', 'createTime'], name='team_status_expire_idx'),
+            models.Index(models.F('status'), models.F('isDelete'),
+                         (models.F('maxNum') - models.F('memberCount')).desc(), models.F('id'),
+                         name='team_status_slots_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -0,0 +1,93 @@
+# team/search.py
+"""队伍名称/描述全文检索
+
+``name LIKE '%关键词%'`` 前导通配符用不上任何索引，队伍多了只能全表扫描。
+这里按数据库选择检索方式：
+
+- MySQL：``team(name, description)`` 上的 FULLTEXT 索引，使用 ngram 分词器切分中文，
+  索引随表自动维护；
+- SQLite（测试与压测）：FTS5 虚拟表 ``team_fts``，trigram 分词，
+  由 ``index_team()`` 在创建/编辑队伍时同步。
+
+关键词按短语匹配，结果与原来的 icontains 基本一致；需要按相关度排序时再注解
+``searchRank``（越大越相关）。关键词短于分词长度时索引无法命中，退回 icontains。
+"""
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+# SQLite 下的 FTS5 虚拟表，rowid 即队伍ID
+TEAM_FTS_TABLE = 'team_fts'
+
+# 能走全文索引的最短关键词长度：MySQL ngram_token_size 默认 2，FTS5 trigram 为 3
+MIN_QUERY_LENGTH = {'mysql': 2, 'sqlite': 3}
+
+
+def backend():
+    """当前数据库使用的检索方式，不支持全文检索时返回 None"""
+    vendor = connection.vendor
+    return vendor if vendor in MIN_QUERY_LENGTH else None
+
+
+def search(queryset, text, rank=False):
+    """按关键词过滤队伍查询集，rank 为 True 时注解相关度 searchRank
+
+    SQLite 下相关度是逐行计算的相关子查询，代价与命中数成正比，不排序时不要注解。
+    """
+    text = text.strip()
+    vendor = backend()
+    if vendor == 'mysql':
+        # 布尔模式下双引号内为短语，无法转义，直接去掉关键词中的双引号
+        text = text.replace('"', ' ').strip()
+    if vendor is None or len(text) < MIN_QUERY_LENGTH[vendor]:
+        queryset = queryset.filter(Q(name__icontains=text) | Q(description__icontains=text))
+        if rank:
+            queryset = queryset.annotate(searchRank=Value(0.0, output_field=FloatField()))
+        return queryset
+
+    if vendor == 'mysql':
+        relevance = RawSQL(
+            'MATCH (`team`.`name`, `team`.`description`) AGAINST (%s IN BOOLEAN MODE)',
+            [f'"{text}"'], output_field=FloatField(),
+        )
+        if rank:
+            return queryset.annotate(searchRank=relevance).filter(searchRank__gt=0)
+        return queryset.alias(searchRank=relevance).filter(searchRank__gt=0)
+
+    phrase = '"%s"' % text.replace('"', '""')
+    matched = RawSQL(f'SELECT rowid FROM {TEAM_FTS_TABLE} WHERE {TEAM_FTS_TABLE} MATCH %s', [phrase])
+    queryset = queryset.filter(id__in=matched)
+    if rank:
+        # FTS5 的 rank 是 bm25 取负，越小越相关，这里取反与 MySQL 保持一致
+        queryset = queryset.annotate(searchRank=RawSQL(
+            f'SELECT -rank FROM {TEAM_FTS_TABLE} WHERE {TEAM_FTS_TABLE} MATCH %s AND rowid = "team"."id"',
+            [phrase], output_field=FloatField(),
+        ))
+    return queryset
+
+
+def index_team(team):
+    """创建或编辑队伍后同步检索索引，需要与写入队伍在同一事务中调用"""
+    if backend() != 'sqlite':
+        # MySQL 的 FULLTEXT 索引随表自动维护
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TEAM_FTS_TABLE} WHERE rowid = %s', [team.id])
+        cursor.execute(
+            f'INSERT INTO {TEAM_FTS_TABLE} (rowid, name, description) VALUES (%s, %s, %s)',
+            [team.id, team.name, team.description],
+        )
+
+
+def rebuild_index():
+    """全量重建检索索引（批量导入等绕过视图写入队伍之后使用），返回队伍数"""
+    from .models import Team
+
+    if backend() == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TEAM_FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {TEAM_FTS_TABLE} (rowid, name, description) '
+                f'SELECT id, name, description FROM {Team._meta.db_table}'
+            )
+    return Team.objects.count()
@@ -1,10 +1,11 @@
 from rest_framework import serializers
+from backend.serialization import RowSerializer, compile_field
 from .models import Team, UserTeam
-from user.serializers import UserSerializer
+from user.fragments import PrefetchUserFragmentsListSerializer, UserFragmentField, UserFragmentRows
 
 class TeamSerializer(serializers.ModelSerializer):
     """队伍序列化器"""
-    createUser = UserSerializer(source='userId', read_only=True)
+    createUser = UserFragmentField(source='userId')
     hasJoinNum = serializers.SerializerMethodField()
     
     class Meta:
@@ -23,10 +24,11 @@ class TeamSerializer(serializers.ModelSerializer):
             'password'
         ]
         read_only_fields = ['createTime', 'hasJoinNum']
+        list_serializer_class = PrefetchUserFragmentsListSerializer
 
     def get_hasJoinNum(self, obj):
         """获取当前队伍人数"""
-        return obj.userteam_set.filter(isDelete=False).count()
+        return obj.memberCount
 
     def to_representation(self, instance):
         """自定义序列化输出"""
@@ -38,10 +40,39 @@ class TeamSerializer(serializers.ModelSerializer):
             data['createTime'] = instance.createTime.strftime('%Y-%m-%dT%H:%M:%S')
         return data
 
+
+def format_time(value):
+    """与 TeamSerializer.to_representation 中的时间格式一致"""
+    return value.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def team_row_serializer():
+    """按 TeamSerializer 的字段顺序编译队伍列表的快速路径"""
+    fields = TeamSerializer().fields
+    columns = []
+    for name in fields:
+        if name in ('expireTime', 'createTime'):
+            columns.append((name, name, format_time))
+        elif name == 'userId':
+            # 主键关联字段输出的就是ID
+            columns.append((name, name, None))
+        elif name == 'createUser':
+            columns.append((name, UserFragmentRows('userId__'), None))
+        elif name == 'hasJoinNum':
+            columns.append((name, 'memberCount', None))
+        else:
+            columns.append((name, name, compile_field(fields[name])))
+    return RowSerializer(columns)
+
+
+# 列表接口的快速路径：从 .values() 行构造与 TeamSerializer 相同的输出
+TEAM_ROWS = team_row_serializer()
+
+
 class UserTeamSerializer(serializers.ModelSerializer):
     """用户队伍关系序列化器"""
     # 包含用户信息
-    user = UserSerializer(source='userId', read_only=True)
+    user = UserFragmentField(source='userId')
     # 包含队伍信息
     team = TeamSerializer(source='teamId', read_only=True)
     
@@ -56,4 +87,5 @@ class UserTeamSerializer(serializers.ModelSerializer):
             'user',
             'team'
         ]
-        read_only_fields = ['joinTime', 'createTime']
\ No newline at end of file
+        read_only_fields = ['joinTime', 'createTime']
+        list_serializer_class = PrefetchUserFragmentsListSerializer
\ No newline at end of file
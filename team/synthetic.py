@@ -0,0 +1,83 @@
+# team/synthetic.py
+"""合成队伍和成员关系，供压测和基准测试使用（manage.py generate_data）
+
+队伍按真实分布的大致比例生成：七成公开、一成私有、两成加密（密码统一为
+``PASSWORD``）；八成在未来过期，一成已过期，一成不过期。创建人和成员都遵守
+每人最多加入 ``MAX_JOIN_TEAM_NUM`` 个队伍的限制，随后校对冗余计数、重建检索
+索引并作废列表缓存，生成的数据与经由接口写入的没有区别。
+"""
+import datetime
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from user.models import User
+from .counters import repair_join_team_nums
+from .list_cache import invalidate_team_lists
+from .models import Team, UserTeam
+from .search import rebuild_index
+from .views import MAX_JOIN_TEAM_NUM
+
+PASSWORD = '1234'
+
+TOPICS = ['算法刷题', '考研', '数学建模', '前端', '后端', 'Java', 'Python', '机器学习', '竞赛', '英语',
+          '篮球', '健身', '摄影', '音乐', '游戏', '电影', '旅行', '读书', '安卓', '开源']
+SUFFIXES = ['小组', '打卡', '互助', '交流群', '冲刺队', '学习营', '俱乐部', '搭子']
+
+
+def generate_teams(count, seed=42, batch_size=5000, prefix=''):
+    """为已有用户批量生成 count 个队伍及成员，逐批产出已生成的队伍数
+
+    队伍主键预先分配（当前最大ID之后），不依赖 bulk_create 返回主键，MySQL 上也能
+    在同一批中写入成员记录。
+    """
+    rng = np.random.default_rng(seed)
+    user_ids = np.array(User.objects.filter(is_active=True).order_by('id').values_list('id', flat=True))
+    if not len(user_ids):
+        return
+    # 每个用户剩余可加入的队伍数，只在内存中计数，最后统一校对 joinTeamNum
+    joined = dict(User.objects.filter(id__in=user_ids.tolist()).values_list('id', 'joinTeamNum'))
+    now = timezone.now()
+    next_id = (Team.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+
+    for offset in range(0, count, batch_size):
+        size = min(batch_size, count - offset)
+        teams, members = [], []
+        for i in range(size):
+            candidates = user_ids[rng.integers(0, len(user_ids), size=16)]
+            available = [int(user_id) for user_id in dict.fromkeys(candidates.tolist())
+                         if joined[user_id] < MAX_JOIN_TEAM_NUM]
+            if not available:
+                continue
+            max_num = int(rng.integers(3, 11))
+            owner, others = available[0], available[1:int(rng.integers(1, max_num + 1))]
+            status = int(rng.choice(3, p=[0.7, 0.1, 0.2]))
+            expiry = rng.random()
+            if expiry < 0.8:
+                expire_time = now + datetime.timedelta(minutes=int(rng.integers(60, 60 * 24 * 60)))
+            elif expiry < 0.9:
+                expire_time = now - datetime.timedelta(minutes=int(rng.integers(60, 60 * 24 * 60)))
+            else:
+                expire_time = None
+            topic = TOPICS[int(rng.integers(len(TOPICS)))]
+            team = Team(
+                id=next_id, name=f'{prefix}{topic}{SUFFIXES[int(rng.integers(len(SUFFIXES)))]}{next_id}',
+                description=f'一起{topic}，欢迎加入', maxNum=max_num, expireTime=expire_time,
+                userId_id=owner, status=status, password=PASSWORD if status == 2 else '',
+                memberCount=1 + len(others),
+            )
+            teams.append(team)
+            for user_id in [owner, *others]:
+                joined[user_id] += 1
+                members.append(UserTeam(userId_id=user_id, teamId_id=next_id))
+            next_id += 1
+        with transaction.atomic():
+            Team.objects.bulk_create(teams, batch_size=1000)
+            UserTeam.objects.bulk_create(members, batch_size=1000)
+        yield offset + size
+
+    repair_join_team_nums()
+    rebuild_index()
+    invalidate_team_lists()
@@ -1,3 +1,818 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import math
+import multiprocessing
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from backend import query_budget, singleflight
+from backend import urls as backend_urls
+from backend.sessions import local_sessions
+from user import urls as user_urls
+from user.bloom import username_index
+from user.fragments import fragment_cache
+from user.models import User
+from user.serializers import USER_ROWS, UserSerializer
+from user.synthetic import generate_users
+from user.user_cache import user_cache
+from .counters import repair_join_team_nums, repair_member_counts
+from .list_cache import invalidate_team_lists
+from .management.commands.bench_routes import percentile
+from .models import Team, UserTeam
+from .serializers import TEAM_ROWS, TeamSerializer
+from .synthetic import generate_teams
+from . import urls as team_urls
+from .urls import async_urlpatterns
+from .views import TeamListView
+
+# 异步视图测试使用的路由，与 ASYNC_VIEWS 开启时的匹配顺序一致
+urlpatterns = [path('api/team/', include(async_urlpatterns))] + backend_urls.urlpatterns
+
+
+class TeamListQueryCountTest(TestCase):
+    """队伍列表接口的查询数不随队伍数量增长"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='viewer', password='12345678')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_teams(self, count, owner=None):
+        owner = owner or User.objects.create_user(username=f'owner{Team.objects.count()}', password='12345678')
+        teams = []
+        for i in range(count):
+            team = Team.objects.create(name=f'team{i}', description='desc', maxNum=5, userId=owner, memberCount=1)
+            UserTeam.objects.create(userId=owner, teamId=team)
+            teams.append(team)
+        invalidate_team_lists()
+        return teams
+
+    def test_list_query_count_is_constant(self):
+        teams = self.create_teams(3)
+        self.client.post('/api/team/join', {'teamId': teams[0].id})
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/team/list')
+        self.assertEqual(len(response.data['date']), 3)
+
+        self.create_teams(10)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/team/list')
+        data = {team['id']: team for team in response.data['date']}
+        self.assertEqual(len(data), 13)
+        self.assertEqual(data[teams[0].id]['hasJoinNum'], 2)
+        self.assertTrue(data[teams[0].id]['hasJoin'])
+        self.assertEqual(data[teams[1].id]['hasJoinNum'], 1)
+        self.assertFalse(data[teams[1].id]['hasJoin'])
+        self.assertEqual(data[teams[0].id]['createUser']['username'], teams[0].userId.username)
+
+    def test_my_join_and_create_query_count_is_constant(self):
+        for team in self.create_teams(4):
+            self.client.post('/api/team/join', {'teamId': team.id})
+        self.create_teams(5, owner=self.user)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/team/list/my/join')
+        # 创建的队伍也算加入
+        self.assertEqual(len(response.data['date']), 9)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/team/list/my/create')
+        self.assertEqual(len(response.data['date']), 5)
+        self.assertTrue(all(team['hasJoinNum'] == 1 for team in response.data['date']))
+
+
+class TeamListCacheTest(TestCase):
+    """队伍列表共享部分走缓存，写操作作废缓存，未变化时返回304"""
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='12345678')
+        self.viewer = User.objects.create_user(username='viewer', password='12345678')
+        self.owner_client = APIClient()
+        self.owner_client.force_authenticate(self.owner)
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+        response = self.owner_client.post('/api/team/add', {
+            'name': 'team', 'description': 'desc', 'expireTime': '2099-01-01T00:00:00',
+            'maxNum': 5, 'status': 0,
+        })
+        self.team_id = response.data['date']['id']
+
+    def test_cache_and_not_modified(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/team/list')
+        etag = response['ETag']
+        # 命中缓存只查当前用户加入的队伍
+        with self.assertNumQueries(1):
+            cached = self.client.get('/api/team/list')
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['ETag'], etag)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/team/list', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # hasJoin 按用户叠加，ETag 也按用户区分
+        owner_response = self.owner_client.get('/api/team/list')
+        self.assertTrue(owner_response.data['date'][0]['hasJoin'])
+        self.assertFalse(cached.data['date'][0]['hasJoin'])
+        self.assertNotEqual(owner_response['ETag'], etag)
+
+        # 加入后缓存作废
+        self.client.post('/api/team/join', {'teamId': self.team_id})
+        response = self.client.get('/api/team/list', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['date'][0]['hasJoinNum'], 2)
+        self.assertTrue(response.data['date'][0]['hasJoin'])
+
+    def test_writes_invalidate(self):
+        self.client.get('/api/team/list', {'pageSize': 10})
+        self.owner_client.post('/api/team/update', {
+            'id': self.team_id, 'name': 'renamed', 'description': 'desc', 'status': 0,
+        })
+        response = self.client.get('/api/team/list', {'pageSize': 10})
+        self.assertEqual(response.data['date']['records'][0]['name'], 'renamed')
+
+        self.owner_client.post('/api/team/delete', {'id': self.team_id})
+        response = self.client.get('/api/team/list', {'pageSize': 10})
+        self.assertEqual(response.data['date']['records'], [])
+
+    def test_expired_team_leaves_cached_list(self):
+        now = timezone.now()
+        Team.objects.filter(id=self.team_id).update(expireTime=now + datetime.timedelta(minutes=1))
+        invalidate_team_lists()
+        self.assertEqual(len(self.client.get('/api/team/list').data['date']), 1)
+        # 缓存项的有效期截止到本页最早的过期时间（且超过了返回旧值的时间），
+        # 之后不经任何写入也会重新查询
+        later = now + datetime.timedelta(minutes=2)
+        with mock.patch('django.utils.timezone.now', return_value=later), \
+                mock.patch('time.time', return_value=time.time() + 120):
+            self.assertEqual(self.client.get('/api/team/list').data['date'], [])
+
+
+class TeamListPaginationTest(TestCase):
+    """队伍列表游标分页在各种排序下不重不漏"""
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create(username='owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        now = timezone.now()
+        for i in range(23):
+            Team.objects.create(
+                name=f'team{i}', maxNum=3 + i % 5, memberCount=1 + i % 3, userId=self.owner,
+                # 一部分队伍永不过期，一部分过期时间相同
+                expireTime=None if i % 4 == 0 else now + datetime.timedelta(days=i % 6 + 1),
+            )
+
+    def walk(self, sort_by):
+        ids = []
+        cursor = ''
+        while cursor is not None:
+            response = self.client.get('/api/team/list', {'sortBy': sort_by, 'pageSize': 5, 'cursor': cursor})
+            self.assertEqual(response.data['code'], 0)
+            ids.extend(team['id'] for team in response.data['date']['records'])
+            cursor = response.data['date']['nextCursor']
+        return ids
+
+    def test_cursor_pages_cover_all_teams_in_order(self):
+        expected = set(Team.objects.values_list('id', flat=True))
+        for sort_by in ['new', 'expire', 'slots']:
+            ids = self.walk(sort_by)
+            self.assertEqual(len(ids), len(expected), sort_by)
+            self.assertEqual(set(ids), expected, sort_by)
+            legacy = [team['id'] for team in self.client.get('/api/team/list', {'sortBy': sort_by}).data['date']]
+            self.assertEqual(ids, legacy, sort_by)
+
+    def test_never_expiring_teams_last(self):
+        teams = Team.objects.in_bulk(self.walk('expire'))
+        expire_times = [teams[team_id].expireTime for team_id in self.walk('expire')]
+        dated = [value for value in expire_times if value is not None]
+        self.assertEqual(expire_times, sorted(dated) + [None] * (len(expire_times) - len(dated)))
+        self.assertGreater(len(dated), 0)
+        self.assertLess(len(dated), len(expire_times))
+
+    def test_slots_order(self):
+        teams = Team.objects.in_bulk(self.walk('slots'))
+        free = [teams[team_id].maxNum - teams[team_id].memberCount for team_id in self.walk('slots')]
+        self.assertEqual(free, sorted(free, reverse=True))
+
+
+class TeamSearchTest(TestCase):
+    """队伍搜索走全文索引，创建、编辑后索引同步更新"""
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='12345678')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.team_ids = [self.add_team(name, description) for name, description in [
+            ('编程学习小组', '一起学习 Python'),
+            ('篮球队', '周末打球，顺便交流编程学习心得'),
+            ('编程学习编程学习', '编程学习'),
+        ]]
+
+    def add_team(self, name, description):
+        response = self.client.post('/api/team/add', {
+            'name': name, 'description': description, 'expireTime': '2099-01-01T00:00:00',
+            'maxNum': 5, 'status': 0,
+        })
+        return response.data['date']['id']
+
+    def search(self, url, text, **params):
+        response = self.client.get(url, {'searchText': text, **params})
+        self.assertEqual(response.data['code'], 0)
+        data = response.data['date']
+        return [team['id'] for team in (data['records'] if 'records' in data else data)]
+
+    def test_search_name_and_description(self):
+        for url in ['/api/team/list', '/api/team/list/my/join', '/api/team/list/my/create']:
+            self.assertEqual(set(self.search(url, '编程学习')), set(self.team_ids), url)
+            self.assertEqual(self.search(url, 'Python'), [self.team_ids[0]], url)
+            self.assertEqual(self.search(url, '足球'), [], url)
+            # 短于分词长度的关键词退回 LIKE
+            self.assertEqual(self.search(url, '篮'), [self.team_ids[1]], url)
+
+    def test_relevance_order(self):
+        ids = self.search('/api/team/list', '编程学习', sortBy='relevance')
+        self.assertEqual(ids[0], self.team_ids[2])
+        self.assertEqual(self.search('/api/team/list/my/join', '编程学习', sortBy='relevance')[0], self.team_ids[2])
+        paged = self.search('/api/team/list', '编程学习', sortBy='relevance', pageSize=10)
+        self.assertEqual(paged, ids)
+        response = self.client.get('/api/team/list', {'sortBy': 'relevance'})
+        self.assertEqual(response.data['code'], 40000)
+
+    def test_update_keeps_index_in_sync(self):
+        self.client.post('/api/team/update', {
+            'id': self.team_ids[1], 'name': '足球队', 'description': '只踢球', 'status': 0,
+        })
+        self.assertEqual(self.search('/api/team/list', '足球队'), [self.team_ids[1]])
+        self.assertEqual(set(self.search('/api/team/list', '编程学习')), {self.team_ids[0], self.team_ids[2]})
+
+
+class TeamRowSerializerTest(TestCase):
+    """列表快速序列化路径与原序列化器输出逐字节一致"""
+
+    def test_output_is_identical(self):
+        users = [
+            User.objects.create(username='a', tags=['Java', '大一'], profile=None, email='a@example.com'),
+            User.objects.create(username='b', tags='["Python"]', profile='简介', gender=1, phone='123'),
+            User.objects.create(username='c', tags=None),
+        ]
+        now = timezone.now()
+        for i, user in enumerate(users * 2):
+            Team.objects.create(
+                name=f'队伍{i}', description='' if i % 2 else '描述', maxNum=3 + i, memberCount=i % 3,
+                userId=user, status=i % 3, password='pw' if i % 3 == 2 else '',
+                expireTime=None if i % 2 else now + datetime.timedelta(days=i),
+            )
+
+        render = JSONRenderer().render
+        teams = Team.objects.select_related('userId')
+        self.assertEqual(
+            render(TEAM_ROWS.serialize(teams.values(*TEAM_ROWS.keys()))),
+            render(TeamSerializer(teams, many=True).data),
+        )
+        users = User.objects.all()
+        self.assertEqual(
+            render(USER_ROWS.serialize(users.values(*USER_ROWS.keys()))),
+            render(UserSerializer(users, many=True).data),
+        )
+        self.assertEqual(TEAM_ROWS.serialize(Team.objects.none().values(*TEAM_ROWS.keys())), [])
+
+
+class TeamMemberCountTest(TestCase):
+    """memberCount 随加入、退出、解散同步变化"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', password='12345678')
+        self.member = User.objects.create_user(username='member', password='12345678')
+        self.owner_client = APIClient()
+        self.owner_client.force_authenticate(self.owner)
+        self.member_client = APIClient()
+        self.member_client.force_authenticate(self.member)
+        response = self.owner_client.post('/api/team/add', {
+            'name': 'team', 'description': 'desc', 'expireTime': '2099-01-01T00:00:00',
+            'maxNum': 3, 'status': 0,
+        })
+        self.team_id = response.data['date']['id']
+
+    def member_count(self):
+        return Team.objects.get(id=self.team_id).memberCount
+
+    def test_join_quit_rejoin_delete(self):
+        self.assertEqual(self.member_count(), 1)
+        self.member_client.post('/api/team/join', {'teamId': self.team_id})
+        self.assertEqual(self.member_count(), 2)
+        self.member_client.post('/api/team/quit', {'teamId': self.team_id})
+        self.assertEqual(self.member_count(), 1)
+        self.member.refresh_from_db()
+        self.assertEqual(self.member.joinTeamNum, 0)
+        self.member_client.post('/api/team/join', {'teamId': self.team_id})
+        self.assertEqual(self.member_count(), 2)
+        self.owner_client.post('/api/team/delete', {'id': self.team_id})
+        self.assertEqual(self.member_count(), 0)
+        self.member.refresh_from_db()
+        self.owner.refresh_from_db()
+        self.assertEqual((self.member.joinTeamNum, self.owner.joinTeamNum), (0, 0))
+
+    def test_lock_order(self):
+        # 加入、退出、解散都按 队伍 -> 用户 -> 成员记录 的顺序写，不会互相死锁
+        def tables(client, url, data):
+            with CaptureQueriesContext(connection) as queries:
+                response = client.post(url, data)
+            self.assertEqual(response.data['code'], 0, response.data)
+            written = []
+            for query in queries:
+                match = re.match(r'(?:UPDATE|INSERT INTO) "?(\w+)"?', query['sql'])
+                if match and match.group(1) in ('team', 'user', 'user_team'):
+                    written.append(match.group(1))
+            return list(dict.fromkeys(written))
+
+        order = ['team', 'user', 'user_team']
+        self.assertEqual(tables(self.member_client, '/api/team/join', {'teamId': self.team_id}), order)
+        self.assertEqual(tables(self.member_client, '/api/team/quit', {'teamId': self.team_id}), order)
+        self.assertEqual(tables(self.member_client, '/api/team/join', {'teamId': self.team_id}), order)
+        self.assertEqual(tables(self.owner_client, '/api/team/delete', {'id': self.team_id}), order)
+
+    def test_duplicate_quit_rolls_back(self):
+        self.member_client.post('/api/team/join', {'teamId': self.team_id})
+        user_team = UserTeam.objects.get(userId=self.member, teamId=self.team_id)
+        filter_ = UserTeam.objects.filter
+
+        def quit_raced(*args, **kwargs):
+            # 读取关系之后、事务之前另一个退出请求已经完成
+            queryset = filter_(*args, **kwargs)
+            if kwargs.get('id') == user_team.id:
+                filter_(id=user_team.id).update(isDelete=True)
+            return queryset
+
+        with mock.patch.object(UserTeam.objects, 'filter', side_effect=quit_raced):
+            response = self.member_client.post('/api/team/quit', {'teamId': self.team_id})
+        self.assertEqual(response.data['message'], '未加入该队伍')
+        self.member.refresh_from_db()
+        self.assertEqual((self.member_count(), self.member.joinTeamNum), (2, 1))
+
+    def test_update_keeps_concurrent_join(self):
+        team_save = Team.save
+
+        def save_after_join(team, *args, **kwargs):
+            # 读取队伍之后、保存之前另一个请求加入了队伍
+            Team.objects.filter(id=team.id).update(memberCount=F('memberCount') + 1)
+            return team_save(team, *args, **kwargs)
+
+        with mock.patch.object(Team, 'save', save_after_join):
+            response = self.owner_client.post('/api/team/update', {
+                'id': self.team_id, 'name': 'renamed', 'status': 2, 'password': '1234',
+            })
+        self.assertEqual(response.data['code'], 0)
+        team = Team.objects.get(id=self.team_id)
+        self.assertEqual((team.name, team.status, team.password, team.memberCount), ('renamed', 2, '1234', 2))
+
+    def test_delete_skips_team_deleted_concurrently(self):
+        self.member_client.post('/api/team/join', {'teamId': self.team_id})
+        team_filter = Team.objects.filter
+
+        def deleted_concurrently(*args, **kwargs):
+            # 视图读到队伍之后，另一个请求抢先解散了它
+            queryset = team_filter(*args, **kwargs)
+            if kwargs.get('isDelete') is False and 'userId' not in kwargs:
+                team_filter(id=self.team_id).update(isDelete=True)
+            return queryset
+
+        with mock.patch.object(Team.objects, 'filter', side_effect=deleted_concurrently):
+            response = self.owner_client.post('/api/team/delete', {'id': self.team_id})
+        self.assertEqual(response.data['code'], 0)
+        self.member.refresh_from_db()
+        self.assertEqual(self.member.joinTeamNum, 1)
+
+    def test_repair_member_counts(self):
+        Team.objects.filter(id=self.team_id).update(memberCount=7)
+        self.assertEqual(repair_member_counts(), 1)
+        self.assertEqual(self.member_count(), 1)
+        self.assertEqual(repair_member_counts(), 0)
+
+        User.objects.filter(id=self.owner.id).update(joinTeamNum=3)
+        self.assertEqual(repair_join_team_nums(), 1)
+        self.owner.refresh_from_db()
+        self.assertEqual(self.owner.joinTeamNum, 1)
+
+
+class SyntheticDataTest(TestCase):
+    """generate_data 生成的数据满足接口写入时的约束"""
+
+    def test_generate_users_and_teams(self):
+        self.assertEqual(list(generate_users(120, num_tags=50, batch_size=50)), [50, 100, 120])
+        self.assertEqual(User.objects.filter(username__startswith='synth').count(), 120)
+        self.assertTrue(User.objects.get(username='synth0').check_password('12345678'))
+        # 接着已有的最大序号编号，不与已有用户名冲突
+        User.objects.filter(username='synth50').delete()
+        User.objects.create(username='synthesis')
+        self.assertEqual(list(generate_users(5, num_tags=50)), [5])
+        self.assertTrue(User.objects.filter(username='synth124').exists())
+
+        list(generate_teams(60, batch_size=25))
+        self.assertEqual(repair_member_counts(dry_run=True), 0)
+        self.assertEqual(repair_join_team_nums(dry_run=True), 0)
+        self.assertFalse(User.objects.filter(joinTeamNum__gt=5).exists())
+        for team in Team.objects.all():
+            self.assertTrue(3 <= team.maxNum <= 10)
+            self.assertLessEqual(team.memberCount, team.maxNum)
+            self.assertEqual(team.status == 2, bool(team.password))
+            self.assertTrue(UserTeam.objects.filter(teamId=team, userId=team.userId_id).exists())
+
+
+class BenchRoutesTest(SimpleTestCase):
+    """bench_routes 的百分位数按最近秩法计算"""
+
+    def test_percentile_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual([percentile(values, p) for p in (50, 95, 99, 100)], [50, 95, 99, 100])
+        self.assertEqual(percentile([1, 2, 3], 50), 2)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertTrue(math.isnan(percentile([], 50)))
+
+
+class TeamJoinConcurrencyTest(TransactionTestCase):
+    """大量并发加入同一队伍时不会超员，单个用户不会超过加入上限"""
+
+    threads = 20
+
+    def run_concurrently(self, requests):
+        barrier = threading.Barrier(len(requests))
+        results = [None] * len(requests)
+
+        def worker(i, user, team_id):
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                barrier.wait()
+                results[i] = client.post('/api/team/join', {'teamId': team_id}).data
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(i, user, team_id))
+                   for i, (user, team_id) in enumerate(requests)]
+        for worker_thread in workers:
+            worker_thread.start()
+        for worker_thread in workers:
+            worker_thread.join()
+        return results
+
+    def test_team_is_never_overfilled(self):
+        owner = User.objects.create(username='owner', joinTeamNum=1)
+        team = Team.objects.create(name='hot', maxNum=5, userId=owner, memberCount=1)
+        UserTeam.objects.create(userId=owner, teamId=team)
+        users = [User.objects.create(username=f'joiner{i}') for i in range(self.threads)]
+
+        results = self.run_concurrently([(user, team.id) for user in users])
+
+        joined = [result for result in results if result['code'] == 0]
+        self.assertEqual(len(joined), 4)
+        self.assertTrue(all(result['message'] == '队伍已满' for result in results if result['code'] != 0))
+        team.refresh_from_db()
+        self.assertEqual(team.memberCount, 5)
+        self.assertEqual(UserTeam.objects.filter(teamId=team, isDelete=False).count(), 5)
+        # 被拒绝的用户名额已随事务回滚
+        self.assertEqual(User.objects.filter(joinTeamNum=1).count(), 5)
+
+    def test_user_join_limit(self):
+        owner = User.objects.create(username='owner')
+        user = User.objects.create(username='joiner')
+        teams = [Team.objects.create(name=f'team{i}', maxNum=5, userId=owner) for i in range(8)]
+
+        results = self.run_concurrently([(user, team.id) for team in teams])
+
+        self.assertEqual(sum(result['code'] == 0 for result in results), 5)
+        user.refresh_from_db()
+        self.assertEqual(user.joinTeamNum, 5)
+        self.assertEqual(UserTeam.objects.filter(userId=user, isDelete=False).count(), 5)
+
+
+def run_threads(count, target):
+    """count 个线程同时执行 target(i)，返回结果列表"""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def worker(i):
+        try:
+            barrier.wait()
+            results[i] = target(i)
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    return results
+
+
+class SingleFlightTest(SimpleTestCase):
+    """大量并发未命中时只重建一次"""
+
+    threads = 30
+
+    def setUp(self):
+        cache.clear()
+        self.computes = 0
+        self.lock = threading.Lock()
+
+    def slow_compute(self, value):
+        def compute():
+            with self.lock:
+                self.computes += 1
+            time.sleep(0.2)
+            return value
+        return compute
+
+    def test_concurrent_misses_compute_once(self):
+        results = run_threads(self.threads, lambda i: singleflight.get_or_compute(
+            'hot', self.slow_compute('fresh'), 60))
+        self.assertEqual(self.computes, 1)
+        self.assertEqual(results, ['fresh'] * self.threads)
+
+    def test_stale_while_revalidate(self):
+        singleflight.get_or_compute('hot', lambda: 'old', 0.01)
+        time.sleep(0.05)
+        results = run_threads(self.threads, lambda i: singleflight.get_or_compute(
+            'hot', self.slow_compute('new'), 60))
+        # 一个请求重建，其余直接拿旧值，不等待
+        self.assertEqual(self.computes, 1)
+        self.assertEqual(results.count('new'), 1)
+        self.assertEqual(results.count('old'), self.threads - 1)
+        self.assertEqual(singleflight.get_or_compute('hot', self.slow_compute('newer'), 60), 'new')
+
+    def test_wait_for_lease_held_in_cache(self):
+        # 租约已在缓存中（由别的持有者写入），本进程的线程等待写回而不是自己计算
+        cache.add('hot:lease', 'other-process', timeout=10)
+        config = singleflight.get_config()
+        timer = threading.Timer(0.2, singleflight._compute, args=('hot', lambda: 'remote', 60, config))
+        timer.start()
+        results = run_threads(5, lambda i: singleflight.get_or_compute('hot', self.slow_compute('local'), 60))
+        timer.join()
+        self.assertEqual(self.computes, 0)
+        self.assertEqual(results, ['remote'] * 5)
+
+
+def _rebuild_in_child(ready):
+    """在子进程中持有租约，稍后写回"""
+    config = singleflight.get_config()
+    token = singleflight._acquire_lease('hot', config)
+    ready.set()
+    time.sleep(0.3)
+    singleflight._compute('hot', lambda: 'remote', 60, config)
+    singleflight._release_lease('hot', token)
+
+
+@unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(), '需要 fork')
+class SingleFlightAcrossProcessesTest(SimpleTestCase):
+    """租约跨进程生效的前提是缓存在进程间共享"""
+
+    def rebuild_elsewhere(self):
+        ready = multiprocessing.get_context('fork').Event()
+        child = multiprocessing.get_context('fork').Process(target=_rebuild_in_child, args=(ready,))
+        child.start()
+        self.assertTrue(ready.wait(5))
+        computes = []
+        try:
+            return singleflight.get_or_compute('hot', lambda: computes.append(1) or 'local', 60), computes
+        finally:
+            child.join(5)
+
+    def test_shared_cache_waits_for_other_process(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory,
+        }}):
+            self.assertEqual(self.rebuild_elsewhere(), ('remote', []))
+
+    def test_process_local_cache_does_not_coordinate(self):
+        # 进程内缓存看不到子进程的租约，本进程自己计算
+        cache.clear()
+        self.assertEqual(self.rebuild_elsewhere(), ('local', [1]))
+
+
+class TeamListStampedeTest(TransactionTestCase):
+    """队伍列表缓存失效后大量并发请求只查一次库"""
+
+    def test_concurrent_list_requests_build_once(self):
+        cache.clear()
+        owner = User.objects.create(username='owner')
+        for i in range(5):
+            Team.objects.create(name=f'team{i}', maxNum=5, memberCount=1, userId=owner)
+        users = [User.objects.create(username=f'poller{i}') for i in range(20)]
+        build = TeamListView.build
+        calls = []
+
+        def slow_build(view, *args):
+            calls.append(args)
+            time.sleep(0.2)
+            return build(view, *args)
+
+        def poll(i):
+            client = APIClient()
+            client.force_authenticate(users[i])
+            return client.get('/api/team/list').data
+
+        with mock.patch.object(TeamListView, 'build', slow_build):
+            results = run_threads(len(users), poll)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result['code'] == 0 and len(result['date']) == 5 for result in results))
+
+
+@override_settings(ROOT_URLCONF='team.tests')
+class TeamAsyncViewTest(TestCase):
+    """异步队伍接口与同步版本返回相同的数据"""
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create(username='async_owner')
+        self.member = User.objects.create(username='async_member')
+        self.teams = [
+            Team.objects.create(name=f'async{i}', maxNum=5, userId=self.owner, status=0)
+            for i in range(3)
+        ]
+        UserTeam.objects.create(userId=self.member, teamId=self.teams[1], joinTime=timezone.now())
+        invalidate_team_lists()
+
+    def sync_get(self, url, params):
+        client = APIClient()
+        client.force_authenticate(self.member)
+        with self.settings(ROOT_URLCONF='backend.urls'):
+            return client.get(url, params)
+
+    async def test_list_matches_sync(self):
+        await self.async_client.aforce_login(self.member)
+        for params in [{}, {'pageSize': 2}, {'searchText': 'async', 'sortBy': 'relevance'}]:
+            response = await self.async_client.get('/api/team/list', params)
+            expected = await sync_to_async(self.sync_get)('/api/team/list', params)
+            self.assertEqual(response.json(), expected.data)
+
+            response = await self.async_client.get(
+                '/api/team/list', params, headers={'If-None-Match': response['ETag']})
+            self.assertEqual(response.status_code, 304)
+
+        response = await self.async_client.get('/api/team/list', {'sortBy': 'hot'})
+        self.assertEqual(response.json()['message'], '排序方式错误')
+
+    async def test_list_requests_overlap(self):
+        # 两个请求的重建要同时进行才能都通过栅栏；经过共用的同步线程时会依次执行而超时
+        barrier = threading.Barrier(2, timeout=5)
+        threads = set()
+
+        def build(view, *args):
+            threads.add(threading.get_ident())
+            barrier.wait()
+            return [], None
+
+        await self.async_client.aforce_login(self.member)
+        with mock.patch.object(TeamListView, 'build', build):
+            responses = await asyncio.gather(
+                self.async_client.get('/api/team/list', {'status': 0}),
+                self.async_client.get('/api/team/list', {'status': 2}),
+            )
+        self.assertEqual([response.json()['code'] for response in responses], [0, 0])
+        self.assertEqual(len(threads), 2)
+
+        # 命中缓存时不经过线程
+        with mock.patch('backend.singleflight.sync_to_async') as to_thread:
+            response = await self.async_client.get('/api/team/list', {'status': 0})
+        self.assertEqual(response.json()['code'], 0)
+        to_thread.assert_not_called()
+
+    async def test_get_owner_only(self):
+        team = self.teams[0]
+        await self.async_client.aforce_login(self.member)
+        response = await self.async_client.get('/api/team/get', {'id': team.id})
+        self.assertEqual(response.json()['message'], '无权限')
+
+        await self.async_client.aforce_login(self.owner)
+        response = await self.async_client.get('/api/team/get', {'id': team.id})
+        self.assertEqual(response.json()['date'], TeamSerializer(team).data)
+        response = await self.async_client.get('/api/team/get', {'id': 0})
+        self.assertEqual(response.json()['message'], '队伍不存在')
+
+
+@override_settings(QUERY_BUDGET={'ENABLED': True, 'ACTION': 'raise', 'N_PLUS_ONE': 3})
+class RouteQueryBudgetTest(TestCase):
+    """每个路由都声明了查询预算，并在有多条记录的数据上不超预算、没有 N+1"""
+
+    def setUp(self):
+        cache.clear()
+        username_index.reset()
+        self.owner = User.objects.create_user(username='budget_owner', password='12345678', tags=['Java'])
+        self.members = [User.objects.create(username=f'budget{i}', tags=['Java', 'Python']) for i in range(5)]
+        self.teams = [Team.objects.create(name=f'budget{i}', description='desc', maxNum=10, userId=self.owner,
+                                          memberCount=len(self.members) + 1,
+                                          expireTime=timezone.now() + datetime.timedelta(days=1))
+                      for i in range(3)]
+        for team in self.teams:
+            UserTeam.objects.bulk_create([UserTeam(userId=user, teamId=team)
+                                          for user in [self.owner, *self.members]])
+        User.objects.filter(id__in=[user.id for user in self.members]).update(joinTeamNum=len(self.teams))
+        User.objects.filter(id=self.owner.id).update(joinTeamNum=len(self.teams))
+        self.open_team = Team.objects.create(name='budget_open', maxNum=10, userId=self.members[0],
+                                             memberCount=1, expireTime=timezone.now() + datetime.timedelta(days=1))
+        UserTeam.objects.create(userId=self.members[0], teamId=self.open_team)
+        self.owner.refresh_from_db()
+        invalidate_team_lists()
+
+    def routes(self):
+        """(路由, 方法, 参数, 是否登录)，与 urls.py 中的路由一一对应"""
+        team_id = self.teams[0].id
+        expire = (timezone.now() + datetime.timedelta(days=2)).isoformat()
+        return [
+            ('api/user/register', 'post', {'userAccount': 'budget_new', 'userPassword': '12345678',
+                                           'checkPassword': '12345678', 'username': 'n', 'phone': '1'}, False),
+            ('api/user/account/exist', 'post', {'userAccount': 'budget_owner'}, False),
+            ('api/user/login', 'post', {'userAccount': 'budget_owner', 'userPassword': '12345678'}, False),
+            ('api/user/current', 'get', {}, True),
+            ('api/user/recommend', 'get', {'pageSize': 10, 'pageNum': 1}, True),
+            ('api/user/match', 'get', {'num': 5}, True),
+            ('api/user/update', 'post', {'id': self.owner.id, 'profile': 'new'}, True),
+            ('api/user/search/tags', 'get', {'tagNameList': ['Java', 'Python'], 'mode': 'or'}, False),
+            ('api/team/add', 'post', {'name': 'added', 'description': 'd', 'expireTime': expire,
+                                      'maxNum': 5, 'status': 0}, True),
+            ('api/team/list', 'get', {'pageSize': 10}, True),
+            ('api/team/list/my/join', 'get', {}, True),
+            ('api/team/list/my/create', 'get', {}, True),
+            ('api/team/get', 'get', {'id': team_id}, True),
+            ('api/team/update', 'post', {'id': team_id, 'name': 'renamed', 'description': 'd',
+                                         'expireTime': expire, 'status': 0}, True),
+            ('api/team/join', 'post', {'teamId': self.open_team.id}, True),
+            ('api/team/quit', 'post', {'teamId': self.open_team.id}, True),
+            ('api/team/delete', 'post', {'id': team_id}, True),
+            ('api/user/logout', 'post', {}, True),
+        ]
+
+    def request(self, route, method, data, login):
+        client = APIClient()
+        if login:
+            client.force_login(self.owner)
+        # 预算按冷缓存计：会话、用户、片段缓存都不命中时的查询数
+        cache.clear()
+        local_sessions.clear()
+        user_cache.clear()
+        fragment_cache.clear()
+        if method == 'get':
+            response = client.get(f'/{route}', data)
+        else:
+            response = client.post(f'/{route}', data, format='json')
+        self.assertEqual(response.status_code, 200, route)
+        self.assertEqual(response.json()['code'], 0, (route, response.json()))
+
+    def test_every_route_has_budget(self):
+        patterns = [*user_urls.urlpatterns, *user_urls.async_urlpatterns,
+                    *team_urls.urlpatterns, *team_urls.async_urlpatterns]
+        for pattern in patterns:
+            self.assertIsInstance(getattr(pattern.callback.view_class, 'query_budget', None), int, pattern)
+
+        covered = {route for route, *_ in self.routes()}
+        declared = {f'api/user/{pattern.pattern}' for pattern in user_urls.urlpatterns}
+        declared |= {f'api/team/{pattern.pattern}' for pattern in team_urls.urlpatterns}
+        self.assertEqual(covered, declared)
+
+    def test_sync_routes(self):
+        for route, method, data, login in self.routes():
+            with self.subTest(route=route):
+                self.request(route, method, data, login)
+
+    def test_async_routes(self):
+        async_routes = {f'api/user/{pattern.pattern}' for pattern in user_urls.async_urlpatterns}
+        async_routes |= {f'api/team/{pattern.pattern}' for pattern in team_urls.async_urlpatterns}
+        for route, method, data, login in self.routes():
+            if route in async_routes:
+                urlconf = 'user.tests' if route.startswith('api/user/') else 'team.tests'
+                with self.subTest(route=route), self.settings(ROOT_URLCONF=urlconf):
+                    self.request(route, method, data, login)
+
+    def test_detects_n_plus_one(self):
+        # 模拟退化成逐行查询创建人的序列化
+        def serialize(rows):
+            return [{'id': row['id'], 'creator': User.objects.get(id=row['userId']).username} for row in rows]
+
+        with mock.patch.object(TeamListView, 'query_budget', 100), \
+                mock.patch('team.views.TEAM_ROWS.serialize', serialize):
+            with self.assertRaisesMessage(query_budget.QueryBudgetExceeded, '疑似 N+1') as raised:
+                self.request('api/team/list', 'get', {}, True)
+        self.assertIn('team/tests.py', str(raised.exception))
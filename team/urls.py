@@ -1,5 +1,6 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('add', views.TeamAddView.as_view()),
@@ -11,4 +12,13 @@ urlpatterns = [
     path('delete', views.TeamDeleteView.as_view()), 
     path('get', views.TeamGetView.as_view()),
     path('update', views.TeamUpdateView.as_view()),
-]
\ No newline at end of file
+]
+
+# 异步版本，ASGI 部署（settings.ASYNC_VIEWS）时排在前面优先匹配
+async_urlpatterns = [
+    path('list', async_views.TeamListView.as_view()),
+    path('get', async_views.TeamGetView.as_view()),
+]
+
+if settings.ASYNC_VIEWS:
+    urlpatterns = async_urlpatterns + urlpatterns
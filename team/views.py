@@ -2,15 +2,83 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.utils import timezone
 from .models import Team, UserTeam
-from .serializers import TeamSerializer
+from user.models import User
+from backend.pagination import order_by, page_size_param, paginate
+from .list_cache import etag, get_or_build, invalidate_team_lists
+from .search import index_team, search
+from .serializers import TEAM_ROWS, TeamSerializer
 import datetime
 from django.core.paginator import Paginator
-from django.db.models import Q
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def team_queryset(query):
+    """队伍列表查询集：一次查询带出创建人，当前人数直接读 memberCount"""
+    return Team.objects.filter(query).select_related('userId')
+
+
+def joined_team_ids(user):
+    """用户已加入（未退出）的队伍ID集合"""
+    if not user.is_authenticated:
+        return set()
+    return set(UserTeam.objects.filter(
+        userId=user,
+        isDelete=False
+    ).values_list('teamId', flat=True))
+
+
+# 每个用户最多加入的队伍数
+MAX_JOIN_TEAM_NUM = 5
+
+# 队伍列表排序方式 -> 游标分页的排序键（最后一个键唯一），前三种均有对应的联合索引
+TEAM_LIST_SORTS = {
+    'new': ['-createTime', '-id'],
+    'expire': ['expireTime', 'createTime', 'id'],
+    'slots': ['-freeNum', 'id'],
+    # 按搜索相关度排序，只能在传了 searchText 时使用
+    'relevance': ['-searchRank', '-id'],
+}
+TEAM_LIST_MAX_PAGE_SIZE = 100
+
+
+class JoinRejected(Exception):
+    """加入队伍被拒绝，异常信息即返回给前端的提示"""
+
+
+def admit_member(user, team):
+    """用条件更新占用用户和队伍的名额，必须在事务中调用
+
+    UPDATE ... WHERE 计数 < 上限 在数据库中原子完成检查和递增，并发加入时不会超员，
+    也不需要先读再写或加锁；任一名额不足时抛出 JoinRejected，由外层事务回滚。
+
+    加入、退出、解散队伍的事务都按 队伍 -> 用户 -> 成员记录 的顺序加锁（调用方
+    在此之后再写成员记录），并发时不会互相等待成环而死锁。
+    """
+    if not Team.objects.filter(
+        id=team.id,
+        isDelete=False,
+        memberCount__lt=F('maxNum')
+    ).update(memberCount=F('memberCount') + 1):
+        raise JoinRejected('队伍已满')
+    if not User.objects.filter(
+        id=user.id,
+        joinTeamNum__lt=MAX_JOIN_TEAM_NUM
+    ).update(joinTeamNum=F('joinTeamNum') + 1):
+        raise JoinRejected(f'最多加入{MAX_JOIN_TEAM_NUM}个队伍')
+
 
 class TeamAddView(APIView):
+    query_budget = 8
     def post(self, request):
         try:
-            print("Received data:", request.data)
+            # 队伍密码不写入日志
+            logger.debug('创建队伍请求: %s', {key: value for key, value in request.data.items() if key != 'password'})
             data = request.data.copy()
             
             # 检查用户是否登录
@@ -65,16 +133,19 @@ class TeamAddView(APIView):
                     'message': '加密房间必须设置密码'
                 })
             
-            print("Creating team with data:", team_data)
+            logger.debug('创建队伍数据: %s', {key: value for key, value in team_data.items() if key != 'password'})
             serializer = TeamSerializer(data=team_data)
             if serializer.is_valid():
-                team = serializer.save()
-                
-                # 创建者加入队伍
-                UserTeam.objects.create(
-                    userId=request.user,
-                    teamId=team
-                )
+                with transaction.atomic():
+                    # 创建者加入队伍，人数从1开始
+                    User.objects.filter(id=request.user.id).update(joinTeamNum=F('joinTeamNum') + 1)
+                    team = serializer.save(memberCount=1)
+                    index_team(team)
+                    UserTeam.objects.create(
+                        userId=request.user,
+                        teamId=team
+                    )
+                    invalidate_team_lists()
                 
                 return Response({
                     'code': 0,
@@ -82,7 +153,7 @@ class TeamAddView(APIView):
                     'message': '创建成功'
                 })
             else:
-                print("Serializer errors:", serializer.errors)
+                logger.debug('创建队伍校验失败: %s', serializer.errors)
                 return Response({
                     'code': 40000,
                     'date': None,
@@ -90,9 +161,7 @@ class TeamAddView(APIView):
                 })
                 
         except Exception as e:
-            import traceback
-            print("Error:", str(e))
-            print("Traceback:", traceback.format_exc())
+            logger.exception('创建队伍失败')
             return Response({
                 'code': 40000,
                 'date': None,
@@ -100,63 +169,108 @@ class TeamAddView(APIView):
             })
         
 class TeamListView(APIView):
+    query_budget = 4
     def get(self, request):
         try:
             # 获取请求参数
             search_text = request.GET.get('searchText', '')
             status = int(request.GET.get('status', 0))  # 0-公开，2-加密
             
-            # 构建查询条件
-            query = Q(isDelete=False)
-            
-            # 状态过滤
-            query &= Q(status=status)
-            
-            # 搜索过滤
-            if search_text:
-                query &= (Q(name__icontains=search_text) | 
-                         Q(description__icontains=search_text))
-            
-            # 过期时间过滤
-            query &= (Q(expireTime__isnull=True) | 
-                     Q(expireTime__gt=timezone.now()))
+            # 排序方式：new-最新创建（默认），expire-即将过期，slots-空位最多，relevance-相关度
+            sort_by = request.GET.get('sortBy', 'new')
+            if sort_by not in TEAM_LIST_SORTS:
+                return Response({
+                    'code': 40000,
+                    'date': [],
+                    'message': '排序方式错误'
+                })
+            if sort_by == 'relevance' and not search_text:
+                return Response({
+                    'code': 40000,
+                    'date': [],
+                    'message': '按相关度排序需要输入搜索关键词'
+                })
             
-            # 执行查询
-            teams = Team.objects.filter(query).order_by('-createTime')
+            # 传了pageSize或cursor时使用游标分页，否则返回全部（兼容旧版前端）
+            paged = 'pageSize' in request.GET or 'cursor' in request.GET
+            page_size = page_size_param(request.GET.get('pageSize'), 20, TEAM_LIST_MAX_PAGE_SIZE) if paged else None
+            cursor = request.GET.get('cursor')
             
-            # 序列化
-            team_list = []
-            for team in teams:
-                team_data = TeamSerializer(team).data
-                # 获取队伍当前人数
-                team_data['hasJoinNum'] = team.userteam_set.filter(isDelete=False).count()
-                # 添加当前用户是否已加入
-                if request.user.is_authenticated:
-                    team_data['hasJoin'] = UserTeam.objects.filter(
-                        userId=request.user,
-                        teamId=team,
-                        isDelete=False
-                    ).exists()
-                else:
-                    team_data['hasJoin'] = False
-                team_list.append(team_data)
+            # 所有用户共享的部分走缓存，未变化的轮询直接返回304
+            gen, entry = get_or_build(
+                [status, search_text, sort_by, paged, page_size, cursor],
+                lambda: self.build(status, search_text, sort_by, paged, page_size, cursor),
+            )
+            tag = etag(gen, entry, request.user)
+            if tag in parse_etags(request.headers.get('If-None-Match', '')):
+                response = HttpResponseNotModified()
+                response['ETag'] = tag
+                return response
+            
+            # 当前用户已加入的队伍，一次查询，叠加到共享的记录上
+            joined_ids = joined_team_ids(request.user)
+            team_list = [
+                {**team_data, 'hasJoin': team_data['id'] in joined_ids}
+                for team_data in (entry['date']['records'] if paged else entry['date'])
+            ]
             
             return Response({
                 'code': 0,
-                'date': team_list,
+                'date': {'records': team_list, 'nextCursor': entry['date']['nextCursor']} if paged else team_list,
                 'message': '获取成功'
-            })
+            }, headers={'ETag': tag})
             
         except Exception as e:
-            print(f"List team error: {str(e)}")
+            logger.exception('队伍列表查询失败')
             return Response({
                 'code': 40000,
                 'date': [],
                 'message': str(e)
             })
 
+    def build(self, status, search_text, sort_by, paged, page_size, cursor):
+        """查询并序列化列表中与用户无关的部分，返回 (数据, 有效期截止时间)"""
+        # 构建查询条件（isDelete 写成 IN：SQLite 会把 isDelete=False 编译成
+        # NOT isDelete，不能作为联合索引的等值前缀）
+        query = Q(isDelete__in=[False])
+        
+        # 状态过滤
+        query &= Q(status=status)
+        
+        # 过期时间过滤
+        query &= (Q(expireTime__isnull=True) | 
+                 Q(expireTime__gt=timezone.now()))
+        
+        ordering = TEAM_LIST_SORTS[sort_by]
+        teams = team_queryset(query).annotate(freeNum=F('maxNum') - F('memberCount'))
+        
+        # 搜索过滤（全文索引），按相关度排序时注解 searchRank
+        if search_text:
+            teams = search(teams, search_text, rank=sort_by == 'relevance')
+        
+        # 只取序列化和游标需要的列
+        teams = teams.values(*TEAM_ROWS.keys(), *(name.lstrip('-') for name in ordering))
+        
+        next_cursor = None
+        if paged:
+            teams, next_cursor = paginate(
+                teams, ordering, page_size,
+                cursor=cursor, salt=f'team.list.{sort_by}',
+            )
+        else:
+            teams = list(teams.order_by(*order_by(Team, ordering)))
+        
+        # 本页最早过期的队伍过期后缓存失效
+        expire_times = [team['expireTime'] for team in teams if team['expireTime'] is not None]
+        valid_until = min(expire_times) if expire_times else None
+        
+        # 序列化（快速路径）
+        team_list = TEAM_ROWS.serialize(teams)
+        return ({'records': team_list, 'nextCursor': next_cursor} if paged else team_list), valid_until
+
 
 class TeamListMyJoinView(APIView):
+    query_budget = 3
     def get(self, request):
         try:
             # 检查用户是否登录
@@ -179,25 +293,24 @@ class TeamListMyJoinView(APIView):
             # 构建查询条件
             query = Q(id__in=user_team_ids, isDelete=False)
             
-            # 搜索过滤
-            if search_text:
-                query &= (Q(name__icontains=search_text) | 
-                         Q(description__icontains=search_text))
-            
             # 过期时间过滤
             query &= (Q(expireTime__isnull=True) | 
                      Q(expireTime__gt=timezone.now()))
             
-            # 执行查询
-            teams = Team.objects.filter(query).order_by('-createTime')
+            # 执行查询，搜索时可传 sortBy=relevance 按相关度排序
+            teams = team_queryset(query)
+            by_relevance = bool(search_text) and request.GET.get('sortBy') == 'relevance'
+            if search_text:
+                teams = search(teams, search_text, rank=by_relevance)
+            if by_relevance:
+                teams = teams.order_by('-searchRank', '-createTime')
+            else:
+                teams = teams.order_by('-createTime')
             
-            # 序列化
-            team_list = []
-            for team in teams:
-                team_data = TeamSerializer(team).data
-                team_data['hasJoinNum'] = team.userteam_set.filter(isDelete=False).count()
+            # 序列化（快速路径）
+            team_list = TEAM_ROWS.serialize(teams.values(*TEAM_ROWS.keys()))
+            for team_data in team_list:
                 team_data['hasJoin'] = True  # 这是用户加入的队伍列表，所以一定是已加入的
-                team_list.append(team_data)
             
             return Response({
                 'code': 0,
@@ -206,7 +319,7 @@ class TeamListMyJoinView(APIView):
             })
             
         except Exception as e:
-            print(f"List my join teams error: {str(e)}")
+            logger.exception('查询已加入队伍失败')
             return Response({
                 'code': 40000,
                 'date': [],
@@ -215,6 +328,7 @@ class TeamListMyJoinView(APIView):
 
 
 class TeamJoinView(APIView):
+    query_budget = 7
     def post(self, request):
         try:
             # 检查用户是否登录
@@ -229,7 +343,8 @@ class TeamJoinView(APIView):
             team_id = request.data.get('teamId')
             password = request.data.get('password', '')
 
-            print(f"Attempting to join team {team_id} with password: {password}")
+            # 不记录密码
+            logger.debug('用户 %s 加入队伍 %s', request.user.id, team_id)
 
             # 查询队伍
             try:
@@ -264,21 +379,7 @@ class TeamJoinView(APIView):
                         'message': '你已经是队伍成员了'
                     })
                 else:
-                    # 如果是已退出的记录，检查是否可以重新加入
-                    # 检查队伍人数
-                    current_num = UserTeam.objects.filter(
-                        teamId=team,
-                        isDelete=False
-                    ).count()
-                    
-                    if current_num >= team.maxNum:
-                        return Response({
-                            'code': 40000,
-                            'date': None,
-                            'message': '队伍已满'
-                        })
-                    
-                    # 检查加密队伍密码
+                    # 如果是已退出的记录，检查加密队伍密码后重新加入
                     if team.status == 2:
                         if not password:
                             return Response({
@@ -293,41 +394,29 @@ class TeamJoinView(APIView):
                                 'message': '密码错误'
                             })
                     
-                    # 重新激活记录
-                    existing_membership.isDelete = False
-                    existing_membership.save()
+                    # 占用名额并重新激活记录
+                    try:
+                        with transaction.atomic():
+                            admit_member(request.user, team)
+                            reactivated = UserTeam.objects.filter(
+                                id=existing_membership.id,
+                                isDelete=True
+                            ).update(isDelete=False)
+                            if not reactivated:
+                                raise JoinRejected('你已经是队伍成员了')
+                            invalidate_team_lists()
+                    except JoinRejected as e:
+                        return Response({
+                            'code': 40000,
+                            'date': None,
+                            'message': str(e)
+                        })
                     return Response({
                         'code': 0,
                         'date': True,
                         'message': '加入成功'
                     })
 
-            # 检查队伍人数限制
-            current_num = UserTeam.objects.filter(
-                teamId=team,
-                isDelete=False
-            ).count()
-            
-            if current_num >= team.maxNum:
-                return Response({
-                    'code': 40000,
-                    'date': None,
-                    'message': '队伍已满'
-                })
-
-            # 检查用户加入的队伍数量限制
-            user_team_count = UserTeam.objects.filter(
-                userId=request.user,
-                isDelete=False
-            ).count()
-            
-            if user_team_count >= 5:
-                return Response({
-                    'code': 40000,
-                    'date': None,
-                    'message': '最多加入5个队伍'
-                })
-
             # 检查队伍状态和密码
             if team.status == 2:  # 加密
                 if not password:
@@ -349,13 +438,30 @@ class TeamJoinView(APIView):
                     'message': '禁止加入私有队伍'
                 })
 
-            # 创建新的加入记录
-            UserTeam.objects.create(
-                userId=request.user,
-                teamId=team
-            )
+            # 占用名额并创建新的加入记录
+            try:
+                with transaction.atomic():
+                    admit_member(request.user, team)
+                    UserTeam.objects.create(
+                        userId=request.user,
+                        teamId=team
+                    )
+                    invalidate_team_lists()
+            except JoinRejected as e:
+                return Response({
+                    'code': 40000,
+                    'date': None,
+                    'message': str(e)
+                })
+            except IntegrityError:
+                # 并发重复加入，被 (userId, teamId) 唯一索引拦下
+                return Response({
+                    'code': 40000,
+                    'date': None,
+                    'message': '你已经是队伍成员了'
+                })
 
-            print(f"Successfully joined team {team_id}")
+            logger.info('用户 %s 加入了队伍 %s', request.user.id, team_id)
 
             return Response({
                 'code': 0,
@@ -364,9 +470,7 @@ class TeamJoinView(APIView):
             })
 
         except Exception as e:
-            print(f"Join team error: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
+            logger.exception('加入队伍失败')
             return Response({
                 'code': 40000,
                 'date': None,
@@ -374,6 +478,7 @@ class TeamJoinView(APIView):
             })
 
 class TeamListMyCreateView(APIView):
+    query_budget = 3
     def get(self, request):
         try:
             # 检查用户是否登录
@@ -390,25 +495,24 @@ class TeamListMyCreateView(APIView):
             # 构建查询条件
             query = Q(userId=request.user, isDelete=False)
             
-            # 搜索过滤
-            if search_text:
-                query &= (Q(name__icontains=search_text) | 
-                         Q(description__icontains=search_text))
-            
             # 过期时间过滤（可选，看是否需要显示已过期的队伍）
             # query &= (Q(expireTime__isnull=True) | 
             #          Q(expireTime__gt=timezone.now()))
             
-            # 执行查询
-            teams = Team.objects.filter(query).order_by('-createTime')
+            # 执行查询，搜索时可传 sortBy=relevance 按相关度排序
+            teams = team_queryset(query)
+            by_relevance = bool(search_text) and request.GET.get('sortBy') == 'relevance'
+            if search_text:
+                teams = search(teams, search_text, rank=by_relevance)
+            if by_relevance:
+                teams = teams.order_by('-searchRank', '-createTime')
+            else:
+                teams = teams.order_by('-createTime')
             
-            # 序列化
-            team_list = []
-            for team in teams:
-                team_data = TeamSerializer(team).data
-                team_data['hasJoinNum'] = team.userteam_set.filter(isDelete=False).count()
+            # 序列化（快速路径）
+            team_list = TEAM_ROWS.serialize(teams.values(*TEAM_ROWS.keys()))
+            for team_data in team_list:
                 team_data['hasJoin'] = True  # 创建者也是队伍成员
-                team_list.append(team_data)
             
             return Response({
                 'code': 0,
@@ -417,7 +521,7 @@ class TeamListMyCreateView(APIView):
             })
             
         except Exception as e:
-            print(f"List my create teams error: {str(e)}")
+            logger.exception('查询创建的队伍失败')
             return Response({
                 'code': 40000,
                 'date': [],
@@ -426,6 +530,7 @@ class TeamListMyCreateView(APIView):
 
 # 添加退出队伍的视图
 class TeamQuitView(APIView):
+    query_budget = 8
     def post(self, request):
         try:
             if not request.user.is_authenticated:
@@ -465,9 +570,19 @@ class TeamQuitView(APIView):
                     'message': '创建者不能退出队伍'
                 })
 
-            # 软删除用户队伍关系
-            user_team.isDelete = True
-            user_team.save()
+            # 释放名额并软删除用户队伍关系，加锁顺序与 admit_member 一致；
+            # 只有真正退出的请求才释放名额，并发的重复退出整体回滚
+            with transaction.atomic():
+                Team.objects.filter(id=user_team.teamId_id).update(memberCount=F('memberCount') - 1)
+                User.objects.filter(id=request.user.id).update(joinTeamNum=F('joinTeamNum') - 1)
+                if not UserTeam.objects.filter(id=user_team.id, isDelete=False).update(isDelete=True):
+                    transaction.set_rollback(True)
+                    return Response({
+                        'code': 40000,
+                        'date': None,
+                        'message': '未加入该队伍'
+                    })
+                invalidate_team_lists()
 
             return Response({
                 'code': 0,
@@ -476,7 +591,7 @@ class TeamQuitView(APIView):
             })
 
         except Exception as e:
-            print(f"Quit team error: {str(e)}")
+            logger.exception('退出队伍失败')
             return Response({
                 'code': 40000,
                 'date': None,
@@ -485,6 +600,7 @@ class TeamQuitView(APIView):
 
 # 添加解散队伍的视图
 class TeamDeleteView(APIView):
+    query_budget = 7
     def post(self, request):
         try:
             if not request.user.is_authenticated:
@@ -516,12 +632,21 @@ class TeamDeleteView(APIView):
                     'message': '队伍不存在或无权限'
                 })
 
-            # 软删除队伍
-            team.isDelete = True
-            team.save()
+            with transaction.atomic():
+                # 软删除队伍：只更新这两个字段，不写回之前读到的整行（其间可能有人加入）；
+                # 已被并发解散的不再重复释放名额
+                deleted = Team.objects.filter(id=team.id, isDelete=False).update(
+                    isDelete=True, memberCount=0, updateTime=timezone.now(),
+                )
 
-            # 软删除所有队伍关系
-            UserTeam.objects.filter(teamId=team).update(isDelete=True)
+                # 释放成员的加入名额，并软删除所有队伍关系（加锁顺序与 admit_member 一致）。
+                # 加入和退出都先锁队伍，持有队伍行锁期间成员不会变化
+                if deleted:
+                    memberships = UserTeam.objects.filter(teamId=team, isDelete=False)
+                    member_ids = list(memberships.values_list('userId', flat=True))
+                    User.objects.filter(id__in=member_ids).update(joinTeamNum=F('joinTeamNum') - 1)
+                    memberships.update(isDelete=True)
+                    invalidate_team_lists()
 
             return Response({
                 'code': 0,
@@ -530,7 +655,7 @@ class TeamDeleteView(APIView):
             })
 
         except Exception as e:
-            print(f"Delete team error: {str(e)}")
+            logger.exception('解散队伍失败')
             return Response({
                 'code': 40000,
                 'date': None,
@@ -538,6 +663,7 @@ class TeamDeleteView(APIView):
             })
 
 class TeamGetView(APIView):
+    query_budget = 4
     def get(self, request):
         try:
             # 获取队伍ID
@@ -577,7 +703,7 @@ class TeamGetView(APIView):
             })
 
         except Exception as e:
-            print(f"Get team error: {str(e)}")
+            logger.exception('查询队伍失败')
             return Response({
                 'code': 40000,
                 'date': None,
@@ -585,6 +711,7 @@ class TeamGetView(APIView):
             })
 
 class TeamUpdateView(APIView):
+    query_budget = 7
     def post(self, request):
         try:
             data = request.data
@@ -627,17 +754,18 @@ class TeamUpdateView(APIView):
                 })
 
             # 更新字段
-            update_fields = ['name', 'description', 'expireTime', 'status']
-            for field in update_fields:
+            changed = []
+            for field in ['name', 'description', 'expireTime', 'status', 'password']:
                 if field in data:
                     setattr(team, field, data[field])
-            
-            # 特殊处理密码字段
-            if 'password' in data:
-                team.password = data['password']
+                    changed.append(field)
 
-            # 保存更新
-            team.save()
+            # 保存更新，同步检索索引，作废列表缓存。只写修改过的字段，
+            # 不会用读到的旧 memberCount 覆盖期间并发加入、退出的计数
+            with transaction.atomic():
+                team.save(update_fields=changed + ['updateTime'])
+                index_team(team)
+                invalidate_team_lists()
 
             return Response({
                 'code': 0,
@@ -646,9 +774,7 @@ class TeamUpdateView(APIView):
             })
 
         except Exception as e:
-            print(f"Update team error: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
+            logger.exception('更新队伍失败')
             return Response({
                 'code': 40000,
                 'date': None,
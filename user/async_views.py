@@ -0,0 +1,189 @@
+# user/async_views.py
+"""用户接口的异步版本（ASGI 部署时启用，见 settings.ASYNC_VIEWS）
+
+与 views.py 中同名视图的请求、响应格式一致。数据库访问使用异步 ORM，
+密码哈希交给 backend.hashing 的进程池，等待期间不占用事件循环。
+"""
+from django.contrib.auth import alogin, alogout
+from rest_framework.exceptions import AuthenticationFailed
+
+from backend.asyncapi import AsyncAPIView, json_response
+from backend.hashing import HashingBusy, acheck_user_password, amake_password
+from .auth import aauthenticate_token, arevoke_token, get_config as get_token_config, issue_token
+from .bloom import username_index
+from .models import User
+from .serializers import UserSerializer
+
+
+class UserLoginView(AsyncAPIView):
+    query_budget = 6  # 旧哈希升级时多一次保存密码
+    authenticate = False  # 登录接口不需要认证
+    login_required = False
+
+    async def post(self, request):
+        userAccount = request.data.get('userAccount')
+        userPassword = request.data.get('userPassword')
+
+        try:
+            user = await User.objects.aget(username=userAccount)
+        except User.DoesNotExist:
+            return json_response({
+                'code': 40000,
+                'data': None,
+                'message': '用户不存在'
+            })
+
+        try:
+            verified = await acheck_user_password(user, userPassword)
+        except HashingBusy as e:
+            return json_response({
+                'code': 50300,
+                'data': None,
+                'message': str(e)
+            })
+
+        if verified:
+            await alogin(request, user)
+            response = {
+                'code': 0,
+                'data': UserSerializer(user).data
+            }
+            if get_token_config()['ENABLED']:
+                response['token'] = issue_token(user)
+            return json_response(response)
+        return json_response({
+            'code': 40000,
+            'data': None,
+            'message': '密码错误'
+        })
+
+
+class UserLogoutView(AsyncAPIView):
+    query_budget = 4
+    authenticate = False
+    login_required = False
+
+    async def post(self, request):
+        try:
+            # 用有效令牌登录的，只作废本次携带的令牌；令牌无效时照常退出登录
+            try:
+                authenticated = await aauthenticate_token(request)
+            except AuthenticationFailed:
+                authenticated = None
+            if authenticated is not None:
+                await arevoke_token(*authenticated)
+            await alogout(request)
+            return json_response({
+                'code': 0,
+                'data': None,
+                'message': '退出成功'
+            })
+        except Exception as e:
+            return json_response({
+                'code': 40000,
+                'data': None,
+                'message': str(e)
+            })
+
+
+class UserAccountExistView(AsyncAPIView):
+    query_budget = 3
+    authenticate = False
+    login_required = False
+
+    async def post(self, request):
+        userAccount = request.data.get('userAccount')
+        exists = await username_index.aaccount_exists(userAccount)
+        return json_response({
+            'code': 0,
+            'date': exists,
+            'message': '用户名已存在' if exists else '用户名可用'
+        })
+
+
+class UserRegisterView(AsyncAPIView):
+    query_budget = 3
+    authenticate = False
+    login_required = False
+
+    async def post(self, request):
+        try:
+            data = request.data
+            userAccount = data.get('userAccount')
+            userPassword = data.get('userPassword')
+            checkPassword = data.get('checkPassword')
+
+            # 基本验证
+            if not userAccount or not userPassword:
+                return json_response({
+                    'code': 40000,
+                    'date': None,
+                    'message': '用户名或密码不能为空'
+                })
+
+            if userPassword != checkPassword:
+                return json_response({
+                    'code': 40000,
+                    'date': None,
+                    'message': '两次输入的密码不一致'
+                })
+
+            # 用户名已存在时不必再做一次哈希
+            if await User.objects.filter(username=userAccount).aexists():
+                return json_response({
+                    'code': 40000,
+                    'date': None,
+                    'message': '用户名已存在'
+                })
+
+            # 创建用户（与 create_user 相同的字段处理，哈希在进程池中完成）
+            user = User(
+                username=User.normalize_username(userAccount),
+                email=User.objects.normalize_email(data.get('email')),
+                phone=data.get('phone'),
+                gender=data.get('gender', 1),
+                # 使用userAccount作为username，使用传入的username作为昵称
+                first_name=data.get('username')  # 用first_name存储昵称
+            )
+            user.password = await amake_password(userPassword)
+            await user.asave()
+
+            return json_response({
+                'code': 0,
+                'date': user.id,
+                'message': '注册成功'
+            })
+
+        except HashingBusy as e:
+            return json_response({
+                'code': 50300,
+                'date': None,
+                'message': str(e)
+            })
+        except Exception as e:
+            return json_response({
+                'code': 40000,
+                'date': None,
+                'message': str(e)
+            })
+
+
+class CurrentUserView(AsyncAPIView):
+    query_budget = 2
+    async def get(self, request):
+        user = request.user
+        return json_response({
+            'code': 0,
+            'date': {
+                'id': user.id,
+                'username': user.username,
+                'userAccount': user.username,  # 使用username作为userAccount
+                'avatarUrl': 'https://gips3.baidu.com/it/u=1004796864,1363400944&fm=3039&app=3039&f=JPEG?w=1024&h=1024',  # 默认头像
+                'gender': user.gender,
+                'phone': user.phone,
+                'email': user.email,
+                'planetCode': user.planetCode,
+                'createTime': user.createTime.strftime('%Y-%m-%d %H:%M:%S') if user.createTime else None,
+                'tags': user.tags,
+            }
+        })
@@ -0,0 +1,131 @@
+# user/auth.py
+"""签名令牌认证
+
+会话认证每个请求都要读一次 django_session，再按ID查一次 user 表。登录时额外
+签发一个令牌（``django.core.signing``，带签发时间，``TTL`` 秒后过期），内容只有
+用户ID、令牌版本和令牌ID（jti），客户端这样携带：
+
+    Authorization: Bearer <令牌>
+
+校验令牌只需验证签名，用户从进程内的短期缓存中取（user/user_cache.py），正常
+情况下认证不查库。不带会话 cookie 的请求 SessionAuthentication 也不会查库，所以它仍排在前面，
+未登录时的 403 响应不变。
+
+撤销：
+
+- 退出登录只作废本次携带的令牌：令牌ID记入共享缓存（settings.CACHES）中的
+  黑名单，保留到令牌过期，所有进程立即生效；同一用户在其他设备上的令牌不受影响。
+  校验令牌时因此多一次缓存读取，仍不查库。
+- ``User.tokenVersion`` 加一后，之前签发的令牌全部失效（"退出所有设备"，以及
+  没有令牌ID的旧令牌退出登录时）。本进程立即生效；其他进程最多在用户缓存的
+  ``USER_CACHE['TTL']`` 秒后生效。
+"""
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import F
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from .models import User
+from .user_cache import aget_user, evict_user, get_user
+
+TOKEN_SALT = 'user.auth.token'
+
+DEFAULTS = {
+    'ENABLED': True,
+    'TTL': 7 * 24 * 3600,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'USER_TOKEN', {})}
+
+
+def issue_token(user):
+    return signing.dumps({'id': user.id, 'ver': user.tokenVersion, 'jti': uuid.uuid4().hex}, salt=TOKEN_SALT)
+
+
+def revoke_tokens(user):
+    """作废该用户已签发的全部令牌"""
+    User.objects.filter(id=user.id).update(tokenVersion=F('tokenVersion') + 1)
+    evict_user(user.id)
+
+
+async def arevoke_tokens(user):
+    await User.objects.filter(id=user.id).aupdate(tokenVersion=F('tokenVersion') + 1)
+    evict_user(user.id)
+
+
+def _revoked_key(claims):
+    return f'user:token:revoked:{claims["jti"]}'
+
+
+def revoke_token(user, claims):
+    """只作废这一个令牌；没有令牌ID的旧令牌只能作废该用户的全部令牌"""
+    if 'jti' not in claims:
+        revoke_tokens(user)
+        return
+    cache.set(_revoked_key(claims), True, timeout=get_config()['TTL'])
+
+
+async def arevoke_token(user, claims):
+    if 'jti' not in claims:
+        await arevoke_tokens(user)
+        return
+    await cache.aset(_revoked_key(claims), True, timeout=get_config()['TTL'])
+
+
+def get_request_token(request):
+    """请求头中的令牌，未启用或没有携带时返回 None"""
+    if not get_config()['ENABLED']:
+        return None
+    parts = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(parts) != 2 or parts[0].lower() != 'bearer':
+        return None
+    return parts[1]
+
+
+def parse_token(token):
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=get_config()['TTL'])
+    except signing.SignatureExpired:
+        raise AuthenticationFailed('令牌已过期')
+    except signing.BadSignature:
+        raise AuthenticationFailed('令牌无效')
+
+
+def check_user(user, claims):
+    if user is None or not user.is_active or user.tokenVersion != claims['ver']:
+        raise AuthenticationFailed('令牌已失效')
+    return user, claims
+
+
+def authenticate_token(request):
+    """返回 (用户, 令牌内容)，没有令牌时返回 None，令牌无效时抛出 AuthenticationFailed"""
+    token = get_request_token(request)
+    if token is None:
+        return None
+    claims = parse_token(token)
+    if 'jti' in claims and cache.get(_revoked_key(claims)):
+        raise AuthenticationFailed('令牌已失效')
+    return check_user(get_user(claims['id']), claims)
+
+
+async def aauthenticate_token(request):
+    token = get_request_token(request)
+    if token is None:
+        return None
+    claims = parse_token(token)
+    if 'jti' in claims and await cache.aget(_revoked_key(claims)):
+        raise AuthenticationFailed('令牌已失效')
+    return check_user(await aget_user(claims['id']), claims)
+
+
+class TokenAuthentication(BaseAuthentication):
+    """DRF 认证类，令牌内容放在 request.auth"""
+
+    def authenticate(self, request):
+        return authenticate_token(request)
@@ -0,0 +1,255 @@
+# user/bloom.py
+"""用户名布隆过滤器
+
+注册页每输入一个字符就调用一次 /api/user/account/exist，且不需要登录。这里在
+进程内维护一个全部用户名的布隆过滤器：判定"不存在"的直接返回，不查库；只有
+"可能存在"的才用一次查询确认。
+
+- 首次使用时建立：有快照（``SNAPSHOT``，由 ``manage.py username_bloom --save``
+  生成）就加载快照，再补上快照之后新注册的用户；否则扫描整张 user 表。
+- 本进程中 ``User.save`` 新建和 ``importer.insert_batch`` 导入的用户立即加入；
+  其他进程注册的用户每隔 ``REFRESH_INTERVAL`` 秒按ID增量补入，这段时间内
+  可能回答"可用"，注册时仍由数据库唯一约束兜底。
+- ID 不按提交顺序出现：并发的注册或导入事务可能在更大的ID已经读到之后才提交
+  较小的ID。增量补入时从已读到的最大ID往回多扫 ``REFRESH_LOOKBACK`` 个ID，
+  并每隔 ``REBUILD_INTERVAL`` 秒全表重建一次，否则漏掉的用户名会一直被判为不存在。
+- 用户名先做归一化（casefold、去掉重音、去掉末尾空格）再加入，与 MySQL 默认
+  不区分大小写和重音的排序规则一致，不会因为大小写不同而漏判。
+- 用户数超过容量时按两倍容量重建，误判率维持在 ``FALSE_POSITIVE_RATE`` 附近。
+- 请求线程、提交回调和刷新线程会同时加入用户名：置位在过滤器的锁内完成，
+  重建期间加入的用户名在替换前补进新过滤器，不会因为并发丢失而漏判。
+"""
+import hashlib
+import math
+import os
+import struct
+import threading
+import time
+import unicodedata
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import User
+
+DEFAULTS = {
+    'ENABLED': True,
+    'FALSE_POSITIVE_RATE': 0.01,
+    'MIN_CAPACITY': 100000,
+    'REFRESH_INTERVAL': 1.0,
+    'REFRESH_LOOKBACK': 1000,
+    'REBUILD_INTERVAL': 3600.0,
+    'SNAPSHOT': None,
+}
+
+# 快照格式：容量、误判率、位数、哈希函数个数、元素个数、最大用户ID，随后是位数组
+SNAPSHOT_HEADER = struct.Struct('<QdQQQQ')
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'USERNAME_BLOOM', {})}
+
+
+def normalize(username):
+    decomposed = unicodedata.normalize('NFKD', str(username).casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).rstrip(' ').encode()
+
+
+class BloomFilter:
+    """按容量和目标误判率确定位数 m 与哈希函数个数 k，k 个位置由两个哈希值线性组合得到"""
+
+    def __init__(self, capacity, error_rate, num_bits=None, num_hashes=None, bits=None, count=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = num_bits or max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = num_hashes or max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bits if bits is not None else bytearray((self.num_bits + 7) // 8)
+        self.count = count
+        # 置位是读-改-写，并发写同一字节会丢位，产生漏判
+        self._lock = threading.Lock()
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        positions = self._positions(key)
+        with self._lock:
+            for position in positions:
+                self.bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def estimated_false_positive_rate(self):
+        """按当前元素个数估算的误判率 (1 - e^(-kn/m))^k"""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+
+class UsernameIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 保护 filter 的替换和建立期间的 _pending
+        self._add_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock, self._add_lock:
+            self.filter = None
+            self._pending = None
+            self.last_id = 0
+            self.refreshed_at = 0.0
+            self.built_at = 0.0
+        with self._stats_lock:
+            self._stats = {'negatives': 0, 'positives': 0, 'false_positives': 0}
+
+    def _fill(self, bloom, last_id, lookback=0):
+        """把 ID 大于 last_id - lookback 的用户加入过滤器，返回新的最大ID
+
+        往回多扫的部分大多已经在过滤器中，不重复计数。
+        """
+        rows = User.objects.filter(id__gt=last_id - lookback).order_by('id').values_list('id', 'username')
+        for user_id, username in rows.iterator(chunk_size=10000):
+            key = normalize(username)
+            if key not in bloom:
+                bloom.add(key)
+            last_id = max(last_id, user_id)
+        return last_id
+
+    def _build(self, config):
+        snapshot = config['SNAPSHOT']
+        if snapshot and os.path.exists(snapshot):
+            with open(snapshot, 'rb') as f:
+                bloom, last_id = loads(f.read())
+        else:
+            capacity = max(config['MIN_CAPACITY'], 2 * User.objects.count())
+            bloom, last_id = BloomFilter(capacity, config['FALSE_POSITIVE_RATE']), 0
+        return bloom, self._fill(bloom, last_id, config['REFRESH_LOOKBACK'] if last_id else 0)
+
+    def _swap(self, build):
+        """建立新过滤器并替换当前的，返回新的最大ID
+
+        扫描期间 add 的用户名可能不在扫描结果里（扫描已经过了它的ID，或者它还没提交），
+        记在 _pending 中，替换前补进新过滤器。
+        """
+        with self._add_lock:
+            self._pending = []
+        bloom = None
+        try:
+            bloom, last_id = build()
+        finally:
+            with self._add_lock:
+                if bloom is not None:
+                    for key in self._pending:
+                        if key not in bloom:
+                            bloom.add(key)
+                    self.filter = bloom
+                self._pending = None
+        return last_id
+
+    def ensure(self):
+        """首次使用时建立过滤器，之后每隔 REFRESH_INTERVAL 秒补入其他进程注册的用户"""
+        config = get_config()
+        if self.filter is not None and time.monotonic() - self.refreshed_at < config['REFRESH_INTERVAL']:
+            return
+        # 已有过滤器时只让一个线程去刷新，其他线程继续用当前的
+        if not self._lock.acquire(blocking=self.filter is None):
+            return
+        try:
+            if self.filter is None:
+                self.last_id = self._swap(lambda: self._build(config))
+                self.built_at = time.monotonic()
+            elif time.monotonic() - self.refreshed_at >= config['REFRESH_INTERVAL']:
+                self.last_id = self._fill(self.filter, self.last_id, config['REFRESH_LOOKBACK'])
+                # 超出容量或到了定期重建的时间，全表扫描建一个新的替换
+                if (self.filter.count > self.filter.capacity
+                        or time.monotonic() - self.built_at >= config['REBUILD_INTERVAL']):
+                    capacity = max(config['MIN_CAPACITY'], 2 * self.filter.count)
+                    bloom = BloomFilter(capacity, config['FALSE_POSITIVE_RATE'])
+                    self.last_id = self._swap(lambda: (bloom, self._fill(bloom, 0)))
+                    self.built_at = time.monotonic()
+            self.refreshed_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def _needs_refresh(self):
+        return self.filter is None or time.monotonic() - self.refreshed_at >= get_config()['REFRESH_INTERVAL']
+
+    def add(self, username):
+        """新建用户时调用（事务回滚也只多一个误判）
+
+        正在建立新过滤器时同时记下，替换后仍在；过滤器尚未建立时等建立时一起加入。
+        """
+        key = normalize(username)
+        with self._add_lock:
+            bloom = self.filter
+            if self._pending is not None:
+                self._pending.append(key)
+        if bloom is not None:
+            bloom.add(key)
+
+    def _count(self, maybe, exists):
+        with self._stats_lock:
+            if not maybe:
+                self._stats['negatives'] += 1
+            else:
+                self._stats['positives'] += 1
+                self._stats['false_positives'] += not exists
+
+    def account_exists(self, username):
+        if not get_config()['ENABLED'] or username is None:
+            return User.objects.filter(username=username).exists()
+        self.ensure()
+        maybe = normalize(username) in self.filter
+        exists = maybe and User.objects.filter(username=username).exists()
+        self._count(maybe, exists)
+        return exists
+
+    async def aaccount_exists(self, username):
+        if not get_config()['ENABLED'] or username is None:
+            return await User.objects.filter(username=username).aexists()
+        if self._needs_refresh():
+            await sync_to_async(self.ensure)()
+        maybe = normalize(username) in self.filter
+        exists = maybe and await User.objects.filter(username=username).aexists()
+        self._count(maybe, exists)
+        return exists
+
+    def stats(self):
+        """items/capacity-元素个数和容量，memory_bytes-位数组大小，estimated_fp_rate-估算误判率，
+        negatives/positives-直接返回和需要查库的次数，observed_fp_rate-查库后实际不存在的比例"""
+        with self._stats_lock:
+            result = dict(self._stats)
+        bloom = self.filter
+        if bloom is not None:
+            result.update({
+                'items': bloom.count,
+                'capacity': bloom.capacity,
+                'bits': bloom.num_bits,
+                'hashes': bloom.num_hashes,
+                'memory_bytes': len(bloom.bits),
+                'estimated_fp_rate': bloom.estimated_false_positive_rate(),
+            })
+        # 查询的用户名大多不存在时，误判率约为 误判次数 / 不存在的查询次数
+        absent = result['negatives'] + result['false_positives']
+        result['observed_fp_rate'] = result['false_positives'] / absent if absent else 0.0
+        return result
+
+
+def dumps(bloom, last_id):
+    header = SNAPSHOT_HEADER.pack(bloom.capacity, bloom.error_rate, bloom.num_bits,
+                                  bloom.num_hashes, bloom.count, last_id)
+    return header + bytes(bloom.bits)
+
+
+def loads(data):
+    capacity, error_rate, num_bits, num_hashes, count, last_id = SNAPSHOT_HEADER.unpack_from(data)
+    bits = bytearray(data[SNAPSHOT_HEADER.size:])
+    return BloomFilter(capacity, error_rate, num_bits, num_hashes, bits, count), last_id
+
+
+username_index = UsernameIndex()
@@ -0,0 +1,151 @@
+# user/fragments.py
+"""用户序列化片段缓存
+
+同一个创建人在每个队伍、每次列表请求里都要重新序列化一遍。这里把
+``UserSerializer`` 的输出按 (用户ID, 版本) 缓存在进程内的 LRU 中，版本取
+``updateTime``——每次 ``User.save`` 都会刷新它，所以旧片段不会再被命中，
+也不需要主动失效，只等 LRU 淘汰。
+
+一个列表里的所有用户一次批量取出（``get_many``），未命中的再统一序列化写回。
+返回的片段在多个响应间共享，调用方不要修改。
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework import serializers
+
+from backend.serialization import RowSerializer
+from .serializers import UserSerializer
+
+
+class LRUCache:
+    """线程安全的进程内 LRU，带命中/未命中计数"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                value = self._data.get(key)
+                if value is not None:
+                    self._data.move_to_end(key)
+                    found[key] = value
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, mapping):
+        with self._lock:
+            self._data.update(mapping)
+            for key in mapping:
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data)}
+
+
+fragment_cache = LRUCache(settings.USER_FRAGMENT_CACHE['MAX_ENTRIES'])
+
+
+def fragment_version(update_time):
+    """片段版本：updateTime 的微秒时间戳"""
+    if update_time is None:
+        return 0
+    return int(update_time.timestamp() * 1000000)
+
+
+def user_fragments(users):
+    """批量取出一组用户实例的 UserSerializer 输出，顺序与 users 一致"""
+    users = list(users)
+    keys = [(user.id, fragment_version(user.updateTime)) for user in users]
+    found = fragment_cache.get_many(set(keys))
+    missing = {}
+    for key, user in zip(keys, users):
+        if key not in found and key not in missing:
+            missing[key] = user
+    if missing:
+        fresh = dict(zip(missing, (dict(data) for data in UserSerializer(list(missing.values()), many=True).data)))
+        fragment_cache.set_many(fresh)
+        found.update(fresh)
+    return [found[key] for key in keys]
+
+
+class UserFragmentRows:
+    """RowSerializer 的嵌套列：从 .values() 行中按前缀读取用户字段，走片段缓存"""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.rows = RowSerializer.from_serializer(UserSerializer, prefix=prefix)
+
+    def keys(self):
+        return self.rows.keys() + [self.prefix + 'updateTime']
+
+    def serialize(self, rows):
+        rows = rows if isinstance(rows, list) else list(rows)
+        id_key, version_key = self.prefix + 'id', self.prefix + 'updateTime'
+        keys = [(row[id_key], fragment_version(row[version_key])) for row in rows]
+        found = fragment_cache.get_many(set(keys))
+        missing = {}
+        for key, row in zip(keys, rows):
+            if key not in found and key not in missing:
+                missing[key] = row
+        if missing:
+            fresh = dict(zip(missing, self.rows.serialize(list(missing.values()))))
+            fragment_cache.set_many(fresh)
+            found.update(fresh)
+        return [found[key] for key in keys]
+
+
+class UserFragmentField(serializers.Field):
+    """只读的用户字段，输出与嵌套 UserSerializer 相同，走片段缓存"""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+        # many=True 时由 PrefetchUserFragmentsListSerializer 批量填充
+        self.prefetched = {}
+
+    def to_representation(self, user):
+        key = (user.id, fragment_version(user.updateTime))
+        if key in self.prefetched:
+            return self.prefetched[key]
+        return user_fragments([user])[0]
+
+
+class PrefetchUserFragmentsListSerializer(serializers.ListSerializer):
+    """many=True 时先一次批量取出所有 UserFragmentField 需要的片段"""
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        fields = [field for field in self.child.fields.values() if isinstance(field, UserFragmentField)]
+        for field in fields:
+            users = [field.get_attribute(item) for item in items]
+            fragments = user_fragments(users)
+            field.prefetched = {
+                (user.id, fragment_version(user.updateTime)): fragment
+                for user, fragment in zip(users, fragments)
+            }
+        try:
+            return super().to_representation(items)
+        finally:
+            for field in fields:
+                field.prefetched = {}
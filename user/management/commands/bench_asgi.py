@@ -0,0 +1,101 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+from django.urls import include, path
+
+from backend import urls as backend_urls
+from team.urls import async_urlpatterns as team_async_urlpatterns
+from user.models import User
+from user.urls import async_urlpatterns as user_async_urlpatterns
+
+BENCH_PREFIX = 'bench_asgi_'
+BENCH_PASSWORD = '12345678'
+
+
+class AsyncURLConf:
+    """异步视图优先匹配的路由，等同于 ASYNC_VIEWS 开启时的 urlpatterns"""
+    urlpatterns = [
+        path('api/user/', include(user_async_urlpatterns)),
+        path('api/team/', include(team_async_urlpatterns)),
+    ] + backend_urls.urlpatterns
+
+
+def percentile(latency, q):
+    return statistics.quantiles(latency, n=100, method='inclusive')[q - 1]
+
+
+class Command(BaseCommand):
+    help = ('在同一进程内并发请求登录和用户名校验接口，对比同步视图（线程池模拟 WSGI worker）'
+            '与异步视图（事件循环模拟 ASGI）的吞吐量和延迟分位数。'
+            '并发请求分属不同线程和连接，测试用户会真实写入数据库并在结束后删除')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='每个接口的请求总数')
+        parser.add_argument('--concurrency', type=int, default=16, help='同时进行的请求数（WSGI 线程数）')
+        parser.add_argument('--users', type=int, default=50, help='登录使用的测试用户数')
+
+    def handle(self, *args, **options):
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        password = make_password(BENCH_PASSWORD)
+        User.objects.bulk_create([
+            User(username=f'{BENCH_PREFIX}{i}', password=password, first_name='bench', phone='')
+            for i in range(options['users'])
+        ])
+        try:
+            self.stdout.write(f'password hashing workers: {settings.PASSWORD_HASHING["WORKERS"]}')
+            self.stdout.write(f'{"endpoint":>14} {"mode":>5} {"req/s":>8} {"p50 (ms)":>9} '
+                              f'{"p95 (ms)":>9} {"p99 (ms)":>9} {"errors":>7}')
+            for name, url, body in self.cases(options):
+                for mode, run in [('wsgi', self.run_wsgi), ('asgi', self.run_asgi)]:
+                    elapsed, latency, errors = run(url, body, options)
+                    self.stdout.write(
+                        f'{name:>14} {mode:>5} {len(latency) / elapsed:>8.1f} {percentile(latency, 50):>9.2f} '
+                        f'{percentile(latency, 95):>9.2f} {percentile(latency, 99):>9.2f} {errors:>7}'
+                    )
+        finally:
+            User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+
+    def cases(self, options):
+        users = options['users']
+        yield 'login', '/api/user/login', lambda i: {
+            'userAccount': f'{BENCH_PREFIX}{i % users}', 'userPassword': BENCH_PASSWORD,
+        }
+        # 一半存在一半不存在
+        yield 'account/exist', '/api/user/account/exist', lambda i: {
+            'userAccount': f'{BENCH_PREFIX}{i % (users * 2)}',
+        }
+
+    def run_wsgi(self, url, body, options):
+        def request(i):
+            client = Client()
+            start = time.perf_counter()
+            response = client.post(url, body(i), content_type='application/json')
+            return (time.perf_counter() - start) * 1000, response.json().get('code') != 0
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            results = list(executor.map(request, range(options['requests'])))
+        return time.perf_counter() - start, [ms for ms, _ in results], sum(failed for _, failed in results)
+
+    def run_asgi(self, url, body, options):
+        async def request(i, semaphore):
+            async with semaphore:
+                client = AsyncClient()
+                start = time.perf_counter()
+                response = await client.post(url, body(i), content_type='application/json')
+                return (time.perf_counter() - start) * 1000, response.json().get('code') != 0
+
+        async def run():
+            semaphore = asyncio.Semaphore(options['concurrency'])
+            return await asyncio.gather(*(request(i, semaphore) for i in range(options['requests'])))
+
+        with override_settings(ROOT_URLCONF=AsyncURLConf):
+            start = time.perf_counter()
+            results = asyncio.run(run())
+        return time.perf_counter() - start, [ms for ms, _ in results], sum(failed for _, failed in results)
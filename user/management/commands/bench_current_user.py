@@ -0,0 +1,84 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from backend.sessions import local_sessions
+from user.auth import issue_token
+from user.models import User
+from user.user_cache import user_cache
+
+DJANGO_AUTH_MIDDLEWARE = 'django.contrib.auth.middleware.AuthenticationMiddleware'
+CACHED_AUTH_MIDDLEWARE = 'user.middleware.CachedAuthenticationMiddleware'
+
+
+class Rollback(Exception):
+    pass
+
+
+def middleware(auth_middleware):
+    return [auth_middleware if name == CACHED_AUTH_MIDDLEWARE else name for name in settings.MIDDLEWARE]
+
+
+# 名称、会话存储、认证中间件、是否用令牌
+MODES = [
+    ('db session', 'django.contrib.sessions.backends.db', DJANGO_AUTH_MIDDLEWARE, False),
+    ('cached_db session', 'django.contrib.sessions.backends.cached_db', DJANGO_AUTH_MIDDLEWARE, False),
+    ('local session + user cache', 'backend.sessions', CACHED_AUTH_MIDDLEWARE, False),
+    ('token + user cache', 'backend.sessions', CACHED_AUTH_MIDDLEWARE, True),
+]
+
+
+class Command(BaseCommand):
+    help = '对比不同会话存储和认证方式下 /api/user/current 的查询数和延迟（数据在事务中回滚）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=500, help='每种方式的请求次数')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        user = User.objects.create_user(username='bench_current_user', password='12345678')
+        self.stdout.write(f'{"mode":>28} {"cold queries":>13} {"warm queries":>13} '
+                          f'{"p50 (ms)":>9} {"p99 (ms)":>9}')
+        for name, engine, auth_middleware, use_token in MODES:
+            cache.clear()
+            user_cache.clear()
+            local_sessions.clear()
+            with override_settings(SESSION_ENGINE=engine, MIDDLEWARE=middleware(auth_middleware)):
+                client = Client()
+                headers = {}
+                if use_token:
+                    headers['HTTP_AUTHORIZATION'] = f'Bearer {issue_token(user)}'
+                else:
+                    client.force_login(user)
+                    # force_login 写入会话时会顺带填充各级缓存，清掉后再测首个请求
+                    cache.clear()
+                    local_sessions.clear()
+
+                cold = self.count_queries(client, headers)
+                warm = self.count_queries(client, headers)
+                latency = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    client.get('/api/user/current', **headers)
+                    latency.append((time.perf_counter() - start) * 1000)
+                quantiles = statistics.quantiles(latency, n=100, method='inclusive')
+                self.stdout.write(f'{name:>28} {cold:>13} {warm:>13} {quantiles[49]:>9.3f} {quantiles[98]:>9.3f}')
+
+    def count_queries(self, client, headers):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/user/current', **headers)
+        assert response.status_code == 200, response.content
+        return len(queries)
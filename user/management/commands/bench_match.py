@@ -0,0 +1,92 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from user.matching import MatchEngine, get_config
+from user.synthetic import zipf_tag_lists
+
+
+class Command(BaseCommand):
+    help = '对比精确匹配与 MinHash/LSH 近似匹配的延迟和召回率'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200000, help='合成用户数，0 表示使用数据库中的用户')
+        parser.add_argument('--tags', type=int, default=2000, help='合成标签总数')
+        parser.add_argument('--tags-per-user', type=int, default=3, help='每个用户的平均标签数')
+        parser.add_argument('--queries', type=int, default=200, help='查询次数')
+        parser.add_argument('-k', type=int, default=10, help='每次返回的用户数')
+        parser.add_argument('--bands', type=int, nargs='*', help='要测试的探测分段数，默认测试若干档')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        config = get_config()
+        start = time.perf_counter()
+        if options['users']:
+            tag_lists = zipf_tag_lists(options['users'], options['tags'],
+                                       options['tags_per_user'], options['seed'])
+            engine = MatchEngine(range(len(tag_lists)), tag_lists,
+                                 metric_weights=config['METRIC_WEIGHTS'],
+                                 tag_weighting=config['TAG_WEIGHTING'],
+                                 lsh_num_perm=config['LSH_NUM_PERM'],
+                                 lsh_bands=config['LSH_BANDS'],
+                                 lsh_max_candidates=config['LSH_MAX_CANDIDATES'])
+        else:
+            engine = MatchEngine.from_db(config)
+            tag_lists = [engine.indices[engine.indptr[i]:engine.indptr[i + 1]] for i in range(len(engine))]
+            inverse_vocab = {index: tag for tag, index in engine.vocab.items()}
+            tag_lists = [[inverse_vocab[i] for i in tags] for tags in tag_lists]
+        self.stdout.write(f'构建矩阵: {len(engine)} 用户, {len(engine.vocab)} 标签, '
+                          f'{time.perf_counter() - start:.2f}s')
+
+        start = time.perf_counter()
+        lsh = engine.lsh
+        self.stdout.write(f'构建 LSH: {lsh.num_perm} 个哈希 / {lsh.bands} 段, '
+                          f'{time.perf_counter() - start:.2f}s')
+
+        rng = np.random.default_rng(options['seed'] + 1)
+        candidates = [i for i, tags in enumerate(tag_lists) if tags]
+        query_rows = rng.choice(candidates, size=min(options['queries'], len(candidates)), replace=False)
+        queries = [(tag_lists[row], int(engine.user_ids[row])) for row in query_rows]
+        k = options['k']
+
+        exact_results, exact_latency = self._run(engine, queries, k, approx=False)
+        self._report('exact', exact_latency, 1.0)
+
+        for bands in options['bands'] or sorted({1, lsh.bands // 4, lsh.bands // 2, lsh.bands} - {0}):
+            results, latency = self._run(engine, queries, k, approx=True, bands=bands)
+            recall = np.mean([
+                self._recall(engine, tags, got, expected)
+                for (tags, _), got, expected in zip(queries, results, exact_results)
+            ])
+            self._report(f'approx bands={bands}', latency, recall)
+
+    def _recall(self, engine, tags, got, expected):
+        """相似度不低于精确结果第 k 名的返回数 / 精确结果数
+
+        精确结果中同分用户很多，按用户ID比较会把等价的同分用户算作未召回。
+        """
+        if not expected:
+            return 1.0
+        _, expected_scores = engine.score(tags, rows=[engine.row_of[i] for i in expected])
+        if not got:
+            return 0.0
+        _, got_scores = engine.score(tags, rows=[engine.row_of[i] for i in got])
+        return min(1.0, np.sum(got_scores >= expected_scores.min() - 1e-9) / len(expected))
+
+    def _run(self, engine, queries, k, **kwargs):
+        results = []
+        latency = []
+        for tags, user_id in queries:
+            start = time.perf_counter()
+            results.append(engine.top_k(tags, k, exclude_id=user_id, **kwargs))
+            latency.append(time.perf_counter() - start)
+        return results, np.asarray(latency) * 1000
+
+    def _report(self, name, latency, recall):
+        self.stdout.write(
+            f'{name:<20} p50={np.percentile(latency, 50):8.3f}ms '
+            f'p95={np.percentile(latency, 95):8.3f}ms '
+            f'p99={np.percentile(latency, 99):8.3f}ms '
+            f'recall@k={recall:.3f}'
+        )
@@ -0,0 +1,131 @@
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.hashing import init_worker
+from user.importer import build_user, exclude_existing, hash_passwords, insert_batch, read_rows
+
+
+def peak_memory_mb(who=resource.RUSAGE_SELF):
+    # Linux 上 ru_maxrss 的单位是 KB
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = ('从 CSV 或 JSONL 流式导入用户：密码在多个进程中并行哈希，按批 bulk_create，'
+            '每批一个事务并记录检查点，中断后可从检查点继续')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='输入文件，- 表示标准输入')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='默认按扩展名判断')
+        parser.add_argument('--batch-size', type=int, default=2000, help='每个事务写入的行数')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='哈希进程数')
+        parser.add_argument('--checkpoint', help='检查点文件，存在时从记录的位置继续')
+        parser.add_argument('--limit', type=int, help='本次最多处理的行数')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.state = self.load_checkpoint()
+        rows = read_rows(options['path'], options['format'])
+        rows = itertools.islice(rows, self.state['rows'], None)
+        if options['limit'] is not None:
+            rows = itertools.islice(rows, options['limit'])
+        if self.state['rows']:
+            self.stdout.write(f'从检查点继续，跳过前 {self.state["rows"]} 行')
+
+        self.start = time.perf_counter()
+        self.processed = 0
+        pool = ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker,
+            initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'backend.settings'),),
+        )
+        with pool:
+            # 下一批在子进程中哈希的同时，写入上一批
+            pending = None
+            while True:
+                batch = list(itertools.islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                prepared = self.prepare(batch, pool)
+                if pending is not None:
+                    self.write(*pending)
+                pending = prepared
+            if pending is not None:
+                self.write(*pending)
+
+        elapsed = time.perf_counter() - self.start
+        self.stdout.write(self.style.SUCCESS(
+            f'完成：处理 {self.processed} 行，写入 {self.state["inserted"]}，'
+            f'跳过已存在 {self.state["skipped"]}，失败 {self.state["failed"]}；'
+            f'{self.processed / elapsed if elapsed else 0:.0f} 行/秒，'
+            f'峰值内存 {peak_memory_mb():.1f} MB（哈希进程 {peak_memory_mb(resource.RUSAGE_CHILDREN):.1f} MB）'
+        ))
+
+    def prepare(self, batch, pool):
+        """解析一批行，把明文密码分片提交到进程池，返回 (用户, 明文密码下标, 哈希任务, 行数, 跳过数, 失败行数)"""
+        parsed, failed = [], 0
+        for line, row in enumerate(batch, start=self.initial_rows + self.processed + 1):
+            try:
+                parsed.append(build_user(row))
+            except (ValueError, ValidationError) as e:
+                failed += 1
+                self.stderr.write(f'第 {line} 行：{e}')
+        self.processed += len(batch)
+
+        # 已存在的用户不必哈希（从头重跑或检查点落后一批时尤其多）
+        passwords = {id(user): password for user, password in parsed}
+        users, skipped = exclude_existing([user for user, _ in parsed])
+        plain = [(index, passwords[id(user)]) for index, user in enumerate(users) if passwords[id(user)] is not None]
+
+        chunk = max(1, -(-len(plain) // self.options['workers']))
+        futures = [
+            pool.submit(hash_passwords, [password for _, password in plain[i:i + chunk]])
+            for i in range(0, len(plain), chunk)
+        ]
+        return users, [index for index, _ in plain], futures, len(batch), skipped, failed
+
+    def write(self, users, indexes, futures, count, skipped, failed):
+        hashed = itertools.chain.from_iterable(future.result() for future in futures)
+        for index, password in zip(indexes, hashed):
+            users[index].password = password
+        inserted, raced = insert_batch(users)
+        self.state['rows'] += count
+        self.state['inserted'] += inserted
+        self.state['skipped'] += skipped + raced
+        self.state['failed'] += failed
+        self.save_checkpoint()
+
+        elapsed = time.perf_counter() - self.start
+        done = self.state['rows'] - self.initial_rows
+        self.stdout.write(f'{self.state["rows"]} 行，{done / elapsed:.0f} 行/秒，峰值内存 {peak_memory_mb():.1f} MB')
+
+    def load_checkpoint(self):
+        path = self.options['checkpoint']
+        state = {'source': os.path.abspath(self.options['path']), 'rows': 0, 'inserted': 0, 'skipped': 0, 'failed': 0}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved['source'] != state['source']:
+                raise CommandError(f'检查点属于 {saved["source"]}，与本次输入不一致')
+            state = saved
+        self.initial_rows = state['rows']
+        return state
+
+    def save_checkpoint(self):
+        """在该批事务提交之后写入，进程中断时最多重做一批（已写入的用户会被跳过）"""
+        path = self.options['checkpoint']
+        if not path:
+            return
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(tmp, path)
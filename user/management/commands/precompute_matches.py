@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from user.matching import MatchEngine, get_config
+from user.models import UserMatch
+from user.tag_index import tags_digest
+
+
+class Command(BaseCommand):
+    help = '离线批量计算每个用户的 top-k 标签匹配结果，供 /api/user/match 直接读取'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-k', '--top-k', type=int, help='每个用户保存的匹配数，默认 USER_MATCH["PRECOMPUTE_TOP_K"]')
+        parser.add_argument('--full', action='store_true', help='全量重算；默认只重算标签发生变化的用户')
+        parser.add_argument('--max-pairs', type=int, default=5_000_000,
+                            help='每块展开的 (用户, 候选) 对数上限，控制内存占用')
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批写入的结果数')
+
+    def handle(self, *args, **options):
+        config = get_config()
+        k = options['top_k'] or config['PRECOMPUTE_TOP_K']
+        started = time.perf_counter()
+
+        engine = MatchEngine.from_db(config)
+        digests = {}
+        for row in range(len(engine)):
+            tags = engine.row_tags(row)
+            if tags:
+                digests[row] = tags_digest(tags)
+
+        if options['full']:
+            rows = list(digests)
+            # 已停用或已清空标签的用户不再保留结果
+            active_ids = {int(engine.user_ids[row]) for row in digests}
+            stale_ids = set(UserMatch.objects.values_list('userId', flat=True)) - active_ids
+            UserMatch.objects.filter(userId__in=stale_ids).delete()
+        else:
+            existing = dict(UserMatch.objects.values_list('userId', 'tagsDigest'))
+            rows = [row for row, digest in digests.items()
+                    if existing.get(int(engine.user_ids[row])) != digest]
+        self.stdout.write(f'{len(engine)} 个用户，需要计算 {len(rows)} 个')
+
+        batch = []
+        computed = 0
+        for row, match_rows, _ in engine.batch_top_k(rows, k, max_pairs=options['max_pairs']):
+            batch.append(UserMatch(
+                userId_id=int(engine.user_ids[row]),
+                matchIds=engine.user_ids[match_rows].tolist(),
+                tagsDigest=digests[row],
+                topK=k,
+            ))
+            if len(batch) >= options['batch_size']:
+                computed += self._save(batch)
+                batch = []
+        if batch:
+            computed += self._save(batch)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'完成：写入 {computed} 个用户的匹配结果，耗时 {elapsed:.1f}s'
+        ))
+
+    def _save(self, batch):
+        with transaction.atomic():
+            UserMatch.objects.bulk_create(
+                batch,
+                update_conflicts=True,
+                unique_fields=['userId'],
+                update_fields=['matchIds', 'tagsDigest', 'topK', 'updateTime'],
+            )
+        return len(batch)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from user.tag_index import rebuild_index
+
+
+class Command(BaseCommand):
+    help = '根据用户标签全量重建标签倒排索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批写入的索引条数')
+
+    def handle(self, *args, **options):
+        total = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'标签索引重建完成，共 {total} 条'))
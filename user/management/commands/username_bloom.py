@@ -0,0 +1,61 @@
+import os
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from user.bloom import BloomFilter, dumps, get_config, normalize
+from user.models import User
+
+
+class Command(BaseCommand):
+    help = ('扫描 user 表建立用户名布隆过滤器，报告内存占用和误判率（用随机的不存在用户名探测），'
+            '可选保存为快照供启动时加载')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--save', nargs='?', const='', default=None, metavar='PATH',
+                            help='保存快照，不给路径时写到 USERNAME_BLOOM["SNAPSHOT"]')
+        parser.add_argument('--probes', type=int, default=100000, help='探测误判率的随机用户名个数')
+        parser.add_argument('--db-probes', type=int, default=1000, help='对比查库耗时的请求数')
+
+    def handle(self, *args, **options):
+        config = get_config()
+        start = time.perf_counter()
+        capacity = max(config['MIN_CAPACITY'], 2 * User.objects.count())
+        bloom = BloomFilter(capacity, config['FALSE_POSITIVE_RATE'])
+        last_id = 0
+        rows = User.objects.order_by('id').values_list('id', 'username')
+        for user_id, username in rows.iterator(chunk_size=10000):
+            bloom.add(normalize(username))
+            last_id = user_id
+        build = time.perf_counter() - start
+
+        self.stdout.write(f'users: {bloom.count}  capacity: {bloom.capacity}  build: {build:.2f}s')
+        self.stdout.write(f'bits: {bloom.num_bits}  hashes: {bloom.num_hashes}  '
+                          f'memory: {len(bloom.bits) / 1024:.1f} KiB '
+                          f'({len(bloom.bits) * 8 / max(bloom.count, 1):.1f} bits/user)')
+
+        probes = [f'probe-{uuid.uuid4().hex}' for _ in range(options['probes'])]
+        start = time.perf_counter()
+        false_positives = sum(normalize(name) in bloom for name in probes)
+        check = (time.perf_counter() - start) / max(len(probes), 1) * 1e6
+        self.stdout.write(f'false positive rate: observed {false_positives / max(len(probes), 1):.4%} '
+                          f'/ estimated {bloom.estimated_false_positive_rate():.4%} '
+                          f'/ target {config["FALSE_POSITIVE_RATE"]:.4%}')
+
+        db_probes = probes[:options['db_probes']]
+        start = time.perf_counter()
+        for name in db_probes:
+            User.objects.filter(username=name).exists()
+        query = (time.perf_counter() - start) / max(len(db_probes), 1) * 1e6
+        self.stdout.write(f'per check: bloom {check:.1f}us, exists() query {query:.1f}us')
+
+        if options['save'] is not None:
+            path = options['save'] or config['SNAPSHOT']
+            if not path:
+                raise CommandError('没有指定快照路径，也没有配置 USERNAME_BLOOM["SNAPSHOT"]')
+            tmp = f'{path}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(dumps(bloom, last_id))
+            os.replace(tmp, path)
+            self.stdout.write(self.style.SUCCESS(f'快照已保存到 {path}（最大用户ID {last_id}）'))
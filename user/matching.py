@@ -0,0 +1,425 @@
+# user/matching.py
+"""基于标签相似度的用户匹配引擎
+
+把所有活跃用户的标签组织成 用户×标签 的稀疏矩阵（CSR + 按标签的倒排 CSC），
+一次匹配只需把查询标签对应的倒排表拼接后 ``bincount``，就能在 NumPy 中向量化地
+得到每个用户与查询的交集权重，再计算 Jaccard / 余弦相似度并用 ``argpartition``
+部分排序取 top-k。
+
+开启近似模式（``MODE='approx'`` 或请求参数 ``mode=approx``）时，额外为每个用户计算
+标签集合的 MinHash 签名并按 LSH 分段分桶：查询只取落在相同桶中的候选用户，
+再在候选集上做精确打分重排，候选生成的代价与用户总数无关。探测的分段数
+``bands`` 越多召回越高、延迟越大。
+
+引擎在进程内缓存，标签数据版本号变化（见 ``tag_index.bump_index_version``）后
+按 ``REFRESH_INTERVAL`` 节流重建，``MAX_AGE`` 作为兜底的定期重建。
+"""
+import threading
+import time
+import zlib
+
+import numpy as np
+from django.conf import settings
+
+from .models import User
+from .tag_index import index_version, normalize_tags
+
+DEFAULTS = {
+    # 相似度加权：score = Σ 权重 × 相似度
+    'METRIC_WEIGHTS': {'jaccard': 1.0, 'cosine': 0.0},
+    # 标签权重：uniform-所有标签等权，idf-越稀有的标签权重越高
+    'TAG_WEIGHTING': 'uniform',
+    # 标签数据变化后，两次重建之间的最小间隔（秒）
+    'REFRESH_INTERVAL': 10,
+    # 引擎最长使用时间（秒），覆盖 is_active 等不会触发版本号变化的修改
+    'MAX_AGE': 300,
+    # 匹配模式：exact-全量精确打分，approx-MinHash/LSH 近似召回后精确重排
+    'MODE': 'exact',
+    # MinHash 签名长度与 LSH 分段数（每段 LSH_NUM_PERM // LSH_BANDS 个哈希）
+    'LSH_NUM_PERM': 64,
+    'LSH_BANDS': 32,
+    # 默认探测的分段数，None 表示全部分段
+    'LSH_PROBE_BANDS': None,
+    # 候选集上限，热门标签的桶很大，超过上限后不再探测后续分段
+    'LSH_MAX_CANDIDATES': 5000,
+    # precompute_matches 为每个用户预计算并保存的匹配数
+    'PRECOMPUTE_TOP_K': 50,
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'USER_MATCH', {}))
+    return config
+
+
+class MatchEngine:
+    """用户标签稀疏矩阵及相似度计算"""
+
+    def __init__(self, user_ids, tag_lists, metric_weights=None, tag_weighting='uniform',
+                 lsh_num_perm=DEFAULTS['LSH_NUM_PERM'], lsh_bands=DEFAULTS['LSH_BANDS'],
+                 lsh_max_candidates=DEFAULTS['LSH_MAX_CANDIDATES']):
+        """
+        user_ids: 用户ID序列，按优先级排列（相似度相同时靠前者优先）
+        tag_lists: 与 user_ids 一一对应的标签列表
+        """
+        self.metric_weights = metric_weights or DEFAULTS['METRIC_WEIGHTS']
+        self.lsh_num_perm = lsh_num_perm
+        self.lsh_bands = lsh_bands
+        self.lsh_max_candidates = lsh_max_candidates
+        self._lsh = None
+        self._lsh_lock = threading.Lock()
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.row_of = {int(user_id): row for row, user_id in enumerate(self.user_ids)}
+
+        # CSR：每个用户的标签下标
+        self.vocab = {}
+        indptr = [0]
+        indices = []
+        for tags in tag_lists:
+            for tag in normalize_tags(tags):
+                indices.append(self.vocab.setdefault(tag, len(self.vocab)))
+            indptr.append(len(indices))
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.tag_names = list(self.vocab)
+        rows = np.repeat(np.arange(len(self.user_ids)), np.diff(self.indptr))
+
+        # CSC：每个标签的倒排表（行号有序）
+        order = np.argsort(self.indices, kind='stable')
+        self.postings = rows[order]
+        doc_freq = np.bincount(self.indices, minlength=len(self.vocab))
+        self.tag_indptr = np.concatenate(([0], np.cumsum(doc_freq)))
+
+        if tag_weighting == 'idf':
+            self.tag_weights = np.log1p(len(self.user_ids) / np.maximum(doc_freq, 1))
+            self.unknown_weight = float(np.log1p(len(self.user_ids)))
+        else:
+            self.tag_weights = np.ones(len(self.vocab))
+            self.unknown_weight = 1.0
+
+        # 每个用户的标签权重和 / 平方和，分别用于 Jaccard 的并集和余弦的范数
+        entry_weights = self.tag_weights[self.indices]
+        self.row_weight = np.bincount(rows, weights=entry_weights, minlength=len(self.user_ids))
+        self.row_weight2 = np.bincount(rows, weights=entry_weights ** 2, minlength=len(self.user_ids))
+
+    @classmethod
+    def from_db(cls, config=None):
+        config = config or get_config()
+        rows = (User.objects.filter(is_active=True)
+                .order_by('-createTime', '-id')
+                .values_list('id', 'tags'))
+        user_ids = []
+        tag_lists = []
+        for user_id, tags in rows.iterator(chunk_size=5000):
+            user_ids.append(user_id)
+            tag_lists.append(tags)
+        return cls(user_ids, tag_lists,
+                   metric_weights=config['METRIC_WEIGHTS'],
+                   tag_weighting=config['TAG_WEIGHTING'],
+                   lsh_num_perm=config['LSH_NUM_PERM'],
+                   lsh_bands=config['LSH_BANDS'],
+                   lsh_max_candidates=config['LSH_MAX_CANDIDATES'])
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def row_tags(self, row):
+        """某一行用户的标签列表"""
+        return [self.tag_names[i] for i in self.indices[self.indptr[row]:self.indptr[row + 1]]]
+
+    def _query(self, tags):
+        """查询标签 -> (已知标签下标, 查询权重和, 查询权重平方和)"""
+        tags = normalize_tags(tags)
+        known = np.asarray([self.vocab[tag] for tag in tags if tag in self.vocab], dtype=np.int64)
+        unknown = len(tags) - len(known)
+        weights = self.tag_weights[known]
+        query_weight = weights.sum() + unknown * self.unknown_weight
+        query_weight2 = (weights ** 2).sum() + unknown * self.unknown_weight ** 2
+        return known, query_weight, query_weight2
+
+    def _gather(self, tag_indices):
+        """拼接若干标签的倒排表，返回 (行号, 对应标签下标)"""
+        starts = self.tag_indptr[tag_indices]
+        lengths = self.tag_indptr[tag_indices + 1] - starts
+        total = int(lengths.sum())
+        if not total:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        # 把多个 [start, start+length) 区间展开成一个下标数组
+        offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        positions = np.arange(total) + offsets
+        return self.postings[positions], np.repeat(tag_indices, lengths)
+
+    def _similarity(self, inter, inter2, query_weight, query_weight2, rows):
+        """根据交集权重计算加权后的综合相似度"""
+        score = np.zeros(len(rows))
+        jaccard_weight = self.metric_weights.get('jaccard', 0)
+        cosine_weight = self.metric_weights.get('cosine', 0)
+        if jaccard_weight:
+            union = query_weight + self.row_weight[rows] - inter
+            score += jaccard_weight * inter / union
+        if cosine_weight:
+            norm = np.sqrt(query_weight2 * self.row_weight2[rows])
+            score += cosine_weight * np.divide(inter2, norm, out=np.zeros(len(rows)), where=norm > 0)
+        return score
+
+    def score(self, tags, rows=None):
+        """计算查询标签与用户的相似度
+
+        rows 为 None 时沿查询标签的倒排表在全部用户上计算，返回 (有交集的行号, 相似度)；
+        否则只读取给定行的标签计算，代价与 len(rows) 成正比。
+        """
+        known, query_weight, query_weight2 = self._query(tags)
+        if rows is None:
+            hit_rows, hit_tags = self._gather(known)
+            weights = self.tag_weights[hit_tags]
+            inter = np.bincount(hit_rows, weights=weights, minlength=len(self))
+            inter2 = np.bincount(hit_rows, weights=weights ** 2, minlength=len(self))
+            rows = np.flatnonzero(inter)
+            inter, inter2 = inter[rows], inter2[rows]
+        else:
+            rows = np.asarray(rows, dtype=np.int64)
+            starts = self.indptr[rows]
+            lengths = self.indptr[rows + 1] - starts
+            offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+            entry_tags = self.indices[np.arange(int(lengths.sum())) + offsets]
+            local = np.repeat(np.arange(len(rows)), lengths)
+            weights = np.where(np.isin(entry_tags, known), self.tag_weights[entry_tags], 0.0)
+            inter = np.bincount(local, weights=weights, minlength=len(rows))
+            inter2 = np.bincount(local, weights=weights ** 2, minlength=len(rows))
+        return rows, self._similarity(inter, inter2, query_weight, query_weight2, rows)
+
+    def top_rows(self, rows, scores, k):
+        """按相似度降序取前 k 行，相似度相同时行号小的优先"""
+        keep = scores > 0
+        rows, scores = rows[keep], scores[keep]
+        if len(rows) > k:
+            # 第 k 名可能有并列，保留所有并列项再按行号决出，保证结果稳定
+            kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+            part = scores >= kth
+            rows, scores = rows[part], scores[part]
+        order = np.lexsort((rows, -scores))[:k]
+        return rows[order], scores[order]
+
+    @property
+    def lsh(self):
+        """MinHash/LSH 索引，首次使用近似模式时构建"""
+        if self._lsh is None:
+            with self._lsh_lock:
+                if self._lsh is None:
+                    self._lsh = LSHIndex(self, num_perm=self.lsh_num_perm, bands=self.lsh_bands)
+        return self._lsh
+
+    def top_k(self, tags, k, exclude_id=None, approx=False, bands=None):
+        """返回与标签最相似的 k 个用户ID
+
+        approx 为真时只在 LSH 候选集上精确打分，bands 为探测的分段数。
+        """
+        if k <= 0 or not len(self):
+            return []
+        if approx:
+            candidates = self.lsh.candidates(tags, bands, limit=self.lsh_max_candidates)
+            rows, scores = self.score(tags, rows=candidates)
+        else:
+            rows, scores = self.score(tags)
+        if exclude_id is not None and exclude_id in self.row_of:
+            keep = rows != self.row_of[exclude_id]
+            rows, scores = rows[keep], scores[keep]
+        rows, _ = self.top_rows(rows, scores, k)
+        return self.user_ids[rows].tolist()
+
+    def batch_top_k(self, rows, k, max_pairs=5_000_000):
+        """批量计算若干用户各自的 top-k 匹配
+
+        相当于分块计算 X[rows] · Xᵀ：每块内把查询行的标签条目沿倒排表展开成
+        (查询行, 候选行) 对并聚合交集权重，块大小按展开后的对数限制在 max_pairs
+        左右，内存占用与用户总数无关。依次产出 (行号, 匹配行号数组, 相似度数组)。
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        # 每个查询行会展开出的候选对数 = 其各标签的文档频率之和
+        doc_freq = np.diff(self.tag_indptr)
+        entry_rows = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+        row_pairs = np.bincount(entry_rows, weights=doc_freq[self.indices], minlength=len(self))
+        cumulative = np.cumsum(row_pairs[rows])
+
+        start = 0
+        while start < len(rows):
+            base = cumulative[start - 1] if start else 0
+            end = int(np.searchsorted(cumulative, base + max_pairs, side='right'))
+            end = max(end, start + 1)
+            yield from self._chunk_top_k(rows[start:end], k)
+            start = end
+
+    def _chunk_top_k(self, chunk, k):
+        starts = self.indptr[chunk]
+        lengths = self.indptr[chunk + 1] - starts
+        offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        entry_tags = self.indices[np.arange(int(lengths.sum())) + offsets]
+        entry_local = np.repeat(np.arange(len(chunk)), lengths)
+
+        # 沿倒排表展开成 (查询行, 候选行) 对
+        hit_rows, hit_tags = self._gather(entry_tags)
+        pair_local = np.repeat(entry_local, np.diff(self.tag_indptr)[entry_tags])
+        weights = self.tag_weights[hit_tags]
+        keys = pair_local * len(self) + hit_rows
+        keys, inverse = np.unique(keys, return_inverse=True)
+        inter = np.bincount(inverse, weights=weights, minlength=len(keys))
+        inter2 = np.bincount(inverse, weights=weights ** 2, minlength=len(keys))
+        local, candidates = np.divmod(keys, len(self))
+
+        # 去掉自己
+        keep = candidates != chunk[local]
+        local, candidates, inter, inter2 = local[keep], candidates[keep], inter[keep], inter2[keep]
+        query_rows = chunk[local]
+        scores = self._similarity(inter, inter2, self.row_weight[query_rows],
+                                  self.row_weight2[query_rows], candidates)
+
+        # 每个查询行内按 (相似度降序, 行号升序) 排序后取前 k 个
+        order = np.lexsort((candidates, -scores, local))
+        local, candidates, scores = local[order], candidates[order], scores[order]
+        bounds = np.searchsorted(local, np.arange(len(chunk) + 1))
+        for i, row in enumerate(chunk):
+            left, right = bounds[i], min(bounds[i + 1], bounds[i] + k)
+            yield int(row), candidates[left:right], scores[left:right]
+
+
+class LSHIndex:
+    """基于 MinHash 签名的 LSH 分桶索引
+
+    签名第 i 位为 min over tags of h_i(tag)，两个用户签名某一位相同的概率等于
+    其标签集合的 Jaccard 相似度。签名被切成 bands 段，每段哈希成一个 64 位桶键，
+    按桶键排序后查询只需二分查找，候选生成与用户总数无关。
+    """
+
+    # 2^31 - 1，保证 a * x + b 在 uint64 内不溢出
+    PRIME = (1 << 31) - 1
+    # 分批计算签名，限制 (标签条目数 × 签名长度) 中间矩阵的内存
+    CHUNK_ENTRIES = 1 << 18
+
+    def __init__(self, engine, num_perm=64, bands=32, seed=20241204):
+        if num_perm % bands:
+            raise ValueError('LSH_NUM_PERM 必须是 LSH_BANDS 的整数倍')
+        self.num_perm = num_perm
+        self.bands = bands
+        self.band_rows = num_perm // bands
+
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, self.PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, self.PRIME, size=num_perm, dtype=np.uint64)
+        # 把每段的若干个哈希值混合成一个桶键
+        self.mix = rng.integers(1, np.iinfo(np.int64).max, size=self.band_rows, dtype=np.uint64) | np.uint64(1)
+
+        vocab_hashes = np.zeros(len(engine.vocab), dtype=np.uint64)
+        for tag, index in engine.vocab.items():
+            vocab_hashes[index] = self.tag_hash(tag)
+        signatures, rows = self._signatures(engine, vocab_hashes)
+
+        # 每个分段：按桶键排序后的 (桶键, 行号)
+        self.band_keys = []
+        self.band_rows_sorted = []
+        keys = self._band_keys(signatures)
+        for band in range(bands):
+            order = np.argsort(keys[:, band], kind='stable')
+            self.band_keys.append(keys[order, band])
+            self.band_rows_sorted.append(rows[order])
+
+    @staticmethod
+    def tag_hash(tag):
+        return zlib.crc32(tag.encode('utf-8')) & 0x7fffffff
+
+    def _minhash(self, hashes):
+        """标签哈希 (n,) -> 各哈希函数下的取值 (n, num_perm)"""
+        return (hashes[:, None] * self.a + self.b) % np.uint64(self.PRIME)
+
+    def _signatures(self, engine, vocab_hashes):
+        """计算所有有标签用户的签名，返回 (签名矩阵, 对应行号)"""
+        lengths = np.diff(engine.indptr)
+        rows = np.flatnonzero(lengths)
+        signatures = np.empty((len(rows), self.num_perm), dtype=np.uint64)
+        start = 0
+        while start < len(rows):
+            # 按标签条目数切块
+            entry_start = engine.indptr[rows[start]]
+            end = int(np.searchsorted(engine.indptr[rows + 1], entry_start + self.CHUNK_ENTRIES, side='right'))
+            end = max(end, start + 1)
+            chunk = rows[start:end]
+            entry_end = engine.indptr[chunk[-1] + 1]
+            values = self._minhash(vocab_hashes[engine.indices[entry_start:entry_end]])
+            # 有标签的行在 CSR 中连续（空行不占条目），reduceat 的分段起点即各行起点
+            signatures[start:end] = np.minimum.reduceat(values, engine.indptr[chunk] - entry_start, axis=0)
+            start = end
+        return signatures, rows
+
+    def _band_keys(self, signatures):
+        """签名 (n, num_perm) -> 桶键 (n, bands)，uint64 乘法按 2^64 回绕"""
+        banded = signatures.reshape(len(signatures), self.bands, self.band_rows)
+        with np.errstate(over='ignore'):
+            return (banded * self.mix).sum(axis=2, dtype=np.uint64)
+
+    def candidates(self, tags, bands=None, limit=None):
+        """与查询标签至少在一个分段落入同一桶的用户行号
+
+        limit 为候选数上限，达到后停止探测；同一桶内按行号（即新用户优先）截断。
+        """
+        tags = normalize_tags(tags)
+        if not tags:
+            return np.empty(0, dtype=np.int64)
+        hashes = np.asarray([self.tag_hash(tag) for tag in tags], dtype=np.uint64)
+        signature = self._minhash(hashes).min(axis=0)
+        keys = self._band_keys(signature[None, :])[0]
+
+        bands = self.bands if bands is None else max(1, min(int(bands), self.bands))
+        found = []
+        total = 0
+        for band in range(bands):
+            sorted_keys = self.band_keys[band]
+            left = np.searchsorted(sorted_keys, keys[band], side='left')
+            right = np.searchsorted(sorted_keys, keys[band], side='right')
+            if limit:
+                right = min(right, left + limit)
+            if right > left:
+                found.append(self.band_rows_sorted[band][left:right])
+                total += right - left
+            if limit and total >= limit:
+                break
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        rows = np.unique(np.concatenate(found))
+        return rows[:limit] if limit else rows
+
+
+# (引擎, 构建时的标签数据版本号, 构建时间)，整体替换，读取时不加锁
+_engine = (None, None, 0.0)
+# 同一时刻只有一个线程重建
+_engine_build_lock = threading.Lock()
+
+
+def get_engine():
+    """获取进程内的匹配引擎，必要时重建
+
+    同一时刻只有一个线程构建新引擎，构建完成后整体替换；构建期间其他请求
+    不等待，继续使用旧引擎，只有进程内还没有引擎时才需要等待首次构建。
+    """
+    global _engine
+    config = get_config()
+    version = index_version()
+    engine, engine_version, built_at = _engine
+    age = time.monotonic() - built_at
+    stale = (engine is None
+             or age >= config['MAX_AGE']
+             or (version != engine_version and age >= config['REFRESH_INTERVAL']))
+    if not stale:
+        return engine
+
+    if not _engine_build_lock.acquire(blocking=engine is None):
+        # 其他线程正在重建
+        return engine
+    try:
+        # 等锁期间可能已被其他线程重建
+        if _engine[0] is not None and _engine[2] != built_at:
+            return _engine[0]
+        engine = MatchEngine.from_db(config)
+        _engine = (engine, version, time.monotonic())
+        return engine
+    finally:
+        _engine_build_lock.release()
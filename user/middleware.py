@@ -0,0 +1,64 @@
+# user/middleware.py
+"""带用户缓存的认证中间件，替换 django.contrib.auth 的 AuthenticationMiddleware
+
+Django 每个已登录请求都要按会话里的用户ID查一次 user 表。这里先从进程内的用户
+缓存（user/user_cache.py）取，并且和 ``django.contrib.auth.get_user`` 一样校验
+后端和会话哈希（改过密码的旧会话不能通过）。缓存未命中或校验不通过时交给
+Django 原来的流程处理（查库、旧密钥兼容、清除失效会话），查到的用户写回缓存。
+"""
+from functools import partial
+
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+from .models import User
+from .user_cache import cache_user, cached_user
+
+
+def _verified_cached_user(user_id, backend_path, session_hash):
+    if user_id is None or backend_path not in settings.AUTHENTICATION_BACKENDS or not session_hash:
+        return None
+    user = cached_user(User._meta.pk.to_python(user_id))
+    if user is None or not user.is_active:
+        return None
+    if not constant_time_compare(session_hash, user.get_session_auth_hash()):
+        return None
+    return user
+
+
+def get_user(request):
+    if not hasattr(request, '_cached_user'):
+        session = request.session
+        user = _verified_cached_user(
+            session.get(SESSION_KEY), session.get(BACKEND_SESSION_KEY), session.get(HASH_SESSION_KEY))
+        if user is None:
+            user = auth.get_user(request)
+            if user.is_authenticated:
+                cache_user(user)
+        request._cached_user = user
+    return request._cached_user
+
+
+async def auser(request):
+    if not hasattr(request, '_acached_user'):
+        session = request.session
+        user = _verified_cached_user(
+            await session.aget(SESSION_KEY), await session.aget(BACKEND_SESSION_KEY),
+            await session.aget(HASH_SESSION_KEY))
+        if user is None:
+            user = await auth.aget_user(request)
+            if user.is_authenticated:
+                cache_user(user)
+        request._acached_user = user
+    return request._acached_user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_user(request))
+        request.auser = partial(auser, request)
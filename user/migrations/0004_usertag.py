@@ -0,0 +1,50 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+import json
+
+
+def build_tag_index(apps, schema_editor):
+    User = apps.get_model('user', 'User')
+    UserTag = apps.get_model('user', 'UserTag')
+
+    batch = []
+    for user_id, tags in User.objects.values_list('id', 'tags').iterator():
+        # 兼容测试数据中以JSON字符串存储的标签
+        if isinstance(tags, str):
+            try:
+                tags = json.loads(tags)
+            except json.JSONDecodeError:
+                tags = []
+        if not isinstance(tags, list):
+            continue
+        for tag in {str(tag).strip()[:128] for tag in tags} - {''}:
+            batch.append(UserTag(userId_id=user_id, tag=tag))
+    UserTag.objects.bulk_create(batch, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0003_alter_user_options_user_avatarurl_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=128, verbose_name='标签')),
+                ('userId', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '用户标签索引',
+                'verbose_name_plural': '用户标签索引',
+                'db_table': 'user_tag',
+                'unique_together': {('tag', 'userId')},
+            },
+        ),
+        migrations.RunPython(build_tag_index, migrations.RunPython.noop),
+    ]
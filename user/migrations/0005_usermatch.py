@@ -0,0 +1,29 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0004_usertag'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserMatch',
+            fields=[
+                ('userId', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='match', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+                ('matchIds', models.JSONField(default=list, verbose_name='匹配用户ID')),
+                ('tagsDigest', models.CharField(max_length=32, verbose_name='标签摘要')),
+                ('updateTime', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '用户匹配结果',
+                'verbose_name_plural': '用户匹配结果',
+                'db_table': 'user_match',
+            },
+        ),
+    ]
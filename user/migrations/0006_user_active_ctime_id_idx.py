@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('user', '0005_usermatch'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['is_active', 'createTime', 'id'], name='user_active_ctime_id_idx'),
+        ),
+    ]
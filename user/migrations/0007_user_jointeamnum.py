@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0006_user_active_ctime_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='joinTeamNum',
+            field=models.IntegerField(default=0, verbose_name='已加入队伍数'),
+        ),
+    ]
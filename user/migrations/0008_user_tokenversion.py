@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 17:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0007_user_jointeamnum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='tokenVersion',
+            field=models.IntegerField(default=0, verbose_name='令牌版本'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0008_user_tokenversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usermatch',
+            name='topK',
+            field=models.IntegerField(default=0, verbose_name='预计算的匹配数'),
+        ),
+    ]
@@ -17,6 +17,10 @@ class User(AbstractUser):
     createTime = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updateTime = models.DateTimeField(auto_now=True, verbose_name='更新时间')
     isDelete = models.BooleanField(default=False, verbose_name='是否删除')
+    # 已加入（含创建）的队伍数，由 team 应用在加入/退出时原子增减
+    joinTeamNum = models.IntegerField(default=0, verbose_name='已加入队伍数')
+    # 令牌版本，加一即作废已签发的全部令牌（见 user/auth.py）
+    tokenVersion = models.IntegerField(default=0, verbose_name='令牌版本')
 
     def save(self, *args, **kwargs):
         # 确保tags是JSON格式
@@ -25,13 +29,71 @@ class User(AbstractUser):
                 self.tags = json.loads(self.tags)
             except json.JSONDecodeError:
                 self.tags = []
+        # 只保存部分字段时，若涉及序列化输出的字段也要刷新 updateTime，
+        # 它是用户片段缓存的版本号（见 user/fragments.py）
+        update_fields = kwargs.get('update_fields')
+        adding = self._state.adding
+        if update_fields is not None and 'updateTime' not in update_fields:
+            from .serializers import UserSerializer
+            if set(update_fields) & set(UserSerializer.Meta.fields):
+                kwargs['update_fields'] = [*update_fields, 'updateTime']
         super().save(*args, **kwargs)
+        # 同步标签倒排索引（只更新了其他字段时跳过）
+        if update_fields is None or 'tags' in update_fields:
+            from .tag_index import sync_user_tags
+            sync_user_tags(self)
+        # 认证用的进程内用户缓存中的旧数据作废
+        from .user_cache import evict_user
+        evict_user(self.id)
+        # 新用户加入用户名布隆过滤器（见 user/bloom.py）
+        if adding:
+            from .bloom import username_index
+            username_index.add(self.username)
 
     class Meta:
         db_table = 'user'
         verbose_name = '用户'
         verbose_name_plural = verbose_name
         ordering = ['-createTime']
+        indexes = [
+            # 推荐列表按 (createTime, id) 游标分页
+            models.Index(fields=['is_active', 'createTime', 'id'], name='user_active_ctime_id_idx'),
+        ]
 
     def __str__(self):
-        return f'{self.username}({self.id})'
\ No newline at end of file
+        return f'{self.username}({self.id})'
+
+
+class UserTag(models.Model):
+    """标签倒排索引：标签 -> 用户"""
+    tag = models.CharField(max_length=128, verbose_name='标签')
+    userId = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='用户')
+
+    class Meta:
+        db_table = 'user_tag'
+        verbose_name = '用户标签索引'
+        verbose_name_plural = verbose_name
+        # (tag, userId) 联合唯一索引即按用户ID有序的倒排表
+        unique_together = ('tag', 'userId')
+
+    def __str__(self):
+        return f'{self.tag} - {self.userId_id}'
+
+
+class UserMatch(models.Model):
+    """离线预计算的用户匹配结果"""
+    userId = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True,
+                                  related_name='match', verbose_name='用户')
+    matchIds = models.JSONField(default=list, verbose_name='匹配用户ID')
+    tagsDigest = models.CharField(max_length=32, verbose_name='标签摘要')
+    # 计算时的 k；matchIds 少于 topK 说明当时有交集的用户就只有这些
+    topK = models.IntegerField(default=0, verbose_name='预计算的匹配数')
+    updateTime = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        db_table = 'user_match'
+        verbose_name = '用户匹配结果'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f'{self.userId_id} -> {self.matchIds[:5]}'
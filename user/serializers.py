@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from backend.serialization import RowSerializer
 from .models import User
 
 class UserSerializer(serializers.ModelSerializer):
@@ -6,4 +7,7 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'username', 'planetCode', 'tags', 'profile', 
                  'gender', 'phone', 'email', 'userStatus', 'createTime']
-        read_only_fields = ['createTime']
\ No newline at end of file
+        read_only_fields = ['createTime']
+
+# 列表接口的快速路径：从 .values() 行构造与 UserSerializer 相同的输出
+USER_ROWS = RowSerializer.from_serializer(UserSerializer)
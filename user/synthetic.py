@@ -0,0 +1,74 @@
+# user/synthetic.py
+"""合成用户数据，供压测和基准测试使用（manage.py generate_data、bench_match）
+
+标签按 Zipf 分布抽取：少数热门标签覆盖大部分用户，其余是长尾，接近真实的标签分布。
+"""
+import re
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.db.models.functions import Length
+
+from .importer import insert_batch
+from .models import User
+
+# 排名靠前的标签用常见的真实标签，之后是 tag{i}
+COMMON_TAGS = [
+    'Python', 'Java', '前端', '后端', '算法', 'C++', '大一', '大二', '大三', '考研',
+    'Vue', 'React', 'Go', '数据库', '机器学习', 'AI', '竞赛', '篮球', '音乐', '摄影',
+    '英语', '数学建模', 'Linux', '安卓', '产品', '设计', '健身', '游戏', '电影', '旅行',
+]
+
+
+def tag_names(num_tags):
+    return COMMON_TAGS[:num_tags] + [f'tag{i}' for i in range(len(COMMON_TAGS), num_tags)]
+
+
+def zipf_tag_lists(num_users, num_tags, tags_per_user, seed, names=None):
+    """按 Zipf 分布为用户生成标签，模拟少数热门标签 + 长尾标签"""
+    rng = np.random.default_rng(seed)
+    ranks = np.arange(1, num_tags + 1)
+    probs = 1.0 / ranks
+    probs /= probs.sum()
+    counts = rng.integers(1, tags_per_user * 2, size=num_users)
+    picked = rng.choice(num_tags, size=(num_users, int(counts.max())), p=probs)
+    names = names or [f'tag{i}' for i in range(num_tags)]
+    # 同一用户重复抽到的标签只保留一次
+    return [list(dict.fromkeys(names[i] for i in row[:count])) for row, count in zip(picked, counts)]
+
+
+def next_serial(prefix):
+    """已有 prefix + 序号形式用户名的最大序号加一
+
+    按长度再按字典序取最大的一个，序号没有前导零时就是数值最大的。
+    """
+    last = (User.objects.filter(username__regex=rf'^{re.escape(prefix)}[0-9]+$')
+            .order_by(Length('username').desc(), '-username').values_list('username', flat=True).first())
+    return int(last[len(prefix):]) + 1 if last else 0
+
+
+def generate_users(count, num_tags=2000, tags_per_user=3, seed=42, prefix='synth', password='12345678',
+                   batch_size=5000):
+    """批量写入 count 个用户（用户名 prefix + 序号，接着已有的最大序号编号），逐批产出实际写入的用户数"""
+    rng = np.random.default_rng(seed)
+    # 所有合成用户共用一个密码哈希，避免为每个用户做一次 PBKDF2
+    encoded = make_password(password)
+    start = next_serial(prefix)
+    inserted = 0
+    for offset in range(0, count, batch_size):
+        size = min(batch_size, count - offset)
+        tag_lists = zipf_tag_lists(size, num_tags, tags_per_user, seed + offset, names=tag_names(num_tags))
+        genders = rng.integers(0, 2, size=size)
+        users = [
+            User(
+                username=f'{prefix}{start + offset + i}',
+                password=encoded,
+                first_name=f'用户{start + offset + i}',
+                tags=tags,
+                gender=int(gender),
+                profile=f'喜欢{"、".join(tags[:2])}' if tags else None,
+            )
+            for i, (tags, gender) in enumerate(zip(tag_lists, genders))
+        ]
+        inserted += insert_batch(users)[0]
+        yield inserted
@@ -0,0 +1,123 @@
+# user/tag_index.py
+"""标签倒排索引
+
+``UserTag`` 表按 (tag, userId) 建联合唯一索引，每个标签对应一条按用户ID有序的倒排表。
+按标签搜索时不再全表扫描解析 ``tags`` JSON，而是交给数据库做倒排表的
+求交（AND）/ 求并（OR），配合分页只读取需要的那一段。
+"""
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import User, UserTag
+
+# 索引中单个标签的最大长度，与 UserTag.tag 字段保持一致
+MAX_TAG_LENGTH = 128
+
+# 标签数据版本号，任何用户标签变化都会递增，供内存中的匹配引擎判断是否需要重建。
+# 存放在共享缓存中，各 worker 的引擎都能看到其他进程中的标签变化
+INDEX_VERSION_KEY = 'user:tag_index:version'
+
+
+def index_version():
+    """当前标签数据版本号"""
+    return cache.get(INDEX_VERSION_KEY, 0)
+
+
+def bump_index_version():
+    cache.add(INDEX_VERSION_KEY, 0, timeout=None)
+    try:
+        cache.incr(INDEX_VERSION_KEY)
+    except ValueError:
+        # 键在 add 和 incr 之间被淘汰
+        cache.set(INDEX_VERSION_KEY, 1, timeout=None)
+
+
+def normalize_tags(value):
+    """把 tags 字段统一成去重后的字符串列表
+
+    兼容历史数据中以 JSON 字符串形式存储的标签。
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            return []
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, (list, tuple)):
+        return []
+
+    tags = []
+    seen = set()
+    for tag in value:
+        tag = str(tag).strip()[:MAX_TAG_LENGTH]
+        if tag and tag not in seen:
+            seen.add(tag)
+            tags.append(tag)
+    return tags
+
+
+def tags_digest(value):
+    """标签集合的摘要，用于判断用户标签是否变化"""
+    tags = sorted(normalize_tags(value))
+    return hashlib.md5(json.dumps(tags, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def sync_user_tags(user):
+    """将用户的标签同步到倒排索引，只增删有变化的部分"""
+    tags = set(normalize_tags(user.tags))
+    with transaction.atomic():
+        existing = set(UserTag.objects.filter(userId=user).values_list('tag', flat=True))
+        removed = existing - tags
+        added = tags - existing
+        if removed:
+            UserTag.objects.filter(userId=user, tag__in=removed).delete()
+        if added:
+            UserTag.objects.bulk_create(
+                [UserTag(userId=user, tag=tag) for tag in added],
+                ignore_conflicts=True,
+            )
+    if removed or added:
+        bump_index_version()
+
+
+def rebuild_index(batch_size=1000):
+    """根据 User.tags 全量重建倒排索引，返回写入的索引条数"""
+    total = 0
+    with transaction.atomic():
+        UserTag.objects.all().delete()
+        batch = []
+        rows = User.objects.order_by('id').values_list('id', 'tags')
+        for user_id, tags in rows.iterator(chunk_size=batch_size):
+            batch.extend(UserTag(userId_id=user_id, tag=tag) for tag in normalize_tags(tags))
+            if len(batch) >= batch_size:
+                UserTag.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            UserTag.objects.bulk_create(batch)
+            total += len(batch)
+    bump_index_version()
+    return total
+
+
+def filter_by_tags(queryset, tags, mode='and'):
+    """按标签过滤用户查询集
+
+    AND 模式下每个标签单独 join 一次倒排表，数据库沿第一个标签的有序倒排表
+    逐个探测其余标签的唯一索引，配合 LIMIT 可以在凑够一页后提前结束；
+    OR 模式则是多条倒排表的并集。
+    """
+    tags = normalize_tags(list(tags))
+    if not tags:
+        return queryset
+    if mode == 'or':
+        return queryset.filter(usertag__tag__in=tags).distinct()
+    for tag in tags:
+        queryset = queryset.filter(usertag__tag=tag)
+    return queryset
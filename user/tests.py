@@ -1,3 +1,1043 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+from collections import Counter
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import hashers
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.contrib.sessions.models import Session
+from django.core import signing
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from backend import hashing, log, metrics, profiling
+from backend import urls as backend_urls
+from backend.pagination import InvalidCursor, page_size_param, paginate
+from backend.sessions import SessionStore, local_sessions
+from .bloom import BloomFilter, dumps, loads, normalize, username_index
+from . import auth, matching
+from .fragments import fragment_cache, user_fragments
+from .importer import insert_batch
+from .models import User, UserMatch, UserTag
+from .serializers import UserSerializer
+from .tag_index import filter_by_tags, normalize_tags, rebuild_index, tags_digest
+from .urls import async_urlpatterns
+from .user_cache import user_cache
+
+# 异步视图测试使用的路由，与 ASYNC_VIEWS 开启时的匹配顺序一致
+urlpatterns = [path('api/user/', include(async_urlpatterns))] + backend_urls.urlpatterns
+
+
+class UserTagIndexTest(TestCase):
+    """标签倒排索引与 User.tags 保持一致，搜索结果与原来逐个解析 JSON 的方式相同"""
+
+    def setUp(self):
+        # 不使用迁移中的示例用户
+        User.objects.all().delete()
+
+    def index(self):
+        return sorted(UserTag.objects.values_list('userId_id', 'tag'))
+
+    def expected(self):
+        return sorted((user.id, tag) for user in User.objects.all() for tag in normalize_tags(user.tags))
+
+    def test_normalize_tags(self):
+        self.assertEqual(normalize_tags(None), [])
+        self.assertEqual(normalize_tags('" Java "'), ['Java'])
+        self.assertEqual(normalize_tags('["Java", "Go", "Java"]'), ['Java', 'Go'])
+        self.assertEqual(normalize_tags('not json'), [])
+        self.assertEqual(normalize_tags({'tag': 'Java'}), [])
+        self.assertEqual(normalize_tags(['Java', ' ', 'Python ', 3]), ['Java', 'Python', '3'])
+        self.assertEqual(normalize_tags(['x' * 200]), ['x' * 128])
+
+    def test_sync_on_save(self):
+        user = User.objects.create(username='tagged', tags=['Java', 'Go'])
+        other = User.objects.create(username='untagged')
+        self.assertEqual(self.index(), [(user.id, 'Go'), (user.id, 'Java')])
+
+        user.tags = '["Go", "Python"]'
+        user.save()
+        self.assertEqual(self.index(), [(user.id, 'Go'), (user.id, 'Python')])
+
+        # 只保存其他字段时不动索引
+        User.objects.filter(id=user.id).update(tags=['Rust'])
+        user.refresh_from_db()
+        user.profile = '简介'
+        user.save(update_fields=['profile'])
+        self.assertEqual(self.index(), [(user.id, 'Go'), (user.id, 'Python')])
+
+        user.save(update_fields=['tags'])
+        other.tags = ['Rust']
+        other.save()
+        self.assertEqual(self.index(), self.expected())
+
+        user.delete()
+        self.assertEqual(self.index(), [(other.id, 'Rust')])
+
+    def test_rebuild_after_bulk_writes(self):
+        # bulk_create 和 update 绕过 User.save，需要重建索引
+        User.objects.bulk_create([User(username=f'bulk{i}', tags=['Java', f'tag{i % 3}']) for i in range(10)])
+        User.objects.filter(username='bulk0').update(tags=['Go'])
+        UserTag.objects.create(userId=User.objects.get(username='bulk1'), tag='stale')
+        self.assertEqual(rebuild_index(batch_size=4), 19)
+        self.assertEqual(self.index(), self.expected())
+
+    def test_filter_by_tags(self):
+        a = User.objects.create(username='a', tags=['Java', 'Go'])
+        b = User.objects.create(username='b', tags=['Java'])
+        c = User.objects.create(username='c', tags=['Go', 'Python'])
+        User.objects.create(username='d')
+
+        def ids(tags, mode='and'):
+            return sorted(filter_by_tags(User.objects.all(), tags, mode).values_list('id', flat=True))
+
+        self.assertEqual(ids(['Java']), [a.id, b.id])
+        self.assertEqual(ids(['Java', 'Go']), [a.id])
+        self.assertEqual(ids(['Java', 'Rust']), [])
+        self.assertEqual(ids(['Java', 'Go'], 'or'), [a.id, b.id, c.id])
+        self.assertEqual(ids([' Go ', 'Go']), [a.id, c.id])
+        self.assertEqual(len(ids([])), 4)
+
+    def test_search_matches_json_scan(self):
+        rng = random.Random(7)
+        names = ['Java', 'Go', 'Python', 'C++', '大一', '男']
+        for i in range(40):
+            User.objects.create(username=f'search{i}', gender=rng.randint(0, 1),
+                                tags=rng.sample(names[:5], rng.randint(0, 3)))
+        client = APIClient()
+        for _ in range(20):
+            query = rng.sample(names, rng.randint(1, 3))
+            response = client.get('/api/user/search/tags', {'tagNameList': query})
+            # 原实现：性别标签按字段过滤，其余标签逐个检查 JSON 中是否包含
+            expected = set()
+            for user in User.objects.filter(is_active=True):
+                if all(user.gender == 0 if tag == '男' else tag in (user.tags or []) for tag in query):
+                    expected.add(user.id)
+            self.assertEqual({record['id'] for record in response.data['date']}, expected, query)
+
+
+def brute_force_scores(tag_lists, query, weights, idf=False):
+    """逐个用户计算与查询标签的综合相似度，作为匹配引擎的参照"""
+    sets = [set(normalize_tags(tags)) for tags in tag_lists]
+    doc_freq = Counter(tag for tags in sets for tag in tags)
+
+    def weight(tag):
+        return math.log1p(len(sets) / max(doc_freq[tag], 1)) if idf else 1.0
+
+    query = set(normalize_tags(query))
+    query_weight = sum(weight(tag) for tag in query)
+    query_weight2 = sum(weight(tag) ** 2 for tag in query)
+    scores = []
+    for tags in sets:
+        inter = sum(weight(tag) for tag in query & tags)
+        inter2 = sum(weight(tag) ** 2 for tag in query & tags)
+        score = 0.0
+        if inter:
+            score += weights.get('jaccard', 0) * inter / (query_weight + sum(weight(tag) for tag in tags) - inter)
+            norm = math.sqrt(query_weight2 * sum(weight(tag) ** 2 for tag in tags))
+            score += weights.get('cosine', 0) * inter2 / norm
+        scores.append(score)
+    return scores
+
+
+def brute_force_top_k(user_ids, tag_lists, query, k, exclude_id=None):
+    """等权 Jaccard 下的前 k 个用户，相似度相同时排在前面的用户优先"""
+    scores = brute_force_scores(tag_lists, query, {'jaccard': 1.0})
+    ranked = sorted((-score, row) for row, score in enumerate(scores)
+                    if score > 0 and user_ids[row] != exclude_id)
+    return [user_ids[row] for _, row in ranked[:k]]
+
+
+class UserMatchEngineTest(TestCase):
+    """匹配引擎的排序与逐个计算的参照一致，标签变化后重建"""
+
+    def setUp(self):
+        self.addCleanup(setattr, matching, '_engine', (None, None, 0.0))
+        rng = random.Random(11)
+        vocab = [f'tag{i}' for i in range(30)]
+        self.user_ids = list(range(1000, 1300))
+        # 标签数少、重复多，制造大量并列
+        self.tag_lists = [rng.sample(vocab[:rng.choice([5, 10, 30])], rng.randint(0, 4)) for _ in self.user_ids]
+        self.queries = [rng.sample(vocab, rng.randint(1, 4)) + ['unknown'] * rng.randint(0, 1) for _ in range(30)]
+
+    def test_exact_ranking_and_ties(self):
+        engine = matching.MatchEngine(self.user_ids, self.tag_lists)
+        for query in self.queries:
+            for k in (1, 10, 50):
+                exclude = self.user_ids[0]
+                self.assertEqual(engine.top_k(query, k, exclude_id=exclude),
+                                 brute_force_top_k(self.user_ids, self.tag_lists, query, k, exclude))
+        # 标签完全相同的用户按传入顺序排列
+        engine = matching.MatchEngine([3, 1, 2], [['Java'], ['Java'], ['Java']])
+        self.assertEqual(engine.top_k(['Java'], 2), [3, 1])
+        self.assertEqual(engine.top_k(['Java'], 5, exclude_id=1), [3, 2])
+        self.assertEqual(engine.top_k(['Go'], 5), [])
+        self.assertEqual(engine.top_k(['Java'], 0), [])
+
+    def test_weighted_scores(self):
+        weights = {'jaccard': 0.3, 'cosine': 0.7}
+        engine = matching.MatchEngine(self.user_ids, self.tag_lists, metric_weights=weights, tag_weighting='idf')
+        for query in self.queries:
+            expected = brute_force_scores(self.tag_lists, query, weights, idf=True)
+            rows, scores = engine.score(query)
+            for row, score in zip(rows, scores):
+                self.assertAlmostEqual(score, expected[row])
+            self.assertEqual(sum(1 for score in expected if score > 0), len(rows))
+            # 前 k 名的相似度与参照中最高的 k 个相同（并列时顺序可能因浮点误差不同）
+            top = engine.top_k(query, 10)
+            self.assertEqual(
+                [round(expected[engine.row_of[user_id]], 9) for user_id in top],
+                [round(score, 9) for score in sorted((score for score in expected if score > 0), reverse=True)[:10]],
+            )
+
+    def test_from_db_excludes_inactive_and_self(self):
+        User.objects.all().delete()
+        me = User.objects.create(username='me', tags=['Java', 'Go'])
+        twin = User.objects.create(username='twin', tags=['Java', 'Go'])
+        User.objects.create(username='inactive', tags=['Java', 'Go'], is_active=False)
+        partial = User.objects.create(username='partial', tags=['Java'])
+        User.objects.create(username='other', tags=['Rust'])
+        cache.clear()
+        matching._engine = (None, None, 0.0)
+
+        client = APIClient()
+        client.force_authenticate(me)
+        response = client.get('/api/user/match', {'num': 10})
+        self.assertEqual([record['id'] for record in response.data['date']], [twin.id, partial.id])
+
+    @override_settings(USER_MATCH={'REFRESH_INTERVAL': 0})
+    def test_rebuild_after_version_bump(self):
+        cache.clear()
+        matching._engine = (None, None, 0.0)
+        user = User.objects.create(username='rebuild', tags=['Java'])
+        engine = matching.get_engine()
+        self.assertIs(matching.get_engine(), engine)
+
+        user.tags = ['Go']
+        user.save()
+        rebuilt = matching.get_engine()
+        self.assertIsNot(rebuilt, engine)
+        self.assertEqual(rebuilt.row_tags(rebuilt.row_of[user.id]), ['Go'])
+        self.assertIs(matching.get_engine(), rebuilt)
+
+    @override_settings(USER_MATCH={'REFRESH_INTERVAL': 0})
+    def test_rebuild_does_not_block_readers(self):
+        cache.clear()
+        old = matching.MatchEngine([1], [['Java']])
+        matching._engine = (old, -1, 0.0)
+        started, release = threading.Event(), threading.Event()
+        new = matching.MatchEngine([1], [['Go']])
+
+        def slow_build(config=None):
+            started.set()
+            release.wait(5)
+            return new
+
+        with mock.patch.object(matching.MatchEngine, 'from_db', side_effect=slow_build):
+            builder = threading.Thread(target=matching.get_engine)
+            builder.start()
+            self.assertTrue(started.wait(5))
+            # 重建期间其他请求直接拿到旧引擎
+            self.assertIs(matching.get_engine(), old)
+            release.set()
+            builder.join()
+        self.assertIs(matching.get_engine(), new)
+
+
+class UserMatchApproxTest(TestCase):
+    """近似模式：召回率随探测分段数提高，候选集不超过上限"""
+
+    def setUp(self):
+        rng = random.Random(5)
+        vocab = [f'tag{i}' for i in range(200)]
+        # 同组用户共享大部分标签，每个查询都有足够多的相似用户
+        groups = [rng.sample(vocab, 6) for _ in range(40)]
+        self.tag_lists = [rng.sample(rng.choice(groups), rng.randint(3, 6)) + rng.sample(vocab, rng.randint(0, 2))
+                          for _ in range(3000)]
+        self.engine = matching.MatchEngine(list(range(len(self.tag_lists))), self.tag_lists)
+
+    def recall(self, bands, k=10):
+        """近似结果中相似度不低于精确第 k 名的比例（并列的都算命中）"""
+        total = 0.0
+        queries = range(0, len(self.tag_lists), 30)
+        for user_id in queries:
+            tags = self.tag_lists[user_id]
+            rows, scores = self.engine.score(tags)
+            exact_scores = dict(zip(rows.tolist(), scores.tolist()))
+            exact = self.engine.top_k(tags, k, exclude_id=user_id)
+            kth = exact_scores[exact[-1]]
+            approx = self.engine.top_k(tags, k, exclude_id=user_id, approx=True, bands=bands)
+            self.assertNotIn(user_id, approx)
+            # 候选集上按精确相似度重排
+            approx_scores = [exact_scores.get(i, 0.0) for i in approx]
+            self.assertEqual(approx_scores, sorted(approx_scores, reverse=True))
+            total += sum(score >= kth for score in approx_scores) / k
+        return total / len(queries)
+
+    def test_recall_against_exact(self):
+        recalls = [self.recall(bands) for bands in (1, 8, 32)]
+        self.assertEqual(recalls, sorted(recalls))
+        self.assertGreaterEqual(recalls[1], 0.85)
+        self.assertGreaterEqual(recalls[2], 0.95)
+
+    def test_max_candidates(self):
+        engine = matching.MatchEngine(list(range(500)), [['Java', 'Go']] * 500, lsh_max_candidates=50)
+        candidates = engine.lsh.candidates(['Java', 'Go'], limit=engine.lsh_max_candidates)
+        self.assertEqual(len(candidates), 50)
+        # 同一桶内按行号截断
+        self.assertEqual(candidates.tolist(), list(range(50)))
+        self.assertEqual(engine.top_k(['Java', 'Go'], 10, approx=True), list(range(10)))
+        self.assertEqual(len(engine.lsh.candidates(['Java', 'Go'])), 500)
+        self.assertEqual(len(engine.lsh.candidates([])), 0)
+
+
+class PrecomputeMatchesTest(TestCase):
+    """离线结果与在线引擎一致，按标签摘要增量重算，/api/user/match 优先读取"""
+
+    def setUp(self):
+        self.addCleanup(setattr, matching, '_engine', (None, None, 0.0))
+        User.objects.all().delete()
+        rng = random.Random(3)
+        vocab = ['Java', 'Go', 'Python', 'Rust', 'C++', '前端', '后端', '算法']
+        self.users = [User.objects.create(username=f'pre{i}', tags=rng.sample(vocab, rng.randint(1, 3)))
+                      for i in range(30)]
+        User.objects.create(username='notags')
+
+    def precompute(self, *args):
+        out = io.StringIO()
+        call_command('precompute_matches', *args, '-k', '5', stdout=out)
+        return out.getvalue()
+
+    def test_matches_online_engine_and_incremental(self):
+        self.assertIn('需要计算 30 个', self.precompute())
+        engine = matching.MatchEngine.from_db()
+        stored = dict(UserMatch.objects.values_list('userId', 'matchIds'))
+        self.assertEqual(set(stored), {user.id for user in self.users})
+        for user in self.users:
+            self.assertEqual(stored[user.id], engine.top_k(user.tags, 5, exclude_id=user.id))
+
+        self.assertIn('需要计算 0 个', self.precompute())
+        user = self.users[0]
+        user.tags = ['Haskell']
+        user.save()
+        self.assertIn('需要计算 1 个', self.precompute())
+        self.assertEqual(UserMatch.objects.get(userId=user).matchIds, [])
+
+        User.objects.filter(id=self.users[1].id).update(is_active=False)
+        self.precompute('--full')
+        self.assertFalse(UserMatch.objects.filter(userId=self.users[1].id).exists())
+
+    def test_view_reads_precomputed_and_skips_inactive(self):
+        me = self.users[0]
+        others = [user.id for user in self.users[1:]]
+        # 与引擎结果不同的顺序，确认读取的是离线结果
+        UserMatch.objects.create(userId=me, matchIds=others[::-1], tagsDigest=tags_digest(me.tags))
+        User.objects.filter(id__in=others[-3:]).update(is_active=False)
+
+        client = APIClient()
+        client.force_authenticate(me)
+        response = client.get('/api/user/match', {'num': 4})
+        self.assertEqual([record['id'] for record in response.data['date']], others[-4::-1][:4])
+
+        # 离线结果不足 num 个时改用在线引擎
+        response = client.get('/api/user/match', {'num': 27})
+        engine_ids = matching.MatchEngine.from_db().top_k(me.tags, 27, exclude_id=me.id)
+        expected = [user_id for user_id in engine_ids if user_id not in others[-3:]]
+        self.assertEqual([record['id'] for record in response.data['date']], expected)
+
+        # 标签变化后离线结果失效，改用在线引擎
+        me.tags = ['Haskell']
+        me.save()
+        response = client.get('/api/user/match', {'num': 4})
+        self.assertEqual(response.data['date'], [])
+
+
+    def test_view_falls_back_when_precomputed_too_short(self):
+        me = self.users[0]
+        me.tags = ['Java', 'Go', 'Python', '算法']
+        me.save()
+        self.precompute()
+        client = APIClient()
+        client.force_authenticate(me)
+        engine_ids = matching.MatchEngine.from_db().top_k(me.tags, 10, exclude_id=me.id)
+        self.assertEqual(len(engine_ids), 10)
+
+        # 用 -k 5 计算的结果不够 10 个
+        response = client.get('/api/user/match', {'num': 10})
+        self.assertEqual([record['id'] for record in response.data['date']], engine_ids)
+
+        # 停用的用户超出余量
+        stored = UserMatch.objects.get(userId=me).matchIds
+        User.objects.filter(id__in=stored[:2]).update(is_active=False)
+        response = client.get('/api/user/match', {'num': 4})
+        self.assertEqual(len(response.data['date']), 4)
+        self.assertFalse(set(stored[:2]) & {record['id'] for record in response.data['date']})
+
+        # 计算时有交集的用户就不足 topK 个，不再查在线引擎
+        UserMatch.objects.filter(userId=me).update(matchIds=stored[2:4], topK=5)
+        with mock.patch('user.views.get_engine') as get_engine:
+            response = client.get('/api/user/match', {'num': 4})
+        get_engine.assert_not_called()
+        self.assertEqual([record['id'] for record in response.data['date']], stored[2:4])
+
+
+class KeysetPaginationTest(TestCase):
+    """游标分页逐页走完不重不漏，每页条数限制在 1..上限"""
+
+    def setUp(self):
+        cache.clear()
+        User.objects.all().delete()
+        users = [User.objects.create(username=f'page{i}') for i in range(11)]
+        # 一半用户创建时间相同，靠 id 区分先后
+        User.objects.filter(id__in=[user.id for user in users[::2]]).update(createTime=users[0].createTime)
+        self.ordered = list(User.objects.order_by('-createTime', '-id').values_list('id', flat=True))
+
+    def test_walk(self):
+        for page_size in (1, 3, 5, 11, 20):
+            ids, cursor, pages = [], None, 0
+            while True:
+                records, cursor = paginate(User.objects.all(), ['-createTime', '-id'], page_size, cursor=cursor)
+                ids.extend(user.id for user in records)
+                pages += 1
+                if cursor is None:
+                    break
+            self.assertEqual(ids, self.ordered)
+            self.assertEqual(pages, max(1, math.ceil(len(self.ordered) / page_size)))
+
+    def test_invalid_input(self):
+        with self.assertRaises(InvalidCursor):
+            paginate(User.objects.all(), ['-createTime', '-id'], 5, cursor='garbage')
+        with self.assertRaises(ValueError):
+            paginate(User.objects.all(), ['-createTime', '-id'], 0)
+        self.assertEqual([page_size_param(value, 8, 100) for value in (None, '', '0', '-3', '5', '1000')],
+                         [8, 8, 1, 1, 5, 100])
+        with self.assertRaises(ValueError):
+            page_size_param('abc', 8, 100)
+
+    def test_recommend_page_size_clamped(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='viewer'))
+        for page_size, expected in (('0', 1), ('-2', 1), ('1000', 11)):
+            response = client.get('/api/user/recommend', {'pageSize': page_size, 'cursor': ''})
+            self.assertEqual(response.data['code'], 0)
+            self.assertEqual(len(response.data['date']['records']), expected)
+            response = client.get('/api/user/recommend', {'pageSize': page_size})
+            self.assertEqual(len(response.data['date']['records']), expected)
+        response = client.get('/api/team/list', {'pageSize': '0'})
+        self.assertEqual(response.data['code'], 0)
+
+
+class UserFragmentCacheTest(TestCase):
+    """用户片段缓存按版本命中，User.save 之后不会再返回旧片段"""
+
+    def setUp(self):
+        fragment_cache.clear()
+        self.users = [User.objects.create(username=f'fragment{i}', tags=['Java']) for i in range(3)]
+
+    def test_batched_hits_and_version_bump(self):
+        users = self.users + self.users[:1]
+        self.assertEqual(user_fragments(users), [UserSerializer(user).data for user in users])
+        self.assertEqual(fragment_cache.stats(), {'hits': 0, 'misses': 3, 'size': 3})
+
+        user_fragments(users)
+        self.assertEqual(fragment_cache.stats()['hits'], 3)
+
+        user = User.objects.get(id=self.users[0].id)
+        user.profile = '新的简介'
+        user.save(update_fields=['profile'])
+        user = User.objects.get(id=user.id)
+        self.assertEqual(user_fragments([user])[0]['profile'], '新的简介')
+        self.assertEqual(fragment_cache.stats()['misses'], 4)
+
+    def test_lru_eviction(self):
+        max_entries = fragment_cache.max_entries
+        fragment_cache.max_entries = 2
+        try:
+            user_fragments(self.users)
+            self.assertEqual(fragment_cache.stats()['size'], 2)
+        finally:
+            fragment_cache.max_entries = max_entries
+
+
+class UserRecommendCursorTest(TestCase):
+    """推荐列表共享页缓存后，游标分页仍然不重不漏且不包含当前用户"""
+
+    def setUp(self):
+        cache.clear()
+        for i in range(13):
+            User.objects.create(username=f'recommend{i}')
+
+    def walk(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        ids = []
+        cursor = ''
+        while cursor is not None:
+            response = client.get('/api/user/recommend', {'pageSize': 5, 'cursor': cursor})
+            ids.extend(record['id'] for record in response.data['date']['records'])
+            cursor = response.data['date']['nextCursor']
+        return ids
+
+    def test_walk_excludes_current_user(self):
+        ordered = list(User.objects.filter(is_active=True).order_by('-createTime', '-id').values_list('id', flat=True))
+        # 分别以处在页边界和不在列表开头的用户身份翻页，共享同一份页缓存
+        for user_id in [ordered[0], ordered[4], ordered[5], ordered[-1]]:
+            user = User.objects.get(id=user_id)
+            self.assertEqual(self.walk(user), [i for i in ordered if i != user_id])
+
+
+@override_settings(ROOT_URLCONF='user.tests')
+class UserAsyncViewTest(TestCase):
+    """异步用户接口与同步版本的行为一致"""
+
+    async def test_register_login_current(self):
+        response = await self.async_client.post(
+            '/api/user/register',
+            {'userAccount': 'async_user', 'username': '异步', 'phone': '13800000000', 'userPassword': '12345678', 'checkPassword': '12345678'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.json()['code'], 0)
+        user = await User.objects.aget(id=response.json()['date'])
+        self.assertTrue(await user.acheck_password('12345678'))
+
+        response = await self.async_client.post(
+            '/api/user/register',
+            {'userAccount': 'async_user', 'username': '异步', 'phone': '13800000000', 'userPassword': '12345678', 'checkPassword': '12345678'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.json()['message'], '用户名已存在')
+
+        response = await self.async_client.post(
+            '/api/user/account/exist', {'userAccount': 'async_user'}, content_type='application/json')
+        self.assertIs(response.json()['date'], True)
+
+        # 同步版本返回相同的提示
+        with override_settings(ROOT_URLCONF='backend.urls'):
+            response = await sync_to_async(self.client.post)('/api/user/register', {
+                'userAccount': 'async_user', 'username': '同步', 'userPassword': '12345678', 'checkPassword': '12345678',
+            }, content_type='application/json')
+        self.assertEqual(response.json()['message'], '用户名已存在')
+
+        response = await self.async_client.get('/api/user/current')
+        self.assertEqual(response.status_code, 403)
+
+        response = await self.async_client.post(
+            '/api/user/login', {'userAccount': 'async_user', 'userPassword': 'wrong'}, content_type='application/json')
+        self.assertEqual(response.json()['message'], '密码错误')
+
+        response = await self.async_client.post(
+            '/api/user/login', {'userAccount': 'async_user', 'userPassword': '12345678'},
+            content_type='application/json')
+        self.assertEqual(response.json()['data']['id'], user.id)
+
+        token = response.json()['token']
+
+        response = await self.async_client.get('/api/user/current')
+        self.assertEqual(response.json()['date']['userAccount'], 'async_user')
+
+        response = await AsyncClient().get('/api/user/current', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.json()['date']['id'], user.id)
+
+        response = await self.async_client.post('/api/user/logout', headers={'Authorization': 'Bearer invalid'})
+        self.assertEqual(response.json()['code'], 0)
+        response = await self.async_client.get('/api/user/current')
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(PASSWORD_HASHING={'WORKERS': 1, 'QUEUE_DEPTH': 0})
+class PasswordHashingPoolTest(TestCase):
+    """登录、注册的密码哈希在进程池中完成，队列满时立即返回 50300"""
+
+    def login(self, password='12345678'):
+        return self.client.post(
+            '/api/user/login', {'userAccount': 'hashing', 'userPassword': password}, content_type='application/json')
+
+    def test_register_and_login(self):
+        before = hashing.stats()
+        response = self.client.post('/api/user/register', {
+            'userAccount': 'hashing', 'username': '哈希', 'phone': '13800000000',
+            'userPassword': '12345678', 'checkPassword': '12345678',
+        }, content_type='application/json')
+        self.assertEqual(response.json()['code'], 0)
+        self.assertTrue(User.objects.get(username='hashing').check_password('12345678'))
+
+        self.assertEqual(self.login('wrong').json()['message'], '密码错误')
+        self.assertEqual(self.login().json()['code'], 0)
+        after = hashing.stats()
+        self.assertEqual(after['hash_time']['count'] - before['hash_time']['count'], 3)
+        self.assertEqual(after['inflight'], 0)
+
+    def test_saturated_queue_fails_fast(self):
+        User.objects.create_user(username='hashing', password='12345678')
+        future = hashing.submit(hashers.make_password, 'busy')
+        response = self.login()
+        self.assertEqual(response.json()['code'], 50300)
+        self.assertGreaterEqual(hashing.stats()['rejected'], 1)
+
+        future.result()
+        self.assertEqual(self.login().json()['code'], 0)
+
+    def test_outdated_hash_upgraded_on_login(self):
+        encoded = hashers.PBKDF2PasswordHasher().encode('12345678', hashers.get_hasher().salt(), iterations=1000)
+        User.objects.create(username='hashing', password=encoded)
+        self.assertEqual(self.login().json()['code'], 0)
+        password = User.objects.get(username='hashing').password
+        self.assertNotEqual(password, encoded)
+        self.assertTrue(hashers.check_password('12345678', password))
+
+
+class UserTokenAuthTest(TestCase):
+    """登录签发的令牌：认证不查库，过期、篡改、撤销后失效"""
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.user = User.objects.create_user(username='token', password='12345678')
+        response = APIClient().post('/api/user/login', {'userAccount': 'token', 'userPassword': '12345678'})
+        self.token = response.data['token']
+
+    def current(self, token):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client.get('/api/user/current')
+
+    def test_authenticated_without_queries(self):
+        self.assertEqual(self.current(self.token).data['date']['id'], self.user.id)
+        with self.assertNumQueries(0):
+            response = self.current(self.token)
+        self.assertEqual(response.data['date']['id'], self.user.id)
+
+    def test_invalid_tokens_rejected(self):
+        self.assertEqual(self.current(self.token[:-1] + 'x').status_code, 403)
+        with self.settings(USER_TOKEN={'TTL': -1}):
+            self.assertEqual(self.current(self.token).data['detail'], '令牌已过期')
+
+    def test_logout_revokes_only_presented_token(self):
+        other = APIClient().post('/api/user/login', {'userAccount': 'token', 'userPassword': '12345678'}).data['token']
+        self.current(self.token)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.assertEqual(client.post('/api/user/logout').data['code'], 0)
+        self.assertEqual(self.current(self.token).data['detail'], '令牌已失效')
+        # 其他设备上的令牌仍然有效
+        self.assertEqual(self.current(other).data['date']['id'], self.user.id)
+
+    def test_logout_with_legacy_token_revokes_all(self):
+        legacy = signing.dumps({'id': self.user.id, 'ver': self.user.tokenVersion}, salt=auth.TOKEN_SALT)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {legacy}')
+        self.assertEqual(client.post('/api/user/logout').data['code'], 0)
+        self.assertEqual(self.current(legacy).data['detail'], '令牌已失效')
+        self.assertEqual(self.current(self.token).data['detail'], '令牌已失效')
+
+    def test_logout_with_bad_token_still_flushes_session(self):
+        for bad in (self.token[:-1] + 'x', self.token):
+            client = APIClient()
+            client.force_login(self.user)
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {bad}')
+            with self.settings(USER_TOKEN={'TTL': -1}):
+                response = client.post('/api/user/logout')
+            self.assertEqual(response.data['code'], 0)
+            client.credentials()
+            self.assertEqual(client.get('/api/user/current').status_code, 403)
+        # 令牌无效时不撤销
+        self.assertEqual(self.current(self.token).data['date']['id'], self.user.id)
+
+    def test_save_refreshes_cached_user(self):
+        self.current(self.token)
+        self.user.phone = '13800000000'
+        self.user.save(update_fields=['phone'])
+        self.assertEqual(self.current(self.token).data['date']['phone'], '13800000000')
+
+
+class CachedSessionAuthTest(TestCase):
+    """会话和用户都缓存后，已登录的 current 接口不查库；改密码、退出登录后会话失效"""
+
+    def setUp(self):
+        user_cache.clear()
+        local_sessions.clear()
+        self.user = User.objects.create_user(username='session', password='12345678')
+        self.client.post('/api/user/login', {'userAccount': 'session', 'userPassword': '12345678'},
+                         content_type='application/json')
+
+    def test_warm_request_without_queries(self):
+        self.assertEqual(self.client.get('/api/user/current').json()['date']['id'], self.user.id)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/user/current')
+        self.assertEqual(response.json()['date']['id'], self.user.id)
+
+    def test_password_change_invalidates_session(self):
+        self.client.get('/api/user/current')
+        self.user.set_password('87654321')
+        self.user.save()
+        self.assertEqual(self.client.get('/api/user/current').status_code, 403)
+
+    def test_logout(self):
+        self.client.get('/api/user/current')
+        self.client.post('/api/user/logout')
+        self.assertEqual(self.client.get('/api/user/current').status_code, 403)
+
+    def test_logout_in_other_process(self):
+        # 其他进程退出登录只删除数据库中的会话；本进程的会话缓存过期后即失效，
+        # 没有共享缓存时不能再有一层只在本进程内的缓存继续认这个会话
+        self.assertEqual(self.client.get('/api/user/current').status_code, 200)
+        Session.objects.filter(session_key=self.client.session.session_key).delete()
+        local_sessions.clear()
+        user_cache.clear()
+        self.assertEqual(self.client.get('/api/user/current').status_code, 403)
+        self.assertNotIn(CachedDBStore, SessionStore.__mro__)
+
+
+@override_settings(USERNAME_BLOOM={'MIN_CAPACITY': 1000, 'REFRESH_INTERVAL': 3600})
+class UsernameBloomTest(TestCase):
+    """用户名布隆过滤器：判定不存在的不查库，可能存在的查库确认"""
+
+    def setUp(self):
+        username_index.reset()
+        User.objects.create(username='Alice')
+
+    def exist(self, name):
+        return self.client.post('/api/user/account/exist', {'userAccount': name},
+                                content_type='application/json').json()['date']
+
+    def test_negative_skips_query(self):
+        self.assertIs(self.exist('Alice'), True)
+        with self.assertNumQueries(0):
+            self.assertIs(self.exist('nobody'), False)
+        # 大小写不同也要查库确认（MySQL 默认排序规则下两者相同）
+        self.assertIn(normalize('alice'), username_index.filter)
+
+        User.objects.create(username='bob')
+        with self.assertNumQueries(1):
+            self.assertIs(self.exist('bob'), True)
+        self.assertEqual(username_index.stats()['negatives'], 1)
+
+    def test_snapshot_then_incremental_refresh(self):
+        bloom = BloomFilter(1000, 0.01)
+        bloom.add(normalize('Alice'))
+        last_id = User.objects.get(username='Alice').id
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bloom.bin')
+            with open(path, 'wb') as f:
+                f.write(dumps(bloom, last_id))
+            # 快照之后批量导入（不经过 User.save）的用户在加载时补入
+            User.objects.bulk_create([User(username='carol', first_name='', phone='')])
+            with self.settings(USERNAME_BLOOM={'SNAPSHOT': path, 'MIN_CAPACITY': 1000}):
+                self.assertIs(self.exist('carol'), True)
+                self.assertIs(self.exist('Alice'), True)
+        self.assertEqual(loads(dumps(bloom, last_id))[0].bits, bloom.bits)
+
+    def test_late_commit_below_last_id(self):
+        # 较小的ID晚于较大的ID提交：模拟为先留出空位，过滤器读到更大的ID后再补上
+        early = User.objects.create(username='early')
+        User.objects.create(username='later')
+        User.objects.filter(id=early.id).delete()
+        self.assertIs(self.exist('Alice'), True)
+        count = username_index.filter.count
+        User.objects.bulk_create([User(id=early.id, username='late', first_name='', phone='')])
+        username_index.refreshed_at = 0.0
+        self.assertIs(self.exist('late'), True)
+        # 往回重扫的用户已在过滤器中，不重复计数
+        self.assertEqual(username_index.filter.count, count + 1)
+
+    @override_settings(USERNAME_BLOOM={'MIN_CAPACITY': 1000, 'REFRESH_INTERVAL': 0,
+                                       'REFRESH_LOOKBACK': 0, 'REBUILD_INTERVAL': 0})
+    def test_periodic_rebuild(self):
+        early = User.objects.create(username='early')
+        User.objects.create(username='later')
+        User.objects.filter(id=early.id).delete()
+        self.assertIs(self.exist('Alice'), True)
+        User.objects.bulk_create([User(id=early.id, username='late', first_name='', phone='')])
+        self.assertIs(self.exist('late'), True)
+
+    def test_insert_batch_adds_on_commit(self):
+        self.assertIs(self.exist('Alice'), True)
+        with self.captureOnCommitCallbacks(execute=True):
+            insert_batch([User(username='dave', first_name='', phone='', tags=[])])
+        with self.assertNumQueries(1):
+            self.assertIs(self.exist('dave'), True)
+
+    @override_settings(USERNAME_BLOOM={'MIN_CAPACITY': 1000, 'REFRESH_INTERVAL': 0, 'REBUILD_INTERVAL': 0})
+    def test_add_during_rebuild_survives_swap(self):
+        self.assertIs(self.exist('Alice'), True)
+        fill = username_index._fill
+
+        def fill_then_register(bloom, last_id, lookback=0):
+            last_id = fill(bloom, last_id, lookback)
+            # 扫描结束、替换之前，另一个线程注册的用户（数据库中还未提交）
+            if bloom is not username_index.filter:
+                username_index.add('racer')
+            return last_id
+
+        with mock.patch.object(username_index, '_fill', fill_then_register):
+            username_index.ensure()
+        self.assertIn(normalize('racer'), username_index.filter)
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(10000, 0.01)
+        for i in range(10000):
+            bloom.add(normalize(f'user{i}'))
+        self.assertTrue(all(normalize(f'user{i}') in bloom for i in range(10000)))
+        false_positives = sum(normalize(f'absent{i}') in bloom for i in range(20000))
+        self.assertLess(false_positives / 20000, 0.02)
+        self.assertAlmostEqual(bloom.estimated_false_positive_rate(), 0.01, delta=0.005)
+
+
+class ImportUsersTest(TestCase):
+    """import_users：标签归一化、并行哈希、跳过已存在用户、按检查点续传"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        User.objects.create(username='exists')
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def run_import(self, path, **options):
+        call_command('import_users', path, workers=1, stdout=io.StringIO(), stderr=io.StringIO(), **options)
+
+    def test_jsonl_with_checkpoint(self):
+        rows = [
+            {'userAccount': 'imp1', 'userPassword': '12345678', 'tags': ['Python', ' Python ', 'Java']},
+            {'userAccount': 'imp2', 'tags': '前端|Vue'},
+            {'userAccount': 'exists'},
+            {'userAccount': ''},
+            {'userAccount': 'imp3', 'email': 'not-an-email'},
+            {'userAccount': 'imp4', 'gender': 1},
+        ]
+        path = self.write('users.jsonl', '\n'.join(json.dumps(row, ensure_ascii=False) for row in rows) + '\n{bad json\n')
+        checkpoint = os.path.join(self.tmp.name, 'checkpoint.json')
+
+        self.run_import(path, batch_size=2, checkpoint=checkpoint, limit=3)
+        self.assertEqual(set(User.objects.filter(username__startswith='imp').values_list('username', flat=True)),
+                         {'imp1', 'imp2'})
+        self.run_import(path, batch_size=2, checkpoint=checkpoint)
+        with open(checkpoint) as f:
+            self.assertEqual(json.load(f), {'source': path, 'rows': 7, 'inserted': 3, 'skipped': 1, 'failed': 3})
+
+        imp1 = User.objects.get(username='imp1')
+        self.assertEqual(imp1.tags, ['Python', 'Java'])
+        self.assertTrue(imp1.check_password('12345678'))
+        self.assertFalse(User.objects.get(username='imp2').has_usable_password())
+        self.assertEqual(User.objects.get(username='imp4').gender, 1)
+        self.assertEqual(set(UserTag.objects.filter(userId__username__startswith='imp').values_list('tag', flat=True)),
+                         {'Python', 'Java', '前端', 'Vue'})
+
+    def test_csv(self):
+        path = self.write('users.csv', 'userAccount,username,tags,phone\ncsv1,昵称,"Go,Rust",13800000000\n')
+        self.run_import(path)
+        user = User.objects.get(username='csv1')
+        self.assertEqual((user.first_name, user.tags, user.phone), ('昵称', ['Go', 'Rust'], '13800000000'))
+
+
+class RequestMetricsTest(TestCase):
+    """请求指标按路由记录业务码和查询数，指标接口校验 TOKEN，只在 DEBUG 下按地址放行"""
+
+    def setUp(self):
+        metrics.registry.reset()
+        username_index.reset()
+        self.user = User.objects.create_user(username='metrics', password='12345678')
+
+    def test_route_code_and_queries(self):
+        client = APIClient()
+        client.force_login(self.user)
+        client.post('/api/user/update', {'id': 0}, format='json')
+        client.get('/api/user/recommend', {'pageSize': 5, 'cursor': ''})
+        client.get('/api/user/recommend', {'pageSize': 5, 'cursor': ''})
+
+        with override_settings(DEBUG=True):
+            text = client.get('/internal/metrics').content.decode()
+        self.assertIn('http_requests_total{route="api/user/update",method="POST",status="200",code="40000"} 1', text)
+        self.assertIn('http_requests_total{route="api/user/recommend",method="GET",status="200",code="0"} 2', text)
+        self.assertIn('http_request_db_queries_count{route="api/user/recommend",method="GET"} 2', text)
+        # 第一页查库，第二次命中页缓存，查询数之和就是第一次的查询数
+        histograms = metrics.registry.histograms[('api/user/recommend', 'GET')]
+        self.assertGreater(histograms[1].sum, 0)
+        self.assertLess(histograms[1].counts[0], 2)
+        self.assertIn('password_hashing_submitted', text)
+        self.assertIn('username_bloom_negatives', text)
+
+    def test_access(self):
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get('/internal/metrics').status_code, 200)
+            self.assertEqual(self.client.get('/internal/metrics', REMOTE_ADDR='10.0.0.1').status_code, 404)
+        # 非 DEBUG 且未配置 TOKEN 时，本机地址（同机反向代理转发的请求）也不放行
+        self.assertEqual(self.client.get('/internal/metrics').status_code, 404)
+        with override_settings(METRICS={'TOKEN': 'secret'}):
+            self.assertEqual(self.client.get('/internal/metrics').status_code, 404)
+            response = self.client.get('/internal/metrics', headers={'Authorization': 'Bearer secret'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+
+
+class RequestProfilingTest(TestCase):
+    """按请求头、阈值剖析请求，转储包含路由和 SQL，数量有上限"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.user = User.objects.create_user(username='profiling', password='12345678')
+        self.client = APIClient()
+        self.client.force_login(self.user)
+
+    def settings(self, **config):
+        return override_settings(PROFILING={
+            'TOKEN': 'secret', 'DIR': self.dir, 'MAX_DUMPS': 2, 'INTERVAL': 0.001, **config,
+        })
+
+    def dumps(self):
+        return sorted(name for name in os.listdir(self.dir) if name.endswith('.json'))
+
+    def test_header_trigger_and_ring(self):
+        with self.settings():
+            response = self.client.get('/api/user/recommend', {'pageSize': 5}, headers={'X-Profile': 'wrong'})
+            self.assertNotIn('X-Profile-Id', response)
+            self.assertEqual(self.dumps(), [])
+
+            for _ in range(3):
+                response = self.client.get('/api/user/recommend', {'pageSize': 5}, headers={'X-Profile': 'secret'})
+        name = response['X-Profile-Id']
+        self.assertEqual(len(self.dumps()), 2)
+        self.assertEqual(len(os.listdir(self.dir)), 4)
+        with open(os.path.join(self.dir, f'{name}.json'), encoding='utf-8') as f:
+            dump = json.load(f)
+        self.assertEqual((dump['route'], dump['method'], dump['trigger']), ('api/user/recommend', 'GET', 'header'))
+        self.assertTrue(dump['queries'])
+        with open(os.path.join(self.dir, f'{name}.collapsed'), encoding='utf-8') as f:
+            for line in f:
+                stack, count = line.rsplit(' ', 1)
+                self.assertGreater(int(count), 0)
+
+    def test_threshold_trigger(self):
+        with self.settings(ROUTE_THRESHOLDS={'api/user/current': 60}, MIN_DUMP_INTERVAL=0):
+            self.client.get('/api/user/current')
+            self.assertEqual(self.dumps(), [])
+        with self.settings(THRESHOLD=0, MIN_DUMP_INTERVAL=0):
+            self.client.get('/api/user/current')
+        self.assertEqual(len(self.dumps()), 1)
+
+    def test_route_without_threshold_not_sampled(self):
+        registered, created = [], []
+        original = profiling.Profile
+
+        def profile(*args):
+            created.append(original(*args))
+            return created[-1]
+
+        with self.settings(ROUTE_THRESHOLDS={'api/user/recommend': 60}), \
+                mock.patch.object(profiling, 'Profile', side_effect=profile), \
+                mock.patch.object(profiling.sampler, 'register', side_effect=registered.append), \
+                mock.patch.object(profiling.sampler, 'unregister'):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get('/api/user/current')
+            # 没有阈值的路由不登记到采样线程，路由解析之后的 SQL 不再记录
+            self.assertEqual(registered, [])
+            self.assertLess(len(created[0].queries), len(queries))
+            self.client.get('/api/user/recommend', {'pageSize': 5})
+        self.assertEqual(registered, [created[1]])
+        self.assertIsNotNone(created[1].sample_from)
+        self.assertTrue(created[1].queries)
+
+    def test_collapse(self):
+        stack = profiling.collapse(sys._getframe())
+        self.assertTrue(stack.endswith('test_collapse (user/tests.py:%d)' % sys._getframe().f_code.co_firstlineno))
+
+
+@override_settings(REQUEST_LOGGING={})
+class RequestLoggingTest(TestCase):
+    """日志带请求ID和路由，按路由抽样，经队列由后台线程写出"""
+
+    def setUp(self):
+        self.stream = io.StringIO()
+        target = logging.StreamHandler(self.stream)
+        target.setFormatter(log.JsonFormatter())
+        self.handler = log.QueuedHandler(target)
+        self.handler.addFilter(log.RequestContextFilter())
+        self.handler.addFilter(log.SamplingFilter())
+        logger = logging.getLogger('user')
+        handlers, level = logger.handlers, logger.level
+        logger.handlers = [self.handler]
+        logger.setLevel(logging.DEBUG)
+        self.addCleanup(setattr, logger, 'handlers', handlers)
+        self.addCleanup(logger.setLevel, level)
+        self.addCleanup(self.handler.close)
+        self.client = APIClient()
+
+    def records(self):
+        self.handler.stop()
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_request_id_and_route(self):
+        response = self.client.get('/api/user/search/tags', {'tagNameList': 'java'},
+                                   headers={'X-Request-ID': 'abc-123'})
+        self.assertEqual(response['X-Request-ID'], 'abc-123')
+        response = self.client.get('/api/user/search/tags', {'tagNameList': 'java'},
+                                   headers={'X-Request-ID': 'bad id!'})
+        generated = response['X-Request-ID']
+        self.assertRegex(generated, r'^[0-9a-f]{32}$')
+
+        records = self.records()
+        self.assertEqual({record['request_id'] for record in records}, {'abc-123', generated})
+        self.assertEqual({record['route'] for record in records}, {'api/user/search/tags'})
+        self.assertIn('按标签搜索: [\'java\']', [record['message'] for record in records])
+
+    def test_sampling(self):
+        with override_settings(REQUEST_LOGGING={'SAMPLING': {'api/user/search/tags': 0}}):
+            self.client.get('/api/user/search/tags', {'tagNameList': 'java'})
+            # 请求之外不抽样，WARNING 总是保留
+            logging.getLogger('user').info('请求外')
+        self.assertEqual([record['message'] for record in self.records()], ['请求外'])
+
+    def test_mutable_args_formatted_when_logged(self):
+        tags = ['java']
+        logging.getLogger('user').debug('标签 %s，页 %d', tags, 1)
+        tags.append('python')
+        # 不可变参数仍留给写出线程格式化
+        record = self.handler.prepare(logging.LogRecord('user', logging.DEBUG, '', 0, '页 %d', (1,), None))
+        self.assertEqual((record.msg, record.args), ('页 %d', (1,)))
+        self.assertEqual([record['message'] for record in self.records()], ["标签 ['java']，页 1"])
+
+    def test_team_password_not_logged(self):
+        user = User.objects.create_user(username='logger', password='12345678')
+        self.client.force_login(user)
+        logger = logging.getLogger('team')
+        handlers, level = logger.handlers, logger.level
+        logger.handlers = [self.handler]
+        logger.setLevel(logging.DEBUG)
+        self.addCleanup(setattr, logger, 'handlers', handlers)
+        self.addCleanup(logger.setLevel, level)
+        expire = (timezone.now() + datetime.timedelta(days=1)).isoformat()
+        self.client.post('/api/team/add', {'name': 'logged', 'description': 'd', 'expireTime': expire,
+                                           'maxNum': 5, 'status': 2, 'password': 'secret123'}, format='json')
+        messages = [record['message'] for record in self.records()]
+        self.assertTrue(any(message.startswith('创建队伍数据') for message in messages), messages)
+        self.assertFalse(any('secret123' in message for message in messages))
+
+    def test_exception_text(self):
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            logging.getLogger('user').exception('失败 %s', 1)
+        record, = self.records()
+        self.assertEqual((record['level'], record['message'], record['request_id']), ('ERROR', '失败 1', None))
+        self.assertIn('ValueError: boom', record['exc'])
@@ -1,5 +1,6 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('login', views.UserLoginView.as_view()),
@@ -11,4 +12,16 @@ urlpatterns = [
     path('match', views.UserMatchView.as_view()),
     path('update', views.UserUpdateView.as_view()),
     path('search/tags', views.UserTagSearchView.as_view()),
-]
\ No newline at end of file
+]
+
+# 异步版本，ASGI 部署（settings.ASYNC_VIEWS）时排在前面优先匹配
+async_urlpatterns = [
+    path('login', async_views.UserLoginView.as_view()),
+    path('logout', async_views.UserLogoutView.as_view()),
+    path('register', async_views.UserRegisterView.as_view()),
+    path('account/exist', async_views.UserAccountExistView.as_view()),
+    path('current', async_views.CurrentUserView.as_view()),
+]
+
+if settings.ASYNC_VIEWS:
+    urlpatterns = async_urlpatterns + urlpatterns
@@ -0,0 +1,55 @@
+# user/user_cache.py
+"""认证用的进程内用户缓存
+
+令牌认证（user/auth.py）和会话认证（user/middleware.py）每个请求都要按ID取出
+当前用户。这里把 user 表的一行在进程内缓存 ``TTL`` 秒，每次取出都用字段值构造
+新的实例，请求之间互不影响。
+
+``User.save`` 会清掉本进程里的旧数据；其他进程最多 ``TTL`` 秒后重新读库。
+密码修改由会话哈希校验、令牌撤销由 ``tokenVersion`` 校验，都在取出用户后进行。
+"""
+import time
+
+from django.conf import settings
+
+from .fragments import LRUCache
+from .models import User
+
+# 用户ID -> (过期时间, 字段值)
+user_cache = LRUCache(settings.USER_CACHE['MAX_ENTRIES'])
+USER_FIELDS = [field.attname for field in User._meta.concrete_fields]
+
+
+def cache_user(user):
+    values = tuple(getattr(user, name) for name in USER_FIELDS)
+    user_cache.set_many({user.id: (time.monotonic() + settings.USER_CACHE['TTL'], values)})
+
+
+def cached_user(user_id):
+    """缓存中未过期的用户，没有时返回 None"""
+    entry = user_cache.get_many([user_id]).get(user_id)
+    if entry is None or entry[0] <= time.monotonic():
+        return None
+    return User.from_db('default', USER_FIELDS, entry[1])
+
+
+def evict_user(user_id):
+    user_cache.delete(user_id)
+
+
+def get_user(user_id):
+    user = cached_user(user_id)
+    if user is None:
+        user = User.objects.filter(id=user_id).first()
+        if user is not None:
+            cache_user(user)
+    return user
+
+
+async def aget_user(user_id):
+    user = cached_user(user_id)
+    if user is None:
+        user = await User.objects.filter(id=user_id).afirst()
+        if user is not None:
+            cache_user(user)
+    return user
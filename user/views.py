@@ -2,16 +2,31 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
 from django.contrib.auth import login, logout
-from .serializers import UserSerializer
-from .models import User
+from .serializers import USER_ROWS, UserSerializer
+from .auth import authenticate_token, get_config as get_token_config, issue_token, revoke_token
+from .bloom import username_index
+from .fragments import user_fragments
+from .models import User, UserMatch
 from django.core.paginator import Paginator
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
+import hashlib
 import json
+import logging
 from django.db.models import Q
+from django.conf import settings
+from backend.hashing import HashingBusy, check_user_password, make_password
+from backend.pagination import encode_cursor, page_size_param, paginate
+from backend.singleflight import get_or_compute
+from .tag_index import filter_by_tags, normalize_tags, tags_digest
+from .matching import get_engine, get_config as get_match_config
+
+logger = logging.getLogger(__name__)
 
 class UserLoginView(APIView):
+    query_budget = 6  # 旧哈希升级时多一次保存密码
     permission_classes = []  # 登录接口不需要认证
     authentication_classes = []  # 登录接口不需要认证
 
@@ -21,12 +36,17 @@ class UserLoginView(APIView):
         
         try:
             user = User.objects.get(username=userAccount)
-            if user.check_password(userPassword):
+            # 校验在哈希进程池中进行，不占用请求线程的 CPU
+            if check_user_password(user, userPassword):
                 login(request, user)
-                return Response({
+                response = {
                     'code': 0,
                     'data': UserSerializer(user).data
-                })
+                }
+                # 携带令牌的请求不必再读会话（见 user/auth.py）
+                if get_token_config()['ENABLED']:
+                    response['token'] = issue_token(user)
+                return Response(response)
             else:
                 return Response({
                     'code': 40000,
@@ -39,14 +59,30 @@ class UserLoginView(APIView):
                 'data': None,
                 'message': '用户不存在'
             })
+        except HashingBusy as e:
+            return Response({
+                'code': 50300,
+                'data': None,
+                'message': str(e)
+            })
 
 @method_decorator(csrf_exempt, name='dispatch')
 class UserLogoutView(APIView):
-    authentication_classes = []  # 移除认证要求
+    query_budget = 2
+    # 令牌在 post 中自行校验：过期、已撤销或被篡改的令牌也要能退出登录，
+    # 交给认证类会在进入视图前返回 403，会话就清不掉了
+    authentication_classes = []
     permission_classes = []      # 移除权限要求
     
     def post(self, request):
         try:
+            # 用有效令牌登录的，只作废本次携带的令牌，其他设备不受影响
+            try:
+                authenticated = authenticate_token(request)
+            except AuthenticationFailed:
+                authenticated = None
+            if authenticated is not None:
+                revoke_token(*authenticated)
             logout(request)
             return Response({
                 'code': 0,
@@ -61,13 +97,14 @@ class UserLogoutView(APIView):
             })
 
 class UserAccountExistView(APIView):
+    query_budget = 3
     authentication_classes = []  # 不需要认证
     permission_classes = []      # 不需要权限
 
     def post(self, request):
         userAccount = request.data.get('userAccount')
-        # 检查用户名是否存在
-        exists = User.objects.filter(username=userAccount).exists()
+        # 检查用户名是否存在（布隆过滤器判定不存在的不查库）
+        exists = username_index.account_exists(userAccount)
         return Response({
             'code': 0,
             'date': exists,
@@ -75,6 +112,7 @@ class UserAccountExistView(APIView):
         })
 
 class UserRegisterView(APIView):
+    query_budget = 3
     authentication_classes = []  # 不需要认证
     permission_classes = []      # 不需要权限
 
@@ -100,16 +138,25 @@ class UserRegisterView(APIView):
                     'message': '两次输入的密码不一致'
                 })
             
-            # 创建用户
-            user = User.objects.create_user(
-                username=userAccount,
-                password=userPassword,
-                email=data.get('email'),
+            # 用户名已存在时不必再做一次哈希
+            if User.objects.filter(username=userAccount).exists():
+                return Response({
+                    'code': 40000,
+                    'date': None,
+                    'message': '用户名已存在'
+                })
+
+            # 创建用户（与 create_user 相同的字段处理，哈希在进程池中完成）
+            user = User(
+                username=User.normalize_username(userAccount),
+                email=User.objects.normalize_email(data.get('email')),
                 phone=data.get('phone'),
                 gender=data.get('gender', 1),
                 # 使用userAccount作为username，使用传入的username作为昵称
                 first_name=data.get('username')  # 用first_name存储昵称
             )
+            user.password = make_password(userPassword)
+            user.save()
             
             # 返回用户id
             return Response({
@@ -118,6 +165,12 @@ class UserRegisterView(APIView):
                 'message': '注册成功'
             })
             
+        except HashingBusy as e:
+            return Response({
+                'code': 50300,
+                'date': None,
+                'message': str(e)
+            })
         except Exception as e:
             return Response({
                 'code': 40000,
@@ -126,6 +179,7 @@ class UserRegisterView(APIView):
             })
         
 class CurrentUserView(APIView):
+    query_budget = 2
     def get(self, request):
         if request.user.is_authenticated:
             user = request.user
@@ -151,21 +205,43 @@ class CurrentUserView(APIView):
         })
 
 class UserRecommendView(APIView):
+    query_budget = 4
     def get(self, request):
         try:
             # 获取分页参数
-            page_size = int(request.GET.get('pageSize', 8))
+            page_size = page_size_param(request.GET.get('pageSize'), 8, USER_RECOMMEND_MAX_PAGE_SIZE)
             page_num = int(request.GET.get('pageNum', 1))
             
-            # 获取活跃用户
-            users = User.objects.filter(is_active=True).exclude(id=request.user.id)
+            # 获取活跃用户，只取序列化需要的列
+            users = User.objects.filter(is_active=True).exclude(id=request.user.id) \
+                .values(*USER_ROWS.keys())
+
+            # 传了cursor参数（首页为空字符串）时使用游标分页，翻页代价与页码无关
+            if 'cursor' in request.GET:
+                # 共享的一页走缓存，再去掉当前用户
+                rows = [
+                    row for row in recommend_page(page_size, request.GET.get('cursor'))
+                    if row['id'] != request.user.id
+                ]
+                records = rows[:page_size]
+                next_cursor = None
+                if len(rows) > page_size:
+                    next_cursor = encode_cursor(User, RECOMMEND_ORDERING, records[-1], RECOMMEND_CURSOR_SALT)
+                return Response({
+                    'code': 0,
+                    'date': {
+                        'records': USER_ROWS.serialize(records),
+                        'nextCursor': next_cursor,
+                        'total': recommend_total(),
+                    }
+                })
             
             # 分页
             paginator = Paginator(users, page_size)
             current_page = paginator.page(page_num)
             
             # 序列化
-            user_data = UserSerializer(current_page.object_list, many=True).data
+            user_data = USER_ROWS.serialize(current_page.object_list)
             
             return Response({
                 'code': 0,
@@ -183,34 +259,104 @@ class UserRecommendView(APIView):
                 'description': str(e)
             })
 
+
+RECOMMEND_ORDERING = ['-createTime', '-id']
+USER_RECOMMEND_MAX_PAGE_SIZE = 100
+RECOMMEND_CURSOR_SALT = 'user.recommend'
+
+
+def recommend_page(page_size, cursor):
+    """推荐列表中与当前用户无关的一页（.values() 行）
+
+    所有用户共享，按 USER_RECOMMEND_CACHE_TTL 单飞缓存。多取两行：去掉当前用户后
+    仍能判断是否还有下一页。
+    """
+    def compute():
+        rows, _ = paginate(
+            User.objects.filter(is_active=True).values(*USER_ROWS.keys()),
+            RECOMMEND_ORDERING, page_size + 2, cursor=cursor, salt=RECOMMEND_CURSOR_SALT,
+        )
+        return rows
+
+    key = 'user:recommend:page:%s:%s' % (page_size, hashlib.md5((cursor or '').encode('utf-8')).hexdigest())
+    return get_or_compute(key, compute, settings.USER_RECOMMEND_CACHE_TTL)
+
+
+def recommend_total():
+    """推荐用户总数（近似值）
+
+    游标分页不需要精确总数，按 USER_RECOMMEND_TOTAL_TTL 单飞缓存活跃用户数，
+    避免每次请求都 COUNT(*)。减去的 1 是当前用户自己。
+    """
+    total = get_or_compute(
+        'user:recommend:total',
+        lambda: User.objects.filter(is_active=True).count(),
+        settings.USER_RECOMMEND_TOTAL_TTL,
+    )
+    return max(total - 1, 0)
+
+
+def active_users(user_ids):
+    """按 user_ids 的顺序返回其中未停用的用户"""
+    users_by_id = User.objects.filter(is_active=True).in_bulk(user_ids)
+    return [users_by_id[user_id] for user_id in user_ids if user_id in users_by_id]
+
+
 class UserMatchView(APIView):
+    query_budget = 6  # 离线结果不足 num 个时再查一次在线结果
     def get(self, request):
         try:
             num = int(request.GET.get('num', 10))
             current_user = request.user
             
             # 获取当前用户的标签
-            current_user_tags = current_user.tags if current_user.tags else []
-            
-            # 获取其他用户
-            users = User.objects.filter(is_active=True).exclude(id=current_user.id)
+            current_user_tags = normalize_tags(current_user.tags)
             
-            # 如果有标签，进行标签匹配
+            # 如果有标签，按标签相似度排序取前num个
             if current_user_tags:
-                # 这里可以实现更复杂的标签匹配算法
-                matched_users = []
-                for user in users:
-                    user_tags = user.tags if user.tags else []
-                    if set(current_user_tags) & set(user_tags):  # 标签有交集的用户
-                        matched_users.append(user)
-                users = matched_users[:num]
+                # mode=approx 使用 MinHash/LSH 近似召回，bands 控制召回率与延迟的平衡
+                config = get_match_config()
+                mode = request.GET.get('mode', config['MODE'])
+                bands = request.GET.get('bands', config['LSH_PROBE_BANDS'])
+
+                # 优先读取 precompute_matches 离线计算的结果（标签未变化时有效）。
+                # 取出全部结果，去掉之后停用的用户再截取；不足 num 个时，除非计算时
+                # 有交集的用户就不足 topK 个，否则改用在线引擎
+                users = None
+                if mode != 'approx' and num <= config['PRECOMPUTE_TOP_K']:
+                    precomputed = UserMatch.objects.filter(userId=current_user.id) \
+                        .values_list('matchIds', 'tagsDigest', 'topK').first()
+                    if precomputed and precomputed[1] == tags_digest(current_user_tags):
+                        user_ids, _, top_k = precomputed
+                        users = active_users(user_ids)[:num]
+                        if len(users) < num and len(user_ids) >= top_k:
+                            users = None
+
+                if users is None:
+                    # 引擎中可能还有之后停用的用户，过滤后不足 num 个时加大 k 重取，
+                    # 直到够数或候选已经取完
+                    engine = get_engine()
+                    k = num
+                    while True:
+                        user_ids = engine.top_k(
+                            current_user_tags, k,
+                            exclude_id=current_user.id,
+                            approx=(mode == 'approx'),
+                            bands=int(bands) if bands else None,
+                        )
+                        users = active_users(user_ids)
+                        if len(users) >= num or len(user_ids) < k:
+                            break
+                        k *= 2
+                    users = users[:num]
             else:
                 # 如果没有标签，随机返回用户
+                users = User.objects.filter(is_active=True).exclude(id=current_user.id)
                 users = users.order_by('?')[:num]
             
             return Response({
                 'code': 0,
-                'date': UserSerializer(users, many=True).data
+                'date': user_fragments(users)
             })
         except Exception as e:
             return Response({
@@ -220,6 +366,7 @@ class UserMatchView(APIView):
             })
     
 class UserUpdateView(APIView):
+    query_budget = 4
     def post(self, request):
         try:
             # 获取要更新的用户ID和字段
@@ -254,17 +401,18 @@ class UserUpdateView(APIView):
             }
             
             # 更新字段
-            updated = False
+            updated_fields = []
             for field, model_field in allowed_fields.items():
                 if field in request.data:
                     value = request.data.get(field)
                     if field == 'gender':
                         value = int(value)  # 确保性别是整数
                     setattr(user, model_field, value)
-                    updated = True
+                    updated_fields.append(model_field)
             
-            if updated:
-                user.save()
+            if updated_fields:
+                # 只写修改过的字段，避免覆盖并发更新的计数器（如 joinTeamNum）
+                user.save(update_fields=updated_fields + ['updateTime'])
                 return Response({
                     'code': 0,
                     'date': 1,  # 前端期望大于0的值表示成功
@@ -285,18 +433,18 @@ class UserUpdateView(APIView):
             })
 
 class UserTagSearchView(APIView):
+    query_budget = 1
     authentication_classes = []
     permission_classes = []
 
     def get(self, request):
         try:
-            print("Raw request GET params:", request.GET)
             tag_list = request.GET.getlist('tagNameList', [])
             
             if not tag_list:
                 tag_list = request.GET.getlist('tagNameList[]', [])
             
-            print("Searching with tags:", tag_list)
+            logger.debug('按标签搜索: %s', tag_list)
             
             if not tag_list:
                 return Response({
@@ -305,26 +453,32 @@ class UserTagSearchView(APIView):
                     'message': '标签参数为空'
                 })
 
+            # 匹配模式：and-同时包含所有标签（默认），or-包含任一标签
+            mode = request.GET.get('mode', 'and')
+
             # 获取所有活跃用户
             users = User.objects.filter(is_active=True)
-            
-            # 根据标签筛选
+
+            # 性别标签直接按字段过滤，其余标签走倒排索引
+            other_tags = []
             for tag in tag_list:
                 if tag == '男':
                     users = users.filter(gender=0)
                 elif tag == '女':
                     users = users.filter(gender=1)
                 else:
-                    # 对于其他标签，检查JSON字段中是否包含该标签
-                    filtered_users = []
-                    for user in users:
-                        if user.tags:  # 确保用户有标签
-                            user_tags = user.tags if isinstance(user.tags, list) else json.loads(user.tags)
-                            if tag in user_tags:
-                                filtered_users.append(user.id)
-                    users = users.filter(id__in=filtered_users)
-
-            print(f"Found {users.count()} users")
+                    other_tags.append(tag)
+            users = filter_by_tags(users, other_tags, mode).order_by('-id')
+
+            # 分页（不传pageSize时返回全部结果）
+            if 'pageSize' in request.GET:
+                page_size = int(request.GET.get('pageSize'))
+                page_num = int(request.GET.get('pageNum', 1))
+                offset = (page_num - 1) * page_size
+                users = users[offset:offset + page_size]
+            users = list(users)
+
+            logger.debug('标签搜索找到 %d 个用户', len(users))
             
             # 序列化结果
             user_list = []
@@ -334,8 +488,11 @@ class UserTagSearchView(APIView):
                 if user_data.get('tags'):
                     if isinstance(user_data['tags'], str):
                         user_data['tags'] = json.loads(user_data['tags'])
-                print(f"Adding user to results: {user.username}, gender: {user.gender}, tags: {user_data['tags']}")
                 user_list.append(user_data)
+            # 逐行输出只在开启 DEBUG 级别时执行
+            if logger.isEnabledFor(logging.DEBUG):
+                for user in users:
+                    logger.debug('标签搜索结果: %s, gender: %s, tags: %s', user.username, user.gender, user.tags)
 
             return Response({
                 'code': 0,
@@ -344,9 +501,7 @@ class UserTagSearchView(APIView):
             })
             
         except Exception as e:
-            print(f"Search error: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
+            logger.exception('标签搜索失败')
             return Response({
                 'code': 40000,
                 'date': [],